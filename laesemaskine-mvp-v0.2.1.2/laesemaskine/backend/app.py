@@ -3,17 +3,41 @@ Version: 0.2.1.2.2
 """
 
 from __future__ import annotations
+import cProfile
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
 import json
+import logging
+import math
+import multiprocessing
 import os
+import pstats
+import random
+import shutil
 import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import uuid
 import re
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Iterator, Optional, Tuple
 
-from flask import Flask, jsonify, request, session, send_from_directory
+from flask import Flask, Response, g, has_request_context, jsonify, request, session, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
 
+try:  # optional, faster JSON encoding (pip install orjson)
+    import orjson
+except ImportError:
+    orjson = None
+
 BASE_DIR = Path(__file__).resolve().parent
 DB_DIR = BASE_DIR / "db"
 DB_PATH = DB_DIR / "laesemaskine.db"
@@ -22,24 +46,514 @@ SCHEMA_PATH = DB_DIR / "schema.sql"
 UPLOAD_DIR = (BASE_DIR / "uploads").resolve()
 WORDS_JSON_PATH = (BASE_DIR.parent / "data" / "words.json").resolve()
 
+# Audio retention (see PRIVACY.md): recordings are kept for a short period only.
+AUDIO_EXTS = (".webm", ".wav", ".ogg", ".mp3", ".m4a")
+AUDIO_RETENTION_DAYS = int(os.environ.get("LM_AUDIO_RETENTION_DAYS", "90"))
+AUDIO_MAX_BYTES = int(os.environ.get("LM_AUDIO_MAX_BYTES", "0"))  # 0 = no size cap
+AUDIO_SWEEP_INTERVAL_S = int(os.environ.get("LM_AUDIO_SWEEP_INTERVAL_S", "600"))  # 0 = disabled
+AUDIO_SWEEP_BATCH = int(os.environ.get("LM_AUDIO_SWEEP_BATCH", "50"))
+AUDIO_ORPHAN_GRACE_S = 3600  # files without a blob row (rolled-back uploads) are removed after this
+
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# --- Request instrumentation ---
+# Per request: SQL statement count and time (see TimedConnection) and time in
+# functions marked @timed. Emitted as a Server-Timing header and aggregated in
+# /laesemaskine/api/metrics (per process). Outside a request nothing is recorded.
+METRICS_ENABLED = os.environ.get("LM_METRICS", "1") != "0"
+_REQ = threading.local()
+
+def _req_stats() -> Optional[Dict[str, Any]]:
+    return getattr(_REQ, "stats", None)
+
+def timed(name: str):
+    """Add the wrapped function's run time to the current request's section `name`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            stats = getattr(_REQ, "stats", None)
+            if stats is None:
+                return fn(*args, **kwargs)
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                sections = stats["sections"]
+                sections[name] = sections.get(name, 0.0) + (time.perf_counter() - t0)
+        return wrapper
+    return deco
+
+# --- Query tracing ---
+# Statements slower than LM_SLOW_QUERY_MS are logged (logger "laesemaskine.sql")
+# with the shape of their parameters (types only, never values) and their
+# EXPLAIN QUERY PLAN. Queries wrapped in hot_query() are checked in test mode
+# (LM_QUERY_PLAN_CHECK=1): a full table scan or an automatic index raises
+# QueryPlanError the first time the statement runs.
+SLOW_QUERY_S = float(os.environ.get("LM_SLOW_QUERY_MS", "250")) / 1000.0  # 0 = off
+QUERY_PLAN_CHECK = os.environ.get("LM_QUERY_PLAN_CHECK", "0") == "1"
+HOT_QUERIES: Dict[str, Tuple[str, Tuple[str, ...]]] = {}  # sql -> (name, tables allowed to scan)
+_PLAN_CACHE: Dict[str, list] = {}
+_PLANS_CHECKED: set = set()
+sql_log = logging.getLogger("laesemaskine.sql")
+
+class QueryPlanError(AssertionError):
+    pass
+
+def hot_query(name: str, sql: str, allow_scan: Tuple[str, ...] = ()) -> str:
+    """Register `sql` as a hot-path query (returned unchanged).
+
+    allow_scan: table names/aliases as shown in the plan that may be scanned
+    (e.g. listing every student).
+    """
+    if sql not in HOT_QUERIES:
+        HOT_QUERIES[sql] = (name, tuple(allow_scan))
+    return sql
+
+def _param_shape(params: Any) -> str:
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+
+def explain_plan(conn: sqlite3.Connection, sql: str, params: Any = ()) -> list:
+    """EXPLAIN QUERY PLAN detail lines (empty for statements that have no plan)."""
+    try:
+        return [r[3] for r in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error:
+        return []
+
+def full_scans(plan: list, allow: Tuple[str, ...] = ()) -> list:
+    out = []
+    for line in plan:
+        if "AUTOMATIC" in line:
+            out.append(line)  # index built per query = scan of the whole table
+        elif line.startswith("SCAN ") and " USING " not in line:
+            # "SCAN u" / "SCAN lm_users" (SQLite >= 3.36) or "SCAN TABLE lm_users AS u" (older)
+            words = line.split()[1:]
+            if words and words[0] == "TABLE":
+                words = words[1:]
+            if not words or words[0] in ("CONSTANT", "SUBQUERY") or words[0].startswith("("):
+                continue
+            names = {words[0]}
+            if len(words) > 2 and words[1] == "AS":
+                names.add(words[2])
+            if not names & set(allow):
+                out.append(line)
+    return out
+
+def _first_params(args: tuple, many: bool) -> Any:
+    if len(args) < 2:
+        return ()
+    if not many:
+        return args[1]
+    rows = args[1]
+    return rows[0] if isinstance(rows, (list, tuple)) and rows else None
+
+def check_query_plan(conn: sqlite3.Connection, sql: str, params: Any) -> None:
+    name, allow = HOT_QUERIES[sql]
+    _PLANS_CHECKED.add(sql)
+    plan = explain_plan(conn, sql, params)
+    bad = full_scans(plan, allow)
+    if bad:
+        raise QueryPlanError(f"hot query {name!r} scans a whole table: {'; '.join(bad)}\n  " + "\n  ".join(plan))
+
+def log_slow_query(conn: sqlite3.Connection, args: tuple, many: bool, seconds: float) -> None:
+    sql = args[0]
+    params = _first_params(args, many)
+    if many:
+        rows = args[1] if len(args) > 1 else ()
+        shape = (f"{len(rows)} x " if isinstance(rows, (list, tuple)) else "iterator of ") + \
+            (_param_shape(params) if params is not None else "()")
+    else:
+        shape = _param_shape(params)
+    plan = _PLAN_CACHE.get(sql)
+    if plan is None and params is not None:
+        plan = explain_plan(conn, sql, params)
+        if len(_PLAN_CACHE) < 500:
+            _PLAN_CACHE[sql] = plan
+    stats = _req_stats()
+    sql_log.warning(
+        "slow query %.1f ms%s%s\n  %s\n  params %s\n  plan:\n    %s",
+        seconds * 1000,
+        f" in {stats['route']}" if stats and stats.get("route") else "",
+        f" [{HOT_QUERIES[sql][0]}]" if sql in HOT_QUERIES else "",
+        " ".join(sql.split()), shape, "\n    ".join(plan or ["(none)"]),
+    )
+
+class TimedConnection(sqlite3.Connection):
+    """Counts and times statements per request, logs slow ones and checks hot
+    query plans. Time covers executing up to the first row; rows fetched later
+    while iterating the cursor are not included."""
+
+    def execute(self, *args):
+        return self._traced(super().execute, args, False)
+
+    def executemany(self, *args):
+        return self._traced(super().executemany, args, True)
+
+    def _traced(self, fn, args: tuple, many: bool):
+        if QUERY_PLAN_CHECK and args[0] in HOT_QUERIES and args[0] not in _PLANS_CHECKED:
+            check_query_plan(self, args[0], _first_params(args, many))
+        stats = getattr(_REQ, "stats", None)
+        if stats is None and SLOW_QUERY_S <= 0:
+            return fn(*args)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            dt = time.perf_counter() - t0
+            if stats is not None:
+                stats["sql_n"] += 1
+                stats["sql_s"] += dt
+            if 0 < SLOW_QUERY_S <= dt:
+                log_slow_query(self, args, many, dt)
+
+# --- Tenant shards (multi-tenant mode, LM_SHARD_DIR) ---
+# Every tenant (school) gets its own SQLite file, <LM_SHARD_DIR>/<shard>/
+# laesemaskine.db with an uploads/ directory next to it, so writers in
+# different schools never wait for the same lock. catalog.db maps tenants to
+# shards and usernames/groups to tenants (db/catalog.sql). Ids in a shard
+# start at tenant id * SHARD_ID_SPAN, which keeps them unique across shards:
+# the tenant of a logged-in user is user_id // SHARD_ID_SPAN, and in-process
+# caches keyed by user/group id stay valid. Without LM_SHARD_DIR everything
+# lives in DB_PATH as before. Tenants are created with `shards.py add`;
+# LM_OPEN_SIGNUP=1 also lets anyone register a school or join one by name.
+SHARD_DIR = Path(os.environ["LM_SHARD_DIR"]).resolve() if os.environ.get("LM_SHARD_DIR") else None
+OPEN_SIGNUP = os.environ.get("LM_OPEN_SIGNUP", "0") == "1"
+CATALOG_SCHEMA_PATH = DB_DIR / "catalog.sql"
+SHARD_ID_SPAN = 10 ** 10
+TENANTS: Dict[int, Dict[str, Any]] = {}  # tenant id -> catalog row
+TENANTS_LOCK = threading.Lock()
+_ROUTE = threading.local()  # per-thread shard override (CLI workers, sweeper)
+
+def catalog_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(SHARD_DIR / "catalog.db", factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    return conn
+
+def shard_db_path(shard: str) -> Path:
+    return SHARD_DIR / shard / "laesemaskine.db"
+
+def tenant_by_id(tid: int) -> Optional[Dict[str, Any]]:
+    with TENANTS_LOCK:
+        t = TENANTS.get(tid)
+    if t is None:
+        conn = catalog_db()
+        try:
+            row = conn.execute("SELECT id, name, shard FROM lm_tenants WHERE id=?", (tid,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        t = dict(row)
+        with TENANTS_LOCK:
+            TENANTS[tid] = t
+    return t
+
+def tenant_by_name(name: str) -> Optional[Dict[str, Any]]:
+    conn = catalog_db()
+    try:
+        row = conn.execute("SELECT id FROM lm_tenants WHERE name=?", (name,)).fetchone()
+    finally:
+        conn.close()
+    return tenant_by_id(int(row["id"])) if row else None
+
+def tenant_by_username(username: str) -> Optional[Dict[str, Any]]:
+    conn = catalog_db()
+    try:
+        row = conn.execute("SELECT tenant_id FROM lm_catalog_users WHERE username=?", (username,)).fetchone()
+    finally:
+        conn.close()
+    return tenant_by_id(int(row["tenant_id"])) if row else None
+
+def all_tenants() -> list:
+    conn = catalog_db()
+    try:
+        return [dict(r) for r in conn.execute("SELECT id, name, shard FROM lm_tenants ORDER BY id")]
+    finally:
+        conn.close()
+
+class use_shard:
+    """Route get_db() in this thread to `path` (None: back to normal routing)."""
+
+    def __init__(self, path: Optional[Path]):
+        self.path = path
+
+    def __enter__(self):
+        self.prev = getattr(_ROUTE, "path", None)
+        _ROUTE.path = self.path
+        return self
+
+    def __exit__(self, *exc):
+        _ROUTE.path = self.prev
+
+def db_path() -> Optional[Path]:
+    """The database this thread/request works on; None = no tenant (not logged in)."""
+    override = getattr(_ROUTE, "path", None)
+    if override is not None:
+        return override
+    if SHARD_DIR is None or not has_request_context():
+        return DB_PATH
+    t = g.get("lm_tenant")  # set by login/register before the user is known
+    if t is None:
+        uid = session.get("user_id")
+        t = tenant_by_id(int(uid) // SHARD_ID_SPAN) if uid else None
+    return shard_db_path(t["shard"]) if t is not None else None
+
+def upload_dir() -> Path:
+    """Audio files of the current database (shards keep theirs next to the DB file)."""
+    if SHARD_DIR is None:
+        return UPLOAD_DIR
+    path = db_path()
+    return path.parent / "uploads" if path is not None else UPLOAD_DIR
+
 def get_db() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
+    path = db_path()
+    # no tenant yet: an empty in-memory DB; require_login answers 401 before any query
+    conn = sqlite3.connect(path if path is not None else ":memory:", factory=TimedConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
     return conn
 
-def init_db() -> None:
-    DB_DIR.mkdir(parents=True, exist_ok=True)
-    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
-    conn = get_db()
+def init_db(path: Optional[Path] = None, id_base: int = 0) -> None:
+    """Create/migrate the schema in `path` (default: the routed DB, normally DB_PATH).
+
+    id_base > 0 (new tenant shards) starts every AUTOINCREMENT id at id_base + 1.
+    """
+    with use_shard(path or getattr(_ROUTE, "path", None)):
+        target = db_path() or DB_PATH
+        target.parent.mkdir(parents=True, exist_ok=True)
+        upload_dir().mkdir(parents=True, exist_ok=True)
+        conn = get_db()
+        try:
+            if ANALYTICS_SNAPSHOT_S > 0:
+                conn.execute("PRAGMA journal_mode=WAL")  # see analytics_db()
+            with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+                conn.executescript(f.read())
+            migrate_db(conn)
+            if id_base > 0:
+                # after migrate_db, so tables it creates get this shard's range in the same run.
+                # schema.sql seeds a demo group in a fresh file: move it into the range too
+                conn.execute("UPDATE lm_groups SET id = id + ? WHERE id < ?", (id_base, id_base))
+                conn.execute("UPDATE sqlite_sequence SET seq = seq + ? WHERE seq < ?", (id_base, id_base))
+                conn.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT m.name, ? FROM sqlite_master m "
+                    "WHERE m.type='table' AND m.sql LIKE '%AUTOINCREMENT%' "
+                    "AND m.name NOT IN (SELECT name FROM sqlite_sequence)",
+                    (id_base,),
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+def init_shards(workers: Optional[int] = None) -> int:
+    """Create the catalog and migrate every tenant shard in parallel; returns the shard count."""
+    SHARD_DIR.mkdir(parents=True, exist_ok=True)
+    conn = catalog_db()
     try:
-        with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
+        with open(CATALOG_SCHEMA_PATH, "r", encoding="utf-8") as f:
             conn.executescript(f.read())
-        migrate_db(conn)
         conn.commit()
     finally:
         conn.close()
+    tenants = all_tenants()
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(tenants) or 1)) as pool:
+        for f in [pool.submit(init_db, shard_db_path(t["shard"]), t["id"] * SHARD_ID_SPAN) for t in tenants]:
+            f.result()
+    return len(tenants)
+
+def shard_name(tid: int, name: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:40] or "tenant"
+    return f"t{tid:04d}-{slug}"
+
+def create_tenant(name: str) -> Dict[str, Any]:
+    """Register a tenant in the catalog and create its shard.
 
+    Raises sqlite3.IntegrityError if the name is taken; if creating the shard
+    fails, the catalog row and shard directory are removed again.
+    """
+    conn = catalog_db()
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # serialise id allocation
+        tid = int(conn.execute("SELECT COALESCE(MAX(id), 0) + 1 AS n FROM lm_tenants").fetchone()["n"])
+        shard = shard_name(tid, name)
+        conn.execute("INSERT INTO lm_tenants (id, name, shard) VALUES (?,?,?)", (tid, name, shard))
+        conn.commit()
+    finally:
+        conn.close()
+    try:
+        init_db(shard_db_path(shard), tid * SHARD_ID_SPAN)
+        with use_shard(shard_db_path(shard)):
+            conn = get_db()
+            try:
+                catalog_add(group_ids=[int(r["id"]) for r in conn.execute("SELECT id FROM lm_groups")])
+            finally:
+                conn.close()
+    except BaseException:
+        drop_tenant(tid)
+        raise
+    return tenant_by_id(tid)
+
+def drop_tenant(tid: int) -> None:
+    """Undo create_tenant: remove the tenant's catalog rows and its shard directory.
+
+    Only for a tenant that was never used (registration failed half-way).
+    """
+    conn = catalog_db()
+    try:
+        row = conn.execute("SELECT shard FROM lm_tenants WHERE id=?", (tid,)).fetchone()
+        conn.execute("DELETE FROM lm_catalog_users WHERE tenant_id=?", (tid,))
+        conn.execute("DELETE FROM lm_catalog_groups WHERE tenant_id=?", (tid,))
+        conn.execute("DELETE FROM lm_tenants WHERE id=?", (tid,))
+        conn.commit()
+    finally:
+        conn.close()
+    with TENANTS_LOCK:
+        TENANTS.pop(tid, None)
+    if row is not None:
+        shutil.rmtree(SHARD_DIR / row["shard"], ignore_errors=True)
+
+def catalog_add(users: list = (), group_ids: list = ()) -> None:
+    """Record new (user_id, username) pairs and group ids; the tenant follows from the id.
+
+    Raises sqlite3.IntegrityError if a username exists in another tenant; call
+    it before committing the shard so the caller can roll back.
+    """
+    if SHARD_DIR is None or not (users or group_ids):
+        return
+    conn = catalog_db()
+    try:
+        conn.executemany(
+            "INSERT INTO lm_catalog_users (user_id, username, tenant_id) VALUES (?,?,?)",
+            [(uid, name, uid // SHARD_ID_SPAN) for uid, name in users],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO lm_catalog_groups (group_id, tenant_id) VALUES (?,?)",
+            [(gid, gid // SHARD_ID_SPAN) for gid in group_ids],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def catalog_taken(usernames: list) -> set:
+    """Usernames already used in any tenant."""
+    if SHARD_DIR is None or not usernames:
+        return set()
+    conn = catalog_db()
+    try:
+        taken = set()
+        for k in range(0, len(usernames), 500):
+            part = usernames[k:k + 500]
+            taken.update(r["username"] for r in conn.execute(
+                f"SELECT username FROM lm_catalog_users WHERE username IN ({','.join('?' * len(part))})", part
+            ))
+        return taken
+    finally:
+        conn.close()
+
+
+# --- Analytics snapshot (read path for admin dashboards) ---
+# Admin analytics (overview, difficulty, drilldown, group analytics) read a
+# read-only copy of the database, <db>-analytics.db next to it, made with the
+# online backup API, so heavy aggregates never hold locks students' /answer
+# writes wait for. The copy is refreshed in the background once it is older
+# than LM_ANALYTICS_SNAPSHOT_S (stale reads are served meanwhile) and only
+# when something was committed since the last one (PRAGMA data_version).
+# With snapshots on, the live DB runs in WAL mode: the backup reads it in one
+# consistent step while writers keep committing.
+ANALYTICS_SNAPSHOT_S = float(os.environ.get("LM_ANALYTICS_SNAPSHOT_S", "60"))  # 0 = read the live DB
+SNAPSHOTS: Dict[str, Dict[str, Any]] = {}  # live DB path -> state
+SNAPSHOTS_LOCK = threading.Lock()
+
+def snapshot_path(path: Path) -> Path:
+    return path.with_name(path.stem + "-analytics.db")
+
+def _snapshot_state(path: Path) -> Dict[str, Any]:
+    # caller holds SNAPSHOTS_LOCK
+    return SNAPSHOTS.setdefault(str(path), {"as_of": None, "checked": 0.0, "version": None, "watch": None,
+                                            "refreshing": False, "lock": threading.Lock()})
+
+def refresh_snapshot(path: Path) -> Dict[str, Any]:
+    """Copy `path` to its snapshot unless nothing changed since the last copy."""
+    with SNAPSHOTS_LOCK:
+        st = _snapshot_state(path)
+    with st["lock"]:  # one copy at a time per DB; late callers then find it unchanged
+        t0 = time.time()
+        if st["watch"] is None:
+            # a long-lived connection: data_version changes when another connection commits
+            st["watch"] = sqlite3.connect(path, check_same_thread=False)
+        version = st["watch"].execute("PRAGMA data_version").fetchone()[0]
+        snap = snapshot_path(path)
+        if version != st["version"] or not snap.exists():
+            # the copy is written next to the old one and swapped in, so readers never
+            # block; at most one snapshot (plus the copy in progress) exists per DB
+            tmp = snap.with_name(snap.name + ".tmp")
+            src = sqlite3.connect(path)
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)  # one step = one read transaction, consistent and non-blocking in WAL mode
+                dst.execute("PRAGMA journal_mode=DELETE")  # plain file, opened immutable below
+            finally:
+                dst.close()
+                src.close()
+            os.replace(tmp, snap)
+            st["version"], st["as_of"] = version, _utc_stamp(t0)
+        elif st["as_of"] is not None:
+            st["as_of"] = _utc_stamp(t0)  # unchanged: the copy is current as of now
+        st["checked"] = time.monotonic()
+    return st
+
+def _refresh_snapshot_bg(path: Path) -> None:
+    try:
+        refresh_snapshot(path)
+    except Exception:
+        app.logger.exception("analytics snapshot of %s failed", path)
+    finally:
+        with SNAPSHOTS_LOCK:
+            SNAPSHOTS[str(path)]["refreshing"] = False
+
+def start_snapshot_builder() -> None:
+    """Build the first analytics snapshot of every DB in a daemon thread, so no
+    admin request has to wait for a full copy; later refreshes happen on demand."""
+    if ANALYTICS_SNAPSHOT_S <= 0:
+        return
+    paths = [shard_db_path(t["shard"]) for t in all_tenants()] if SHARD_DIR is not None else [DB_PATH]
+    with SNAPSHOTS_LOCK:
+        for path in paths:
+            _snapshot_state(path)["refreshing"] = True
+
+    def build():
+        for path in paths:
+            _refresh_snapshot_bg(path)
+
+    threading.Thread(target=build, name="lm-analytics-snapshot", daemon=True).start()
+
+def analytics_db(conn: sqlite3.Connection) -> Tuple[sqlite3.Connection, str]:
+    """Swap the live connection (already used for the admin check) for the snapshot.
+
+    Returns (read-only connection, "data as of" UTC stamp); `conn` is closed
+    when replaced. With snapshots off, or while the first snapshot is still
+    being built in the background, `conn` itself is returned, as of now.
+    """
+    path = db_path()
+    if ANALYTICS_SNAPSHOT_S <= 0 or path is None:
+        return conn, _utc_stamp(time.time())
+    with SNAPSHOTS_LOCK:
+        st = _snapshot_state(path)
+        ready = st["as_of"] is not None and snapshot_path(path).exists()
+        due = (not ready or time.monotonic() - st["checked"] > ANALYTICS_SNAPSHOT_S) and not st["refreshing"]
+        if due:
+            st["refreshing"] = True
+    if due:
+        threading.Thread(target=_refresh_snapshot_bg, args=(path,), name="lm-analytics-snapshot",
+                         daemon=True).start()
+    if not ready:
+        return conn, _utc_stamp(time.time())
+    ro = sqlite3.connect(f"{snapshot_path(path).as_uri()}?immutable=1", uri=True,
+                         factory=TimedConnection, check_same_thread=False)
+    ro.row_factory = sqlite3.Row
+    conn.close()
+    return ro, st["as_of"]
 
 def _norm_word(s: Optional[str]) -> str:
     if not s:
@@ -52,6 +566,7 @@ def _norm_word(s: Optional[str]) -> str:
 ENDING_LIST = ["ende","ene","ede","er","et","en","e","r"]  # order matters (longest first)
 VOWELS = set(list("aeiouyæøå"))
 
+@timed("diagnose_v1")
 def diagnose_v1(expected: str, recognized: Optional[str]) -> Dict[str, Any]:
     exp = _norm_word(expected)
     rec = _norm_word(recognized)
@@ -161,12 +676,54 @@ def migrate_db(conn: sqlite3.Connection) -> None:
         "ALTER TABLE lm_sessions ADD COLUMN session_audio_path TEXT NULL;",
         "ALTER TABLE lm_sessions ADD COLUMN session_audio_mime TEXT NULL;",
         "ALTER TABLE lm_sessions ADD COLUMN session_audio_uploaded_at TEXT NULL;",
+        "ALTER TABLE lm_sessions ADD COLUMN adaptive_level INTEGER NULL;",
+        "ALTER TABLE lm_sessions ADD COLUMN adaptive_window TEXT NULL;",
+        # denormalised owner + word categories for indexed drilldown
+        "ALTER TABLE lm_session_words ADD COLUMN user_id INTEGER NULL;",
+        "ALTER TABLE lm_session_words ADD COLUMN niveau INTEGER NULL;",
+        "ALTER TABLE lm_session_words ADD COLUMN interessekategori TEXT NULL;",
+        "ALTER TABLE lm_session_words ADD COLUMN stavemoenster TEXT NULL;",
+        "ALTER TABLE lm_session_words ADD COLUMN ordblind_type TEXT NULL;",
     ]:
         try:
             conn.execute(stmt)
         except sqlite3.OperationalError:
             pass
 
+    for dim in ("interessekategori", "stavemoenster", "ordblind_type"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_lm_session_words_user_{dim} ON lm_session_words(user_id, {dim}, id);"
+        )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lm_session_words_user ON lm_session_words(user_id, id);")
+    if conn.execute("SELECT 1 FROM lm_session_words WHERE user_id IS NULL LIMIT 1").fetchone():
+        backfill_session_word_meta(conn)
+
+    # audio retention sweeps only look at rows that still hold audio
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lm_sessions_audio ON lm_sessions(session_audio_uploaded_at) "
+        "WHERE session_audio_path IS NOT NULL;"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_lm_disputes_audio ON lm_disputes(created_at) "
+        "WHERE audio_path IS NOT NULL;"
+    )
+    # lm_audio_blobs: register audio uploaded before content-addressed storage
+    conn.execute(
+        "INSERT OR IGNORE INTO lm_audio_blobs (audio_path, refcount) "
+        "SELECT p, COUNT(*) FROM ("
+        "  SELECT session_audio_path AS p FROM lm_sessions WHERE session_audio_path IS NOT NULL "
+        "  UNION ALL SELECT audio_path FROM lm_disputes WHERE audio_path IS NOT NULL "
+        "  UNION ALL SELECT audio_path FROM lm_ai_queue WHERE status='queued'"
+        ") GROUP BY p"
+    )
+    # lm_category_counters: one-time backfill for DBs created before the counters
+    if not conn.execute("SELECT 1 FROM lm_category_counters LIMIT 1").fetchone() and \
+            conn.execute("SELECT 1 FROM lm_sessions WHERE ended_at IS NOT NULL LIMIT 1").fetchone():
+        rebuild_category_counters(conn)
+    if not conn.execute("SELECT 1 FROM lm_progress_rollup LIMIT 1").fetchone() and \
+            conn.execute("SELECT 1 FROM lm_sessions WHERE ended_at IS NOT NULL LIMIT 1").fetchone():
+        rebuild_progress_rollups(conn)
+
 
 def load_words() -> Dict[str, Any]:
     with open(WORDS_JSON_PATH, "r", encoding="utf-8") as f:
@@ -180,6 +737,7 @@ def words_cache() -> Dict[str, Any]:
         WORDS_CACHE = load_words()
     return WORDS_CACHE
 
+@timed("word_meta_by_id")
 def word_meta_by_id(word_id: int) -> Optional[Dict[str, Any]]:
     payload = words_cache()
     words = payload.get("words", [])
@@ -193,20 +751,1255 @@ def word_meta_by_id(word_id: int) -> Optional[Dict[str, Any]]:
     return None
 
 
-def current_user(conn: sqlite3.Connection) -> Optional[sqlite3.Row]:
+SLIM_WORD_FIELDS = ("id", "ord", "niveau", "fase", "stavemoenster", "ordblind_risiko", "interessekategori")
+WORDS_BY_LEVEL: Optional[Dict[int, list]] = None
+
+def slim_word(w: Dict[str, Any]) -> Dict[str, Any]:
+    # trim raw to keep payload small
+    return {k: w.get(k) for k in SLIM_WORD_FIELDS}
+
+def words_by_level() -> Dict[int, list]:
+    """Slim words grouped by niveau (built once from words.json)."""
+    global WORDS_BY_LEVEL
+    if WORDS_BY_LEVEL is None:
+        idx: Dict[int, list] = {}
+        for w in words_cache().get("words", []):
+            if w.get("niveau") is not None:
+                idx.setdefault(int(w["niveau"]), []).append(slim_word(w))
+        WORDS_BY_LEVEL = idx
+    return WORDS_BY_LEVEL
+
+@timed("pick_words")
+def pick_words(level: int, count: int, band: int = 0, exclude: Optional[set] = None,
+               calibrated: Optional[Tuple[list, list]] = None) -> list:
+    """Random words at `level` (+/- band), read from the level index.
+
+    With `calibrated` (see calibrated_index) words are picked by calibrated
+    difficulty instead of the hand-assigned niveau.
+    """
+    if count <= 0:
+        return []
+    exclude = exclude or set()
+    if calibrated is not None:
+        return _pick_calibrated(calibrated, level, count, band, exclude)
+    idx = words_by_level()
+    levels = [level] if band <= 0 else range(level - band, level + band + 1)
+    pool = [w for lvl in levels for w in idx.get(lvl, ()) if w["id"] not in exclude]
+    if len(pool) < count:
+        # fallback: any words with level
+        pool = [w for ws in idx.values() for w in ws if w["id"] not in exclude]
+    if len(pool) > count:
+        return random.sample(pool, count)
+    random.shuffle(pool)
+    return pool
+
+def _pick_calibrated(index: Tuple[list, list], level: int, count: int, band: int, exclude: set) -> list:
+    keys, words = index
+    lo = bisect_left(keys, level - max(0, band) - 0.5)
+    hi = bisect_right(keys, level + max(0, band) + 0.5)
+    pool = [w for w in words[lo:hi] if w["id"] not in exclude]
+    # too few words in the band: widen around it instead of falling back to everything
+    while len(pool) < count and (lo > 0 or hi < len(words)):
+        lo, hi = max(0, lo - count), min(len(words), hi + count)
+        pool = [w for w in words[lo:hi] if w["id"] not in exclude]
+    if len(pool) > count:
+        return random.sample(pool, count)
+    random.shuffle(pool)
+    return pool
+
+
+# --- Lexicon shards (client-side word selection) ---
+# One immutable JSON file per niveau with the slim fields /words returns,
+# addressed by a hash of its content. The manifest lists the shards for the
+# current words.json version; /me carries its digest so a browser with a warm
+# cache (frontend/js/lexicon.js) needs no lexicon request at all.
+LEXICON: Optional[Dict[str, Any]] = None
+
+def lexicon() -> Dict[str, Any]:
+    """{"manifest": ..., "shards": {level: (hash, bytes)}}, built once from words.json."""
+    global LEXICON
+    if LEXICON is None:
+        version = str(words_cache().get("version") or "")
+        shards: Dict[int, Tuple[str, bytes]] = {}
+        for lvl, words in sorted(words_by_level().items()):
+            body = json.dumps({"version": version, "level": lvl, "words": sorted(words, key=lambda w: w["id"])},
+                              ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            shards[lvl] = (hashlib.sha256(body).hexdigest()[:16], body)
+        digest = hashlib.sha256(
+            ("%s|" % version + ",".join(f"{lvl}:{h}" for lvl, (h, _) in shards.items())).encode("utf-8")
+        ).hexdigest()[:16]
+        manifest = {
+            "version": version,
+            "digest": digest,
+            "fields": list(SLIM_WORD_FIELDS),
+            "levels": {
+                str(lvl): {"hash": h, "count": len(words_by_level()[lvl]),
+                           "url": f"/laesemaskine/api/lexicon/{lvl}.{h}.json"}
+                for lvl, (h, _) in shards.items()
+            },
+        }
+        LEXICON = {"manifest": manifest, "shards": shards}
+    return LEXICON
+
+
+# --- Lexicon search (admin) ---
+# words.json copied into its own SQLite file (db/lexicon.db, shared by all
+# tenants) with an FTS5 trigram index on `ord`. The file is rebuilt, into a
+# temporary file that then replaces it, when the indexed fields of words.json
+# change. Substrings of 3+ characters use the trigram index, prefixes a B-tree
+# on the lower-cased word, and the filters plain indexes; ordblind_type lists
+# ("Konsonantklynge, Endelse") are split so each type can be filtered on.
+LEXICON_SEARCH_FIELDS = ("id", "ord", "niveau", "fase", "stavemoenster", "ordblind_type",
+                         "ordblind_risiko", "interessekategori")
+LEXICON_SEARCH: Dict[str, Any] = {"key": None, "path": None}
+LEXICON_SEARCH_LOCK = threading.Lock()
+
+def lexicon_search_path() -> Path:
+    return DB_DIR / "lexicon.db"
+
+def lexicon_search_key() -> str:
+    """words.json version + hash of the indexed fields (computed once per process)."""
+    if LEXICON_SEARCH["key"] is None:
+        payload = words_cache()
+        rows = [[w.get(k) for k in LEXICON_SEARCH_FIELDS] for w in payload.get("words", [])]
+        body = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        LEXICON_SEARCH["key"] = "%s:%s" % (payload.get("version") or "", hashlib.sha256(body).hexdigest()[:16])
+    return LEXICON_SEARCH["key"]
+
+def _ordblind_types(value: Optional[str]) -> list:
+    return sorted({t.strip() for t in (value or "").split(",") if t.strip() and t.strip() != "-"})
+
+def build_lexicon_search(path: Path) -> int:
+    """Write the search index for the current words.json to `path`; returns the word count."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    words = [w for w in words_cache().get("words", []) if w.get("id") is not None and w.get("ord")]
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(
+            "CREATE TABLE lm_lexicon_meta (id INTEGER PRIMARY KEY CHECK (id=1), key TEXT NOT NULL, "
+            "  words INTEGER NOT NULL, built_at TEXT NOT NULL DEFAULT (datetime('now')));"
+            "CREATE TABLE lm_lexicon_words (id INTEGER PRIMARY KEY, ord TEXT NOT NULL, ord_lc TEXT NOT NULL, "
+            "  niveau INTEGER, fase INTEGER, stavemoenster TEXT, ordblind_type TEXT, ordblind_risiko INTEGER, "
+            "  interessekategori TEXT);"
+            "CREATE TABLE lm_lexicon_types (type TEXT NOT NULL, word_id INTEGER NOT NULL, "
+            "  PRIMARY KEY (type, word_id)) WITHOUT ROWID;"
+            "CREATE VIRTUAL TABLE lm_lexicon_fts USING fts5(ord, content='lm_lexicon_words', content_rowid='id', "
+            "  tokenize='trigram');"
+        )
+        conn.executemany(
+            "INSERT INTO lm_lexicon_words (id, ord, ord_lc, niveau, fase, stavemoenster, ordblind_type, "
+            "ordblind_risiko, interessekategori) VALUES (?,?,?,?,?,?,?,?,?)",
+            [(int(w["id"]), w["ord"], w["ord"].lower(), w.get("niveau"), w.get("fase"), w.get("stavemoenster"),
+              w.get("ordblind_type"), w.get("ordblind_risiko"), w.get("interessekategori")) for w in words],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO lm_lexicon_types (type, word_id) VALUES (?,?)",
+            [(t, int(w["id"])) for w in words for t in _ordblind_types(w.get("ordblind_type"))],
+        )
+        conn.execute("INSERT INTO lm_lexicon_fts (lm_lexicon_fts) VALUES ('rebuild')")
+        conn.executescript(
+            "CREATE INDEX idx_lm_lexicon_words_ord ON lm_lexicon_words(ord_lc);"
+            "CREATE INDEX idx_lm_lexicon_words_niveau ON lm_lexicon_words(niveau);"
+            "CREATE INDEX idx_lm_lexicon_words_moenster ON lm_lexicon_words(stavemoenster, niveau);"
+            "CREATE INDEX idx_lm_lexicon_words_kategori ON lm_lexicon_words(interessekategori, niveau);"
+        )
+        conn.execute("INSERT INTO lm_lexicon_meta (id, key, words) VALUES (1,?,?)", (lexicon_search_key(), len(words)))
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return len(words)
+
+def lexicon_search_db() -> sqlite3.Connection:
+    """Read-only connection to the search index, (re)built first if words.json changed."""
+    path = lexicon_search_path()
+    with LEXICON_SEARCH_LOCK:
+        if LEXICON_SEARCH["path"] != str(path):
+            current = None
+            if path.exists():
+                try:
+                    c = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+                    try:
+                        current = c.execute("SELECT key FROM lm_lexicon_meta WHERE id=1").fetchone()
+                    finally:
+                        c.close()
+                except sqlite3.Error:
+                    current = None  # half-written or old layout: rebuild
+            if current is None or current[0] != lexicon_search_key():
+                n = build_lexicon_search(path)
+                app.logger.info("lexicon search index built: %s words (%s)", n, lexicon_search_key())
+            LEXICON_SEARCH["path"] = str(path)
+    conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, factory=TimedConnection, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+@timed("lexicon_search")
+def search_lexicon(conn: sqlite3.Connection, q: str, match: str, filters: Dict[str, Any],
+                   after: Optional[int], limit: int) -> list:
+    """Words matching `q` (prefix or substring of ord) and the filters, in words.json order."""
+    where, params = [], []
+    q = q.lower()
+    name = "lexicon_browse"
+    if q and match == "prefix":
+        where.append("w.ord_lc >= ? AND w.ord_lc < ?")
+        params += [q, q + "\U0010ffff"]
+        name = "lexicon_prefix"
+    elif q and len(q) >= 3:
+        # trigram index; the quoted phrase keeps FTS5 syntax in q literal
+        where.append("w.id IN (SELECT f.rowid FROM lm_lexicon_fts f WHERE f.ord MATCH ?)")
+        params.append('"%s"' % q.replace('"', '""'))
+        name = "lexicon_substring"
+    elif q:
+        # 1-2 characters are below the trigram size: plain LIKE over the (small) word table
+        where.append("w.ord_lc LIKE ? ESCAPE '\\'")
+        params.append("%" + _like_escape(q) + "%")
+        name = None
+    for col in ("niveau", "stavemoenster", "interessekategori"):
+        if filters.get(col) is not None:
+            where.append(f"w.{col} = ?")
+            params.append(filters[col])
+    if filters.get("ordblind_type"):
+        where.append("w.id IN (SELECT t.word_id FROM lm_lexicon_types t WHERE t.type = ?)")
+        params.append(filters["ordblind_type"])
+    if after is not None:
+        where.append("w.id > ?")
+        params.append(after)
+    sql = (
+        "SELECT w.id, w.ord, w.niveau, w.fase, w.stavemoenster, w.ordblind_type, w.ordblind_risiko, "
+        "w.interessekategori FROM lm_lexicon_words w"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + " ORDER BY w.id LIMIT ?"
+    )
+    params.append(limit)
+    if name is not None:
+        # paging through every word (no q, no filter) walks the primary key, which the plan shows as a scan
+        sql = hot_query(name, sql, allow_scan=("w", "f") if name == "lexicon_browse" else ("f",))
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+# --- Word difficulty calibration ---
+# Elo-style estimate per word from every answer in lm_session_words, on the
+# niveau scale: a word starts at its niveau, a student starts at the niveau of
+# the first word they read, and P(correct) = 1 / (1 + exp((difficulty - ability) / SCALE)).
+# calibrate_words() processes answers after lm_calibration_state.last_answer_id
+# (run calibrate_words.py); a new words.json version starts over.
+CALIBRATION_SCALE = 2.0  # niveau steps per logit
+CALIBRATION_MIN_ATTEMPTS = int(os.environ.get("LM_CALIBRATION_MIN_ATTEMPTS", "5"))
+CALIBRATION_MAX_MS = 60000  # longer response times are treated as pauses, not reading
+CALIBRATED_INDEX: Dict[str, Tuple[Tuple[Any, ...], Tuple[list, list]]] = {}  # db path -> (state, index)
+CALIBRATED_INDEX_MAX = 256
+CALIBRATED_INDEX_LOCK = threading.Lock()
+
+def _elo_k(attempts: int) -> float:
+    # large steps while a rating has little evidence, smaller as it settles
+    return 4.0 / (1.0 + attempts / 20.0)
+
+def calibrate_words(conn: sqlite3.Connection, full: bool = False, chunk: int = 5000) -> Dict[str, int]:
+    """Fold new answers into lm_word_calibration; one transaction per chunk."""
+    version = str(words_cache().get("version") or "")
+    state = conn.execute("SELECT words_version, last_answer_id FROM lm_calibration_state WHERE id=1").fetchone()
+    if full or state is None or state["words_version"] != version:
+        conn.execute("DELETE FROM lm_word_calibration")
+        conn.execute("DELETE FROM lm_calibration_abilities")
+        last_id = 0
+    else:
+        last_id = int(state["last_answer_id"])
+
+    # word_id -> [difficulty, attempts, correct, timed, log_ms_sum]
+    words = {
+        int(r["word_id"]): [r["difficulty"], r["attempts"], r["correct"], r["timed"], r["log_ms_sum"]]
+        for r in conn.execute("SELECT word_id, difficulty, attempts, correct, timed, log_ms_sum FROM lm_word_calibration")
+    }
+    abilities = {
+        int(r["user_id"]): [r["ability"], r["attempts"]]
+        for r in conn.execute("SELECT user_id, ability, attempts FROM lm_calibration_abilities")
+    }
+    stats = {"answers": 0, "words": 0, "students": 0}
+    while True:
+        rows = conn.execute(
+            "SELECT id, user_id, word_id, correct, response_time_ms, niveau FROM lm_session_words "
+            "WHERE id > ? AND user_id IS NOT NULL ORDER BY id LIMIT ?",
+            (last_id, chunk),
+        ).fetchall()
+        if not rows:
+            break
+        dirty_words, dirty_users = set(), set()
+        for r in rows:
+            wid, uid, y = int(r["word_id"]), int(r["user_id"]), int(r["correct"])
+            w = words.get(wid)
+            if w is None:
+                niveau = r["niveau"]
+                if niveau is None:
+                    meta = word_meta_by_id(wid) or {}
+                    niveau = meta.get("niveau") or LEVEL_MIN
+                w = words[wid] = [float(niveau), 0, 0, 0, 0.0]
+            a = abilities.get(uid)
+            if a is None:
+                a = abilities[uid] = [w[0], 0]
+            p = 1.0 / (1.0 + math.exp((w[0] - a[0]) / CALIBRATION_SCALE))
+            w[0] += _elo_k(w[1]) * (p - y)
+            a[0] += _elo_k(a[1]) * (y - p)
+            w[1] += 1
+            w[2] += y
+            a[1] += 1
+            ms = r["response_time_ms"]
+            if ms is not None and 0 < ms <= CALIBRATION_MAX_MS:
+                w[3] += 1
+                w[4] += math.log(ms)
+            dirty_words.add(wid)
+            dirty_users.add(uid)
+        last_id = int(rows[-1]["id"])
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO lm_word_calibration "
+                "(word_id, difficulty, attempts, correct, timed, log_ms_sum, typical_ms, updated_at) "
+                "VALUES (?,?,?,?,?,?,?,datetime('now'))",
+                [(wid, *words[wid], int(round(math.exp(words[wid][4] / words[wid][3]))) if words[wid][3] else None)
+                 for wid in dirty_words],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO lm_calibration_abilities (user_id, ability, attempts) VALUES (?,?,?)",
+                [(uid, *abilities[uid]) for uid in dirty_users],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO lm_calibration_state (id, words_version, last_answer_id, updated_at) "
+                "VALUES (1,?,?,datetime('now'))",
+                (version, last_id),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        stats["answers"] += len(rows)
+        stats["words"] += len(dirty_words)
+        stats["students"] += len(dirty_users)
+    if state is None or state["words_version"] != version or full:
+        # record the version even when there was nothing to process
+        conn.execute(
+            "INSERT OR REPLACE INTO lm_calibration_state (id, words_version, last_answer_id, updated_at) "
+            "VALUES (1,?,?,datetime('now'))",
+            (version, last_id),
+        )
+        conn.commit()
+    return stats
+
+def calibrated_index(conn: sqlite3.Connection) -> Tuple[list, list]:
+    """(sorted difficulties, slim words in the same order); rebuilt when calibration changes.
+
+    Words with fewer than CALIBRATION_MIN_ATTEMPTS answers keep their niveau.
+    """
+    st = conn.execute("SELECT words_version, last_answer_id FROM lm_calibration_state WHERE id=1").fetchone()
+    path = str(db_path())  # one calibration per shard
+    key = tuple(st) if st else ()
+    with CALIBRATED_INDEX_LOCK:
+        hit = CALIBRATED_INDEX.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    cal = {}
+    if st is not None and st["words_version"] == str(words_cache().get("version") or ""):
+        cal = {
+            int(r["word_id"]): (r["difficulty"], r["typical_ms"])
+            for r in conn.execute(
+                "SELECT word_id, difficulty, typical_ms FROM lm_word_calibration WHERE attempts >= ?",
+                (CALIBRATION_MIN_ATTEMPTS,),
+            )
+        }
+    entries = []
+    for ws in words_by_level().values():
+        for w in ws:
+            difficulty, typical_ms = cal.get(w["id"], (float(w["niveau"]), None))
+            entries.append((difficulty, {**w, "difficulty": round(difficulty, 2), "typical_ms": typical_ms}))
+    entries.sort(key=lambda e: (e[0], e[1]["id"]))
+    index = ([e[0] for e in entries], [e[1] for e in entries])
+    with CALIBRATED_INDEX_LOCK:
+        if path not in CALIBRATED_INDEX and len(CALIBRATED_INDEX) >= CALIBRATED_INDEX_MAX:
+            CALIBRATED_INDEX.pop(next(iter(CALIBRATED_INDEX)))
+        CALIBRATED_INDEX[path] = (key, index)
+    return index
+
+
+# --- Adaptive level (server side, per session) ---
+# Rolling window of the last 5 answers: 4/5 correct -> level up,
+# 3 wrong -> level down, clamp 1..30 (same rules as frontend/js/adaptive.js).
+ADAPTIVE_WINDOW = 5
+LEVEL_MIN, LEVEL_MAX = 1, 30
+
+def clamp_level(level: int) -> int:
+    return max(LEVEL_MIN, min(LEVEL_MAX, int(level)))
+
+def adaptive_step(level: int, window: str, correct: bool) -> Tuple[int, str]:
+    """window is a string of '1'/'0' outcomes, newest last."""
+    window = (window + ("1" if correct else "0"))[-ADAPTIVE_WINDOW:]
+    if len(window) == ADAPTIVE_WINDOW:
+        n_correct = window.count("1")
+        if n_correct >= 4:
+            level = clamp_level(level + 1)
+        elif ADAPTIVE_WINDOW - n_correct >= 3:
+            level = clamp_level(level - 1)
+    return level, window
+
+def start_band(level: int) -> int:
+    # band = +/-1 for variety after level 2
+    return 0 if level <= 2 else 1
+
+
+# --- Spaced repetition: per-student review queue ---
+# A missed word enters lm_review_queue and comes back when due; correct answers
+# on queued words stretch the interval (SM-2: 1 day, 6 days, then interval *
+# ease). Words past REVIEW_GRADUATE_DAYS leave the queue. Due words for active
+# students are kept in a heap per student, loaded with the indexed
+# (user_id, due_at) query for everything due within the cache TTL; other
+# worker processes see new entries when their cache entry expires.
+REVIEW_SHARE = float(os.environ.get("LM_REVIEW_SHARE", "0.25"))  # share of /words that may be reviews
+REVIEW_RETRY_S = 600  # a missed word may come back after 10 minutes
+REVIEW_EASE_START, REVIEW_EASE_MIN = 2.5, 1.3
+REVIEW_GRADUATE_DAYS = 60
+REVIEW_CACHE_TTL_S = float(os.environ.get("LM_REVIEW_CACHE_TTL_S", "300"))  # 0 = no cache
+REVIEW_CACHE_MAX = 5000
+REVIEW_CACHE: Dict[int, Dict[str, Any]] = {}
+REVIEW_CACHE_LOCK = threading.Lock()
+
+def _utc_stamp(ts: float) -> str:
+    # same format as datetime('now') so stamps compare as text
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+def review_record(conn: sqlite3.Connection, uid: int, word_id: int,
+                  correct: bool) -> Optional[Tuple[int, Optional[str]]]:
+    """Update the student's review item for word_id (caller commits).
+
+    Returns (word_id, new due_at or None when it left the queue) for
+    review_cache_apply() after the commit, or None when nothing changed.
+    """
+    row = conn.execute(
+        "SELECT interval_days, ease, reps FROM lm_review_queue WHERE user_id=? AND word_id=?", (uid, word_id)
+    ).fetchone()
+    if row is None and correct:
+        return None
+    now = time.time()
+    if not correct:
+        ease = max(REVIEW_EASE_MIN, float(row["ease"]) - 0.2) if row else REVIEW_EASE_START
+        interval, reps, due = 0.0, 0, _utc_stamp(now + REVIEW_RETRY_S)
+        conn.execute(
+            "INSERT INTO lm_review_queue (user_id, word_id, due_at, interval_days, ease, reps, lapses) "
+            "VALUES (?,?,?,?,?,?,1) ON CONFLICT(user_id, word_id) DO UPDATE SET "
+            "due_at=excluded.due_at, interval_days=excluded.interval_days, ease=excluded.ease, "
+            "reps=0, lapses=lapses+1, updated_at=datetime('now')",
+            (uid, word_id, due, interval, ease, reps),
+        )
+    else:
+        reps = int(row["reps"]) + 1
+        interval = 1.0 if reps == 1 else 6.0 if reps == 2 else float(row["interval_days"]) * float(row["ease"])
+        if interval >= REVIEW_GRADUATE_DAYS:
+            conn.execute("DELETE FROM lm_review_queue WHERE user_id=? AND word_id=?", (uid, word_id))
+            due = None
+        else:
+            due = _utc_stamp(now + interval * 86400)
+            conn.execute(
+                "UPDATE lm_review_queue SET due_at=?, interval_days=?, reps=?, updated_at=datetime('now') "
+                "WHERE user_id=? AND word_id=?",
+                (due, interval, reps, uid, word_id),
+            )
+    return word_id, due
+
+def review_cache_apply(uid: int, change: Optional[Tuple[int, Optional[str]]]) -> None:
+    """Apply a committed review_record() change to the student's cached heap."""
+    if change is None:
+        return
+    word_id, due = change
+    with REVIEW_CACHE_LOCK:
+        entry = REVIEW_CACHE.get(uid)
+        if entry is not None:
+            if due is not None and due <= entry["until"]:
+                entry["due"][word_id] = due
+                heapq.heappush(entry["heap"], (due, word_id))
+            else:
+                # the heap entry goes stale and is dropped when popped
+                entry["due"].pop(word_id, None)
+
+def _review_entry(conn: sqlite3.Connection, uid: int) -> Dict[str, Any]:
+    now = time.monotonic()
+    with REVIEW_CACHE_LOCK:
+        entry = REVIEW_CACHE.get(uid)
+        if entry is not None and entry["expires"] > now:
+            return entry
+    until = _utc_stamp(time.time() + REVIEW_CACHE_TTL_S)
+    rows = conn.execute(hot_query(
+        "review_due", "SELECT word_id, due_at FROM lm_review_queue WHERE user_id=? AND due_at <= ?"
+    ), (uid, until)).fetchall()
+    heap = [(r["due_at"], int(r["word_id"])) for r in rows]
+    heapq.heapify(heap)
+    entry = {"expires": now + REVIEW_CACHE_TTL_S, "until": until, "heap": heap, "due": {w: d for d, w in heap}}
+    if REVIEW_CACHE_TTL_S > 0:
+        with REVIEW_CACHE_LOCK:
+            if len(REVIEW_CACHE) >= REVIEW_CACHE_MAX:
+                for k in [k for k, e in REVIEW_CACHE.items() if e["expires"] <= now] or list(REVIEW_CACHE):
+                    del REVIEW_CACHE[k]
+            REVIEW_CACHE[uid] = entry
+    return entry
+
+def due_reviews(conn: sqlite3.Connection, uid: int, k: int) -> list:
+    """Up to k word ids due now, most overdue first (k heap pops, pushed back)."""
+    if k <= 0:
+        return []
+    entry = _review_entry(conn, uid)
+    now = _utc_stamp(time.time())
+    out: list = []
+    with REVIEW_CACHE_LOCK:
+        heap, due = entry["heap"], entry["due"]
+        while heap and len(out) < k:
+            item = heapq.heappop(heap)
+            if due.get(item[1]) != item[0]:
+                continue  # superseded by a later answer
+            if item[0] > now:
+                heapq.heappush(heap, item)
+                break
+            out.append(item[1])
+        for w in out:
+            heapq.heappush(heap, (due[w], w))
+    return out
+
+def review_words(conn: sqlite3.Connection, uid: int, k: int) -> list:
+    """Slim words for due_reviews, flagged review=True."""
+    out = []
+    for wid in due_reviews(conn, uid, k):
+        meta = word_meta_by_id(wid)
+        if meta is not None:
+            out.append({**slim_word(meta), "review": True})
+    return out
+
+def mix_reviews(conn: sqlite3.Connection, uid: int, level: int, count: int, band: int, n_reviews: int,
+                calibrated: Optional[Tuple[list, list]] = None) -> list:
+    """Due review words (flagged review=True) topped up with words from the level pool."""
+    reviews = review_words(conn, uid, min(n_reviews, count))
+    words = reviews + pick_words(level, count - len(reviews), band,
+                                 exclude={w["id"] for w in reviews}, calibrated=calibrated)
+    random.shuffle(words)
+    return words
+
+
+# --- Audio storage: content-addressed files with reference counts ---
+# Files live under upload_dir() as <sha256><ext>. lm_audio_blobs counts how many
+# rows (session audio, disputes, queued AI jobs) point at each file; the
+# sweeper removes files whose count reached zero, so request handlers never
+# delete audio themselves.
+
+def _upload_file(audio_rel: str) -> Path:
+    fname = audio_rel.split("/", 1)[1] if "/" in audio_rel else audio_rel
+    return upload_dir() / fname
+
+def store_audio(conn: sqlite3.Connection, f: Any, ext: str) -> str:
+    """Save an uploaded file under its content hash and take one reference to it."""
+    if ext not in AUDIO_EXTS:
+        ext = ".webm"
+    updir = upload_dir()
+    updir.mkdir(parents=True, exist_ok=True)
+    tmp = updir / f".tmp_{uuid.uuid4().hex}"
+    try:
+        h = hashlib.sha256()
+        size = 0
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: f.stream.read(65536), b""):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        digest = h.hexdigest()
+        row = conn.execute("SELECT audio_path FROM lm_audio_blobs WHERE sha256=?", (digest,)).fetchone()
+        audio_rel = row["audio_path"] if row else f"uploads/{digest}{ext}"
+        # Taking the reference first holds the write lock, so the sweeper cannot
+        # remove this file between the check below and our commit.
+        conn.execute(
+            "INSERT INTO lm_audio_blobs (audio_path, sha256, size_bytes, refcount) VALUES (?,?,?,1) "
+            "ON CONFLICT(audio_path) DO UPDATE SET refcount=refcount+1, last_ref_at=datetime('now')",
+            (audio_rel, digest, size),
+        )
+        final = _upload_file(audio_rel)
+        if not final.exists():
+            os.replace(tmp, final)
+        return audio_rel
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+def audio_ref(conn: sqlite3.Connection, audio_rel: Optional[str]) -> None:
+    if not audio_rel:
+        return
+    conn.execute(
+        "INSERT INTO lm_audio_blobs (audio_path, refcount) VALUES (?,1) "
+        "ON CONFLICT(audio_path) DO UPDATE SET refcount=refcount+1, last_ref_at=datetime('now')",
+        (audio_rel,),
+    )
+
+def audio_unref(conn: sqlite3.Connection, audio_rel: Optional[str]) -> None:
+    if not audio_rel:
+        return
+    conn.execute(
+        "UPDATE lm_audio_blobs SET refcount=MAX(refcount-1, 0) WHERE audio_path=?",
+        (audio_rel,),
+    )
+
+def _expire_audio_batch(conn: sqlite3.Connection, cutoff: str, batch: int) -> int:
+    """Drop audio references older than the retention cutoff (one transaction)."""
+    n = 0
+    for r in conn.execute(
+        "SELECT id, session_audio_path FROM lm_sessions "
+        "WHERE session_audio_path IS NOT NULL AND session_audio_uploaded_at < datetime('now', ?) LIMIT ?",
+        (cutoff, batch),
+    ).fetchall():
+        conn.execute(
+            "UPDATE lm_sessions SET session_audio_path=NULL, session_audio_mime=NULL WHERE id=?",
+            (r["id"],),
+        )
+        audio_unref(conn, r["session_audio_path"])
+        n += 1
+    for r in conn.execute(
+        "SELECT id, audio_path FROM lm_disputes "
+        "WHERE audio_path IS NOT NULL AND created_at < datetime('now', ?) LIMIT ?",
+        (cutoff, batch),
+    ).fetchall():
+        conn.execute("UPDATE lm_disputes SET audio_path=NULL WHERE id=?", (r["id"],))
+        audio_unref(conn, r["audio_path"])
+        n += 1
+    for r in conn.execute(
+        "SELECT id, audio_path FROM lm_ai_queue "
+        "WHERE status='queued' AND created_at < datetime('now', ?) LIMIT ?",
+        (cutoff, batch),
+    ).fetchall():
+        conn.execute("UPDATE lm_ai_queue SET status='deleted' WHERE id=?", (r["id"],))
+        audio_unref(conn, r["audio_path"])
+        n += 1
+    conn.commit()
+    return n
+
+def _evict_oldest_audio(conn: sqlite3.Connection) -> bool:
+    """Release every reference to the oldest live file (size cap exceeded)."""
+    row = conn.execute(
+        "SELECT audio_path FROM lm_audio_blobs WHERE refcount > 0 ORDER BY created_at, audio_path LIMIT 1"
+    ).fetchone()
+    if not row:
+        return False
+    p = row["audio_path"]
+    conn.execute(
+        "UPDATE lm_sessions SET session_audio_path=NULL, session_audio_mime=NULL WHERE session_audio_path=?",
+        (p,),
+    )
+    conn.execute("UPDATE lm_disputes SET audio_path=NULL WHERE audio_path=?", (p,))
+    conn.execute("UPDATE lm_ai_queue SET status='deleted' WHERE audio_path=? AND status='queued'", (p,))
+    conn.execute("UPDATE lm_audio_blobs SET refcount=0 WHERE audio_path=?", (p,))
+    conn.commit()
+    return True
+
+def _remove_unreferenced_audio(conn: sqlite3.Connection, batch: int) -> int:
+    """Delete up to `batch` files nobody references. Holds the write lock briefly."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(
+            "SELECT audio_path FROM lm_audio_blobs WHERE refcount <= 0 LIMIT ?", (batch,)
+        ).fetchall()
+        for r in rows:
+            try:
+                _upload_file(r["audio_path"]).unlink()
+            except FileNotFoundError:
+                pass
+            conn.execute("DELETE FROM lm_audio_blobs WHERE audio_path=?", (r["audio_path"],))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(rows)
+
+def _remove_orphan_files(conn: sqlite3.Connection, batch: int) -> int:
+    """Delete upload files that have no lm_audio_blobs row.
+
+    store_audio moves the file into place before the request commits; if the
+    request then rolls back, the file stays behind without a row. Only files
+    older than AUDIO_ORPHAN_GRACE_S are considered, and the check runs under
+    the write lock, so an upload that is still being committed is never hit.
+    """
+    updir = upload_dir()
+    if not updir.exists():
+        return 0
+    now = time.time()
+    old = []
+    for f in updir.iterdir():
+        try:
+            if f.is_file() and not f.name.startswith(".tmp_") and now - f.stat().st_mtime > AUDIO_ORPHAN_GRACE_S:
+                old.append(f)
+        except OSError:
+            pass
+    n = 0
+    for k in range(0, len(old), batch):
+        part = old[k:k + batch]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rels = [f"uploads/{f.name}" for f in part]
+            known = {r["audio_path"] for r in conn.execute(
+                f"SELECT audio_path FROM lm_audio_blobs WHERE audio_path IN ({','.join('?' * len(rels))})", rels
+            )}
+            for f, rel in zip(part, rels):
+                if rel not in known:
+                    try:
+                        f.unlink()
+                        n += 1
+                    except FileNotFoundError:
+                        pass
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return n
+
+def sweep_audio(batch: Optional[int] = None) -> Dict[str, int]:
+    """Enforce audio retention and the optional size cap, then delete orphaned files.
+
+    Works in small batches with a commit after each, so student requests are
+    never blocked for long.
+    """
+    batch = batch or AUDIO_SWEEP_BATCH
+    stats = {"expired": 0, "evicted": 0, "deleted": 0, "orphaned": 0}
+    conn = get_db()
+    try:
+        cutoff = f"-{AUDIO_RETENTION_DAYS} days"
+        while True:
+            n = _expire_audio_batch(conn, cutoff, batch)
+            stats["expired"] += n
+            if n == 0:
+                break
+        if AUDIO_MAX_BYTES > 0:
+            while True:
+                used = conn.execute(
+                    "SELECT COALESCE(SUM(size_bytes),0) AS b FROM lm_audio_blobs WHERE refcount > 0"
+                ).fetchone()["b"]
+                if used <= AUDIO_MAX_BYTES or not _evict_oldest_audio(conn):
+                    break
+                stats["evicted"] += 1
+        while True:
+            n = _remove_unreferenced_audio(conn, batch)
+            stats["deleted"] += n
+            if n < batch:
+                break
+        stats["orphaned"] = _remove_orphan_files(conn, batch)
+    finally:
+        conn.close()
+    # leftovers from uploads that crashed mid-write
+    updir = upload_dir()
+    if updir.exists():
+        for tmp in updir.glob(".tmp_*"):
+            try:
+                if time.time() - tmp.stat().st_mtime > 3600:
+                    tmp.unlink()
+            except OSError:
+                pass
+    return stats
+
+def start_audio_sweeper() -> None:
+    """Run sweep_audio periodically in a daemon thread (LM_AUDIO_SWEEP_INTERVAL_S)."""
+    if AUDIO_SWEEP_INTERVAL_S <= 0:
+        return
+
+    def loop():
+        while True:
+            time.sleep(AUDIO_SWEEP_INTERVAL_S)
+            try:
+                paths = [shard_db_path(t["shard"]) for t in all_tenants()] if SHARD_DIR is not None else [None]
+                for path in paths:
+                    with use_shard(path):
+                        sweep_audio()
+            except Exception:
+                app.logger.exception("audio sweep failed")
+
+    threading.Thread(target=loop, name="lm-audio-sweeper", daemon=True).start()
+
+
+# --- Per-student category counters (lm_category_counters) ---
+# Maintained at session_finish so the difficulty view reads one row per category
+# instead of re-aggregating the student's whole history.
+COUNTER_DIMENSIONS = ("interessekategori", "stavemoenster", "ordblind_type")
+
+def _aggregate_categories(rows) -> Dict[Tuple[str, str], list]:
+    """rows: (word_id, correct, created_at) -> {(dimension, key): [total, wrong, last_seen]}"""
+    agg: Dict[Tuple[str, str], list] = {}
+    for r in rows:
+        meta = word_meta_by_id(int(r["word_id"])) or {}
+        correct = bool(r["correct"])
+        for dim in COUNTER_DIMENSIONS:
+            k = (dim, meta.get(dim) or "Ukendt")
+            v = agg.get(k)
+            if v is None:
+                v = agg[k] = [0, 0, None]
+            v[0] += 1
+            if not correct:
+                v[1] += 1
+            if r["created_at"] and (v[2] is None or r["created_at"] > v[2]):
+                v[2] = r["created_at"]
+    return agg
+
+@timed("bump_category_counters")
+def bump_category_counters(conn: sqlite3.Connection, user_id: int, rows) -> None:
+    """Add a finished session's answers to the student's counters (caller commits)."""
+    agg = _aggregate_categories(rows)
+    conn.executemany(
+        "INSERT INTO lm_category_counters (user_id, dimension, key, total, wrong, last_seen_at) VALUES (?,?,?,?,?,?) "
+        "ON CONFLICT(user_id, dimension, key) DO UPDATE SET total=total+excluded.total, wrong=wrong+excluded.wrong, "
+        "last_seen_at=MAX(COALESCE(last_seen_at, ''), COALESCE(excluded.last_seen_at, ''))",
+        [(user_id, dim, key, v[0], v[1], v[2]) for (dim, key), v in agg.items()],
+    )
+
+def word_categories(word_id: int) -> Tuple[Optional[int], str, str, str]:
+    """(niveau, interessekategori, stavemoenster, ordblind_type) as stored on lm_session_words."""
+    meta = word_meta_by_id(word_id) or {}
+    return (meta.get("niveau"),) + tuple(meta.get(d) or "Ukendt" for d in COUNTER_DIMENSIONS)
+
+def backfill_session_word_meta(conn: sqlite3.Connection, only_missing: bool = True) -> int:
+    """Copy owner and word categories onto lm_session_words rows (one UPDATE pass).
+
+    only_missing=False re-applies categories from the current words.json.
+    """
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS lm_word_meta_tmp (id INTEGER PRIMARY KEY, niveau INTEGER, "
+        "interessekategori TEXT, stavemoenster TEXT, ordblind_type TEXT)"
+    )
+    conn.execute("DELETE FROM temp.lm_word_meta_tmp")
+    conn.executemany(
+        "INSERT OR REPLACE INTO temp.lm_word_meta_tmp VALUES (?,?,?,?,?)",
+        [(int(w["id"]),) + word_categories(int(w["id"])) for w in words_cache().get("words", [])],
+    )
+    n = conn.execute(
+        "UPDATE lm_session_words SET "
+        "user_id=(SELECT s.user_id FROM lm_sessions s WHERE s.id=session_id), "
+        "niveau=(SELECT t.niveau FROM temp.lm_word_meta_tmp t WHERE t.id=word_id), "
+        "interessekategori=COALESCE((SELECT t.interessekategori FROM temp.lm_word_meta_tmp t WHERE t.id=word_id), 'Ukendt'), "
+        "stavemoenster=COALESCE((SELECT t.stavemoenster FROM temp.lm_word_meta_tmp t WHERE t.id=word_id), 'Ukendt'), "
+        "ordblind_type=COALESCE((SELECT t.ordblind_type FROM temp.lm_word_meta_tmp t WHERE t.id=word_id), 'Ukendt')"
+        + (" WHERE user_id IS NULL" if only_missing else "")
+    ).rowcount
+    conn.execute("DROP TABLE temp.lm_word_meta_tmp")
+    conn.commit()
+    return n
+
+def rebuild_category_counters(conn: sqlite3.Connection, user_id: Optional[int] = None) -> Dict[str, int]:
+    """Recompute counters from raw history; returns how many rows changed.
+
+    Streams finished-session answers ordered by user and commits per user.
+    """
+    sql = (
+        "SELECT s.user_id, sw.word_id, sw.correct, sw.created_at FROM lm_session_words sw "
+        "JOIN lm_sessions s ON s.id=sw.session_id WHERE s.ended_at IS NOT NULL"
+    )
+    params: Tuple[Any, ...] = ()
+    if user_id is not None:
+        sql += " AND s.user_id=?"
+        params = (user_id,)
+    sql += " ORDER BY s.user_id"
+    stats = {"users": 0, "changed": 0}
+
+    def flush(uid, rows):
+        fresh = {k: (v[0], v[1]) for k, v in _aggregate_categories(rows).items()}
+        old = {
+            (r["dimension"], r["key"]): (r["total"], r["wrong"])
+            for r in conn.execute("SELECT dimension, key, total, wrong FROM lm_category_counters WHERE user_id=?", (uid,))
+        }
+        stats["changed"] += sum(1 for k in set(fresh) | set(old) if fresh.get(k) != old.get(k))
+        conn.execute("DELETE FROM lm_category_counters WHERE user_id=?", (uid,))
+        bump_category_counters(conn, uid, rows)
+        conn.commit()
+        stats["users"] += 1
+
+    cur_uid, buf = None, []
+    for r in conn.execute(sql, params):
+        if r["user_id"] != cur_uid:
+            if cur_uid is not None:
+                flush(cur_uid, buf)
+            cur_uid, buf = r["user_id"], []
+        buf.append(r)
+    if cur_uid is not None:
+        flush(cur_uid, buf)
+    # students without finished sessions keep no counters
+    if user_id is not None and cur_uid is None:
+        stats["changed"] += conn.execute("DELETE FROM lm_category_counters WHERE user_id=?", (user_id,)).rowcount
+        conn.commit()
+    elif user_id is None:
+        stats["changed"] += conn.execute(
+            "DELETE FROM lm_category_counters WHERE user_id NOT IN ("
+            "SELECT DISTINCT user_id FROM lm_sessions WHERE ended_at IS NOT NULL)"
+        ).rowcount
+        conn.commit()
+    return stats
+
+
+# --- Mastery model (session_finish and recompute_mastery.py) ---
+# Per session and word level: accuracy plus normalised speed (1 - rt/visible) on
+# correct answers. Mastery 1..10 is smoothed: 0.7*old + 0.3*session.
+SPEED_EXPR = (
+    "CASE WHEN sw.correct=1 AND sw.visible_ms > 0 AND sw.response_time_ms IS NOT NULL "
+    "THEN MAX(0.0, MIN(1.0, 1.0 - CAST(sw.response_time_ms AS REAL) / sw.visible_ms)) END"
+)
+
+@timed("session_level_stats")
+def session_level_stats(conn: sqlite3.Connection, where: str, params: Tuple[Any, ...]) -> Dict[int, Dict[int, Dict[str, float]]]:
+    """{session_id: {level: {total, correct, speedSum, speedCount}}} from one GROUP BY."""
+    out: Dict[int, Dict[int, Dict[str, float]]] = {}
+    for r in conn.execute(
+        "SELECT sw.session_id, COALESCE(sw.niveau, s.estimated_level, 1) AS lvl, COUNT(*) AS total, "
+        f"SUM(sw.correct) AS correct, COALESCE(SUM({SPEED_EXPR}), 0.0) AS speed_sum, COUNT({SPEED_EXPR}) AS speed_count "
+        f"FROM lm_session_words sw JOIN lm_sessions s ON s.id=sw.session_id WHERE {where} "
+        "GROUP BY sw.session_id, lvl",
+        params,
+    ):
+        out.setdefault(int(r["session_id"]), {})[int(r["lvl"])] = {
+            "total": int(r["total"]),
+            "correct": int(r["correct"] or 0),
+            "speedSum": float(r["speed_sum"]),
+            "speedCount": int(r["speed_count"]),
+        }
+    return out
+
+def apply_session_mastery(mastery: Dict[int, int], estimated_level: Optional[int], total: int, correct: int,
+                          per_level: Dict[int, Dict[str, float]]) -> Optional[int]:
+    """Fold one finished session into `mastery` ({level: 1..10}, updated in place).
+
+    Returns the plain accuracy mastery for the estimated level (MVP value).
+    """
+    m_est = None
+    if estimated_level is not None and total > 0:
+        m_est = max(1, min(10, int(round((correct / total) * 10))))
+        mastery[estimated_level] = m_est
+    for lvl, st in per_level.items():
+        if st["total"] <= 0:
+            continue
+        acc = st["correct"]/st["total"]
+        sp = (st["speedSum"]/st["speedCount"]) if st["speedCount"]>0 else 0.5
+        prof = 0.7*acc + 0.3*sp
+        m_new = max(1, min(10, int(round(prof*10))))
+        old = mastery.get(lvl)
+        mastery[lvl] = max(1, min(10, int(round(0.7*old + 0.3*m_new)))) if old is not None else m_new
+    return m_est
+
+def session_scores(per_level: Dict[int, Dict[str, float]], total: int, correct: int) -> Tuple[float, float, float]:
+    """(session_score 0..100, accuracy, speed) as shown on the result page."""
+    acc_all = (correct / total) if total else 0.0
+    speed_all_list = [st["speedSum"]/st["speedCount"] for st in per_level.values() if st["speedCount"]>0]
+    speed_all = (sum(speed_all_list)/len(speed_all_list)) if speed_all_list else 0.5
+    return round(((0.7*acc_all + 0.3*speed_all) * 100), 1), acc_all, speed_all
+
+def replay_user_mastery(conn: sqlite3.Connection, uid: int) -> Dict[int, int]:
+    """Recompute a student's mastery from scratch by replaying finished sessions in order."""
+    stats = session_level_stats(conn, "s.user_id=? AND s.ended_at IS NOT NULL", (uid,))
+    mastery: Dict[int, int] = {}
+    for sess in conn.execute(
+        "SELECT id, estimated_level, correct_total, total_words FROM lm_sessions "
+        "WHERE user_id=? AND ended_at IS NOT NULL ORDER BY ended_at, id",
+        (uid,),
+    ):
+        per_level = stats.get(int(sess["id"]), {})
+        total, correct = int(sess["total_words"]), int(sess["correct_total"])
+        if total == 0:
+            total = sum(int(st["total"]) for st in per_level.values())
+            correct = sum(int(st["correct"]) for st in per_level.values())
+        apply_session_mastery(mastery, sess["estimated_level"], total, correct, per_level)
+    return mastery
+
+
+# --- Progress rollups (lm_progress_rollup), one row per student and day/week ---
+PROGRESS_PERIODS = {
+    "day": "date(?)",
+    "week": "date(?, '-6 days', 'weekday 1')",  # Monday of the ISO week
+}
+
+@timed("bump_progress_rollups")
+def bump_progress_rollups(conn: sqlite3.Connection, uid: int, ended_at: str, estimated_level: Optional[int],
+                          total: int, correct: int, session_score: Optional[float], speed: Optional[float]) -> None:
+    """Add one finished session to the student's daily and weekly rollups (caller commits)."""
+    for period, start_expr in PROGRESS_PERIODS.items():
+        conn.execute(
+            "INSERT INTO lm_progress_rollup (user_id, period, period_start, sessions, words, correct, "
+            "level_sum, level_n, last_level, score_sum, score_n, speed_sum, speed_n) "
+            f"VALUES (?, ?, {start_expr}, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(user_id, period, period_start) DO UPDATE SET "
+            "sessions=sessions+1, words=words+excluded.words, correct=correct+excluded.correct, "
+            "level_sum=level_sum+excluded.level_sum, level_n=level_n+excluded.level_n, "
+            "last_level=COALESCE(excluded.last_level, last_level), "
+            "score_sum=score_sum+excluded.score_sum, score_n=score_n+excluded.score_n, "
+            "speed_sum=speed_sum+excluded.speed_sum, speed_n=speed_n+excluded.speed_n",
+            (uid, period, ended_at, total, correct,
+             estimated_level or 0, 1 if estimated_level is not None else 0, estimated_level,
+             session_score or 0.0, 1 if session_score is not None else 0,
+             speed or 0.0, 1 if speed is not None else 0),
+        )
+
+def rebuild_progress_rollups(conn: sqlite3.Connection, user_id: Optional[int] = None) -> int:
+    """Recompute rollups from finished sessions; returns number of sessions replayed."""
+    where = "s.ended_at IS NOT NULL" + (" AND s.user_id=?" if user_id is not None else "")
+    params: Tuple[Any, ...] = (user_id,) if user_id is not None else ()
+    if user_id is not None:
+        conn.execute("DELETE FROM lm_progress_rollup WHERE user_id=?", (user_id,))
+    else:
+        conn.execute("DELETE FROM lm_progress_rollup")
+    stats = session_level_stats(conn, where, params)
+    n = 0
+    for sess in conn.execute(
+        "SELECT s.id, s.user_id, s.ended_at, s.estimated_level, s.correct_total, s.total_words "
+        f"FROM lm_sessions s WHERE {where} ORDER BY s.ended_at, s.id",
+        params,
+    ).fetchall():
+        per_level = stats.get(int(sess["id"]), {})
+        total, correct = int(sess["total_words"]), int(sess["correct_total"])
+        if total == 0:
+            total = sum(int(st["total"]) for st in per_level.values())
+            correct = sum(int(st["correct"]) for st in per_level.values())
+        score, _, speed = session_scores(per_level, total, correct)
+        bump_progress_rollups(conn, sess["user_id"], sess["ended_at"], sess["estimated_level"], total, correct, score, speed)
+        n += 1
+    conn.commit()
+    return n
+
+def downsample_progress(rows: list, points: int) -> list:
+    """Merge consecutive rollup rows so at most `points` remain (sums are additive)."""
+    if points <= 0 or len(rows) <= points:
+        groups = [[r] for r in rows]
+    else:
+        size = -(-len(rows) // points)  # ceil
+        groups = [rows[i:i + size] for i in range(0, len(rows), size)]
+    out = []
+    for g in groups:
+        tot = {k: sum(r[k] for r in g) for k in
+               ("sessions", "words", "correct", "level_sum", "level_n", "score_sum", "score_n", "speed_sum", "speed_n")}
+        last_level = next((r["last_level"] for r in reversed(g) if r["last_level"] is not None), None)
+        out.append({
+            "t": g[0]["period_start"],
+            "t_end": g[-1]["period_start"],
+            "sessions": tot["sessions"],
+            "words": tot["words"],
+            "accuracy": (tot["correct"] / tot["words"]) if tot["words"] else None,
+            "avg_level": (tot["level_sum"] / tot["level_n"]) if tot["level_n"] else None,
+            "last_level": last_level,
+            "session_score": (tot["score_sum"] / tot["score_n"]) if tot["score_n"] else None,
+            "speed": (tot["speed_sum"] / tot["speed_n"]) if tot["speed_n"] else None,
+        })
+    return out
+
+def progress_response(conn: sqlite3.Connection, uid: int):
+    """Shared body for /me/progress and /admin/student/<uid>/progress.
+
+    Query: ?period=day|week (default: week when the range spans > 120 days)
+           &points=N (default 200) &from=YYYY-MM-DD &to=YYYY-MM-DD
+    """
+    period = (request.args.get("period") or "").strip()
+    date_from = (request.args.get("from") or "").strip() or None
+    date_to = (request.args.get("to") or "").strip() or None
+    for d in (date_from, date_to):
+        if d and not DATE_RE.match(d):
+            return jsonify({"error": "invalid_date"}), 400
+    try:
+        points = max(1, min(2000, int(request.args.get("points", "200"))))
+    except ValueError:
+        points = 200
+    if not period:
+        span = conn.execute(
+            "SELECT julianday(COALESCE(?, MAX(period_start))) - julianday(COALESCE(?, MIN(period_start))) AS d "
+            "FROM lm_progress_rollup WHERE user_id=? AND period='day'",
+            (date_to, date_from, uid),
+        ).fetchone()["d"]
+        period = "week" if (span or 0) > 120 else "day"
+    if period not in PROGRESS_PERIODS:
+        return jsonify({"error": "invalid_period"}), 400
+
+    sql = "SELECT * FROM lm_progress_rollup WHERE user_id=? AND period=?"
+    params: list = [uid, period]
+    if date_from:
+        sql += " AND period_start >= " + PROGRESS_PERIODS[period]
+        params.append(date_from)
+    if date_to:
+        sql += " AND period_start <= ?"
+        params.append(date_to)
+    rows = conn.execute(hot_query("progress_rollup", sql + " ORDER BY period_start"), params).fetchall()
+    return jsonify({"ok": True, "user_id": uid, "period": period, "rows": len(rows),
+                    "points": downsample_progress(rows, points)})
+
+
+# --- Roster import (many students at once) ---
+ROSTER_MAX_ROWS = 5000
+HASH_WORKERS = int(os.environ.get("LM_HASH_WORKERS", "0")) or (os.cpu_count() or 1)
+_HASH_POOL: Optional[ProcessPoolExecutor] = None
+_HASH_POOL_LOCK = threading.Lock()
+
+@timed("hash_passwords")
+def hash_passwords(passwords: list) -> list:
+    """generate_password_hash for many passwords, spread over a process pool."""
+    global _HASH_POOL
+    if len(passwords) < 8 or HASH_WORKERS <= 1:
+        return [generate_password_hash(p) for p in passwords]
+    with _HASH_POOL_LOCK:
+        if _HASH_POOL is None:
+            # spawn, not fork: this process already runs request, sweeper and
+            # snapshot threads, and a forked child can inherit a held lock
+            _HASH_POOL = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        pool = _HASH_POOL
+    chunk = max(1, len(passwords) // (HASH_WORKERS * 4))
+    return list(pool.map(generate_password_hash, passwords, chunksize=chunk))
+
+def parse_roster(data: Any, text: Optional[str]) -> list:
+    """Rows from JSON ({"users": [...]} or a list) or CSV text with a header line.
+
+    Columns: username, password, display_name (optional), group (name) or group_id.
+    """
+    if text is not None:
+        return [dict(r) for r in csv.DictReader(io.StringIO(text.lstrip("\ufeff")))]
+    if isinstance(data, dict):
+        data = data.get("users")
+    return [r for r in (data or []) if isinstance(r, dict)]
+
+def import_roster(conn: sqlite3.Connection, rows: list) -> Dict[str, Any]:
+    """Create student accounts in one transaction; returns created count and per-row errors.
+
+    Row numbers in errors are 1-based positions in `rows`.
+    """
+    errors = []
+    valid = []
+    seen = set()
+    for i, r in enumerate(rows, start=1):
+        username = str(r.get("username") or "").strip()
+        password = str(r.get("password") or "").strip()
+        if not username or not password:
+            errors.append({"row": i, "username": username or None, "error": "missing_username_or_password"})
+            continue
+        if username in seen:
+            errors.append({"row": i, "username": username, "error": "duplicate_in_import"})
+            continue
+        seen.add(username)
+        group_id = r.get("group_id")
+        if group_id not in (None, ""):
+            try:
+                group_id = int(group_id)
+            except (TypeError, ValueError):
+                errors.append({"row": i, "username": username, "error": "invalid_group_id"})
+                continue
+        else:
+            group_id = None
+        valid.append({
+            "row": i, "username": username, "password": password, "group_id": group_id,
+            "group": str(r.get("group") or "").strip() or None,
+            "display_name": str(r.get("display_name") or "").strip() or None,
+        })
+
+    # usernames that already exist
+    names = [v["username"] for v in valid]
+    taken = set()
+    for k in range(0, len(names), 500):
+        part = names[k:k + 500]
+        taken.update(r["username"] for r in conn.execute(
+            f"SELECT username FROM lm_users WHERE username IN ({','.join('?' * len(part))})", part
+        ))
+    taken.update(catalog_taken(names))  # other tenants (multi-tenant mode)
+    for v in valid:
+        if v["username"] in taken:
+            errors.append({"row": v["row"], "username": v["username"], "error": "username_taken"})
+    valid = [v for v in valid if v["username"] not in taken]
+
+    group_ids = {int(r["id"]) for r in conn.execute("SELECT id FROM lm_groups")}
+    for v in valid:
+        if v["group_id"] is not None and v["group_id"] not in group_ids:
+            errors.append({"row": v["row"], "username": v["username"], "error": "group_not_found"})
+    valid = [v for v in valid if v["group_id"] is None or v["group_id"] in group_ids]
+
+    hashes = hash_passwords([v["password"] for v in valid])
+
+    created_groups = []
+    try:
+        by_name: Dict[str, int] = {}
+        for r in conn.execute("SELECT id, name FROM lm_groups ORDER BY id"):
+            by_name.setdefault(r["name"], int(r["id"]))
+        for v in valid:
+            if v["group_id"] is None and v["group"]:
+                if v["group"] not in by_name:
+                    by_name[v["group"]] = conn.execute("INSERT INTO lm_groups (name) VALUES (?)", (v["group"],)).lastrowid
+                    created_groups.append({"id": by_name[v["group"]], "name": v["group"]})
+                v["group_id"] = by_name[v["group"]]
+        conn.executemany(
+            "INSERT INTO lm_users (username, password_hash, role, group_id, display_name) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(username) DO NOTHING",
+            [(v["username"], h, "elev", v["group_id"], v["display_name"]) for v, h in zip(valid, hashes)],
+        )
+        # a concurrent signup may have won a username; the salted hash tells us which rows are ours
+        ours = {}
+        for k in range(0, len(valid), 500):
+            part = list(zip(valid[k:k + 500], hashes[k:k + 500]))
+            ours.update((r["username"], (r["password_hash"], int(r["id"]))) for r in conn.execute(
+                f"SELECT id, username, password_hash FROM lm_users WHERE username IN ({','.join('?' * len(part))})",
+                [v["username"] for v, _ in part],
+            ))
+        new_users = []
+        for v, h in zip(valid, hashes):
+            if ours.get(v["username"], (None,))[0] == h:
+                new_users.append((ours[v["username"]][1], v["username"]))
+            else:
+                errors.append({"row": v["row"], "username": v["username"], "error": "username_taken"})
+        created = len(new_users)
+        catalog_add(users=new_users, group_ids=[gr["id"] for gr in created_groups])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    errors.sort(key=lambda e: e["row"])
+    return {"created": created, "created_groups": created_groups, "errors": errors}
+
+
+# --- Auth context cache ---
+# id/role/group of logged-in users, kept in-process for LM_AUTH_CACHE_TTL_S so
+# protected endpoints (e.g. the 20 answer posts per test) skip the lm_users
+# lookup. Call invalidate_auth_cache() wherever a user row changes; other
+# worker processes pick the change up when their entry expires.
+AUTH_CACHE_TTL_S = float(os.environ.get("LM_AUTH_CACHE_TTL_S", "30"))  # 0 = disabled
+AUTH_CACHE_MAX = 10000
+AUTH_CACHE: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+AUTH_CACHE_STATS = {"hits": 0, "misses": 0}
+AUTH_CACHE_LOCK = threading.Lock()
+
+def invalidate_auth_cache(uid: Optional[int] = None) -> None:
+    with AUTH_CACHE_LOCK:
+        if uid is None:
+            AUTH_CACHE.clear()
+        else:
+            AUTH_CACHE.pop(int(uid), None)
+
+def current_user(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
     uid = session.get("user_id")
     if not uid:
         return None
-    cur = conn.execute("SELECT * FROM lm_users WHERE id=?", (uid,))
-    return cur.fetchone()
-
-def require_login(conn: sqlite3.Connection) -> Tuple[Optional[sqlite3.Row], Optional[Any]]:
+    now = time.monotonic()
+    with AUTH_CACHE_LOCK:
+        hit = AUTH_CACHE.get(uid)
+        if hit and hit[0] > now:
+            AUTH_CACHE_STATS["hits"] += 1
+            return hit[1]
+        AUTH_CACHE_STATS["misses"] += 1
+    row = conn.execute(
+        "SELECT id, username, role, group_id, display_name FROM lm_users WHERE id=?", (uid,)
+    ).fetchone()
+    if row is None:
+        invalidate_auth_cache(uid)
+        return None
+    user = dict(row)
+    if AUTH_CACHE_TTL_S > 0:
+        with AUTH_CACHE_LOCK:
+            if len(AUTH_CACHE) >= AUTH_CACHE_MAX:
+                for k in [k for k, (exp, _) in AUTH_CACHE.items() if exp <= now] or list(AUTH_CACHE):
+                    del AUTH_CACHE[k]
+            AUTH_CACHE[uid] = (now + AUTH_CACHE_TTL_S, user)
+    return user
+
+def require_login(conn: sqlite3.Connection) -> Tuple[Optional[Dict[str, Any]], Optional[Any]]:
     user = current_user(conn)
     if not user:
         return None, (jsonify({"error":"not_logged_in"}), 401)
     return user, None
 
-def require_admin(conn: sqlite3.Connection) -> Tuple[Optional[sqlite3.Row], Optional[Any]]:
+def require_admin(conn: sqlite3.Connection) -> Tuple[Optional[Dict[str, Any]], Optional[Any]]:
     user, resp = require_login(conn)
     if resp:
         return None, resp
@@ -231,6 +2024,348 @@ def favicon():
 
 app.secret_key = os.environ.get("LM_SECRET_KEY", "dev-secret-change-me")
 
+# /metrics is served to a logged-in admin or with "Authorization: Bearer <LM_METRICS_TOKEN>"
+# (for the scraper); LM_METRICS_PUBLIC=1 serves it to anyone, e.g. behind a private bind address.
+METRICS_TOKEN = os.environ.get("LM_METRICS_TOKEN", "")
+METRICS_PUBLIC = os.environ.get("LM_METRICS_PUBLIC", "0") == "1"
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_LOCK = threading.Lock()
+# histogram name -> label tuple -> [bucket counts..., +Inf count, sum]
+METRICS: Dict[str, Dict[Tuple[Tuple[str, str], ...], list]] = {
+    "lm_request_duration_seconds": {},
+    "lm_request_sql_seconds": {},
+    "lm_section_seconds": {},
+}
+METRICS_COUNTERS: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {
+    "lm_requests_total": {},
+    "lm_sql_statements_total": {},
+}
+METRICS_HELP = {
+    "lm_request_duration_seconds": "Request latency by route",
+    "lm_request_sql_seconds": "SQL time per request by route",
+    "lm_section_seconds": "Time per request in named hot-path sections",
+    "lm_requests_total": "Requests by route and status",
+    "lm_sql_statements_total": "SQL statements executed by route",
+}
+
+def _observe(name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+    h = METRICS[name].get(labels)
+    if h is None:
+        h = METRICS[name][labels] = [0] * (len(METRICS_BUCKETS) + 1) + [0.0]
+    h[bisect_left(METRICS_BUCKETS, value)] += 1  # cumulated when rendered
+    h[-1] += value
+
+@app.before_request
+def _start_request_stats():
+    if METRICS_ENABLED:
+        _REQ.stats = {"t0": time.perf_counter(), "sql_n": 0, "sql_s": 0.0, "sections": {},
+                      "route": request.url_rule.rule if request.url_rule is not None else None}
+
+@app.after_request
+def _finish_request_stats(resp):
+    stats = _req_stats()
+    if stats is None:
+        return resp
+    _REQ.stats = None
+    total = time.perf_counter() - stats["t0"]
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    parts = [f"total;dur={total * 1000:.2f}", f'sql;dur={stats["sql_s"] * 1000:.2f};desc="{stats["sql_n"]} queries"']
+    parts += [f"{k};dur={v * 1000:.2f}" for k, v in stats["sections"].items()]
+    resp.headers["Server-Timing"] = ", ".join(parts)
+    labels = (("route", route), ("method", request.method))
+    with METRICS_LOCK:
+        _observe("lm_request_duration_seconds", labels, total)
+        _observe("lm_request_sql_seconds", labels, stats["sql_s"])
+        for k, v in stats["sections"].items():
+            _observe("lm_section_seconds", (("section", k),), v)
+        c = METRICS_COUNTERS["lm_requests_total"]
+        key = labels + (("status", str(resp.status_code)),)
+        c[key] = c.get(key, 0) + 1
+        c = METRICS_COUNTERS["lm_sql_statements_total"]
+        c[labels] = c.get(labels, 0) + stats["sql_n"]
+    return resp
+
+@app.teardown_request
+def _drop_request_stats(exc):
+    # after_request is skipped on unhandled errors
+    _REQ.stats = None
+
+def _prom_labels(labels) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"')
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+def render_metrics() -> str:
+    lines = []
+    with METRICS_LOCK:
+        for name, series in METRICS.items():
+            lines += [f"# HELP {name} {METRICS_HELP[name]}", f"# TYPE {name} histogram"]
+            for labels, h in sorted(series.items()):
+                cum = 0
+                for le, n in zip(METRICS_BUCKETS, h):
+                    cum += n
+                    lines.append(f"{name}_bucket{_prom_labels(labels + (('le', str(le)),))} {cum}")
+                cum += h[len(METRICS_BUCKETS)]
+                lines.append(f"{name}_bucket{_prom_labels(labels + (('le', '+Inf'),))} {cum}")
+                lines.append(f"{name}_sum{_prom_labels(labels)} {h[-1]:.6f}")
+                lines.append(f"{name}_count{_prom_labels(labels)} {cum}")
+        for name, series in METRICS_COUNTERS.items():
+            lines += [f"# HELP {name} {METRICS_HELP[name]}", f"# TYPE {name} counter"]
+            for labels, v in sorted(series.items()):
+                lines.append(f"{name}{_prom_labels(labels)} {v}")
+    with AUTH_CACHE_LOCK:
+        hits, misses, size = AUTH_CACHE_STATS["hits"], AUTH_CACHE_STATS["misses"], len(AUTH_CACHE)
+    lines += [
+        "# HELP lm_auth_cache_hits_total Auth context lookups served from the in-process cache",
+        "# TYPE lm_auth_cache_hits_total counter", f"lm_auth_cache_hits_total {hits}",
+        "# HELP lm_auth_cache_misses_total Auth context lookups that read lm_users",
+        "# TYPE lm_auth_cache_misses_total counter", f"lm_auth_cache_misses_total {misses}",
+        "# HELP lm_auth_cache_entries Users currently in the auth context cache",
+        "# TYPE lm_auth_cache_entries gauge", f"lm_auth_cache_entries {size}",
+    ]
+    return "\n".join(lines) + "\n"
+
+@app.route("/laesemaskine/api/metrics")
+def metrics():
+    """Prometheus text format (this process only)."""
+    bearer = request.headers.get("Authorization", "")
+    if not METRICS_PUBLIC and not (METRICS_TOKEN and hmac.compare_digest(bearer, f"Bearer {METRICS_TOKEN}")):
+        conn = get_db()
+        try:
+            _, resp = require_admin(conn)
+        finally:
+            conn.close()
+        if resp:
+            return resp
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# --- Response encoding ---
+# JSON is encoded with orjson when it is installed (stdlib json otherwise), keys
+# in insertion order and without \u escapes. Responses of at least
+# GZIP_MIN_BYTES are gzipped for clients that accept it. List endpoints take
+# ?shape=columns and then return {"columns": [...], "rows": [[...], ...]}
+# instead of a list of objects (nested objects become "a.b" columns).
+GZIP_MIN_BYTES = int(os.environ.get("LM_GZIP_MIN_BYTES", "1024"))  # 0 = never gzip
+GZIP_LEVEL = int(os.environ.get("LM_GZIP_LEVEL", "5"))
+GZIP_MIMETYPES = {"application/json", "application/x-ndjson", "text/plain", "text/csv"}
+
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    ensure_ascii = False
+
+    def _orjson(self, obj: Any) -> Optional[bytes]:
+        try:
+            return orjson.dumps(obj, default=self.default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return None  # e.g. ints beyond 64 bit: let the stdlib handle it
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if orjson is not None and not kwargs:
+            out = self._orjson(obj)
+            if out is not None:
+                return out[:-1].decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if orjson is None or (self._app.debug and self.compact is None) or self.compact is False:
+            return super().response(*args, **kwargs)  # pretty printed
+        if args and kwargs:
+            raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+        obj = (args[0] if len(args) == 1 else args) if args else kwargs or None
+        out = self._orjson(obj)
+        if out is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(out, mimetype=self.mimetype)
+
+app.json = FastJSONProvider(app)
+# compact (orjson) even under app.run(debug=True); LM_JSON_PRETTY=1 indents for reading by hand
+app.json.compact = os.environ.get("LM_JSON_PRETTY", "0") != "1"
+
+def rows_payload(items: list) -> Any:
+    """`items` as is, or as columns + rows when the request asks for ?shape=columns."""
+    if request.args.get("shape") != "columns":
+        return items
+    nested = {k for it in items for k, v in it.items() if isinstance(v, dict)}
+    columns: Dict[str, Tuple[str, Optional[str]]] = {}
+    for it in items:
+        for k, v in it.items():
+            if k not in nested:
+                columns.setdefault(k, (k, None))
+            elif isinstance(v, dict):
+                for sub in v:
+                    columns.setdefault(f"{k}.{sub}", (k, sub))
+    paths = list(columns.values())
+    rows = []
+    for it in items:
+        row = []
+        for k, sub in paths:
+            v = it.get(k)
+            if sub is not None:
+                v = v.get(sub) if isinstance(v, dict) else None
+            row.append(v)
+        rows.append(row)
+    return {"columns": list(columns), "rows": rows}
+
+@app.after_request
+def _gzip_response(resp):
+    if (GZIP_MIN_BYTES <= 0 or resp.direct_passthrough or resp.is_streamed
+            or resp.status_code < 200 or resp.status_code == 204
+            or "Content-Encoding" in resp.headers or resp.mimetype not in GZIP_MIMETYPES):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    if request.accept_encodings.quality("gzip") <= 0:
+        return resp
+    data = resp.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return resp
+    resp.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+    resp.headers["Content-Encoding"] = "gzip"
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(etag, weak=True)  # a strong ETag names exact bytes; these differ from the plain body
+    return resp
+
+# --- Sampling profiler (opt-in) ---
+# A share of requests (globally or per route rule) runs under cProfile. Each
+# profiled request writes <time>-<ms>-<method>-<route>.prof (pstats) and a
+# .collapsed file (folded stacks for flamegraph.pl / speedscope) to
+# PROFILE_DIR; only the newest `keep` profiles are kept. Defaults come from
+# LM_PROFILE_RATE / LM_PROFILE_ROUTES ("rule=rate,rule=rate"); admins can change
+# them at runtime via /admin/profiling, which writes PROFILE_DIR/profiling.json.
+# Every worker re-reads that file within PROFILE_RELOAD_S.
+PROFILE_DIR = Path(os.environ.get("LM_PROFILE_DIR") or (BASE_DIR / "profiles")).resolve()
+PROFILE_RELOAD_S = 2.0
+
+def _parse_profile_routes(text: str) -> Dict[str, float]:
+    out = {}
+    for part in (text or "").split(","):
+        rule, _, rate = part.strip().rpartition("=")
+        if rule:
+            try:
+                out[rule] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                pass
+    return out
+
+PROFILE_DEFAULTS = {
+    "rate": max(0.0, min(1.0, float(os.environ.get("LM_PROFILE_RATE", "0") or 0))),
+    "routes": _parse_profile_routes(os.environ.get("LM_PROFILE_ROUTES", "")),
+    "keep": int(os.environ.get("LM_PROFILE_KEEP", "50")),
+}
+PROFILE_STATE: Dict[str, Any] = {"config": dict(PROFILE_DEFAULTS), "mtime": None, "checked": 0.0}
+PROFILE_LOCK = threading.Lock()
+# One profiled request at a time per process: from Python 3.12 cProfile hooks
+# the process-wide sys.monitoring, so a second Profile().enable() raises and
+# would also record the other request's threads.
+PROFILE_ACTIVE = threading.Lock()
+
+def profile_config() -> Dict[str, Any]:
+    now = time.monotonic()
+    if now - PROFILE_STATE["checked"] < PROFILE_RELOAD_S:
+        return PROFILE_STATE["config"]
+    with PROFILE_LOCK:
+        PROFILE_STATE["checked"] = now
+        path = PROFILE_DIR / "profiling.json"
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = None
+        if mtime != PROFILE_STATE["mtime"]:
+            cfg = dict(PROFILE_DEFAULTS)
+            if mtime is not None:
+                try:
+                    cfg.update(json.loads(path.read_text(encoding="utf-8")))
+                except (OSError, ValueError):
+                    pass
+            PROFILE_STATE["config"], PROFILE_STATE["mtime"] = cfg, mtime
+    return PROFILE_STATE["config"]
+
+def collapsed_stacks(prof: cProfile.Profile) -> list:
+    """Folded stacks ("a;b;c <microseconds>") rebuilt from cProfile's caller graph.
+
+    cProfile only records caller -> callee edges, so time of a function called
+    from several places is split in proportion to each edge's cumulative time.
+    """
+    stats = pstats.Stats(prof).stats
+    callees: Dict[Any, list] = {}
+    for fn, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((fn, edge[3]))
+    def label(fn) -> str:
+        if fn[0] == "~":  # built-in; drop the object address so stacks fold across runs
+            return re.sub(r" at 0x[0-9a-f]+", "", fn[2])
+        p = Path(fn[0])
+        return f"{p.parent.name}/{p.name}:{fn[2]}"
+    folded: Dict[str, float] = {}
+
+    def walk(fn, stack: list, share: float) -> None:
+        _, _, tt, ct, _ = stats[fn]
+        path = stack + [label(fn)]
+        self_us = tt * share * 1e6
+        if self_us >= 1:
+            key = ";".join(path)
+            folded[key] = folded.get(key, 0.0) + self_us
+        if len(path) >= 64:
+            return
+        for child, edge_ct in callees.get(fn, ()):
+            child_ct = stats[child][3]
+            if child_ct > 0 and label(child) not in path:
+                walk(child, path, share * edge_ct / child_ct)
+
+    for fn, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(fn, [], 1.0)
+    return [f"{k} {int(v)}" for k, v in sorted(folded.items())]
+
+def _rotate_profiles(keep: int) -> None:
+    dumps = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for old in dumps[: max(0, len(dumps) - max(1, keep))]:
+        for p in (old, old.with_suffix(".collapsed")):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+@app.before_request
+def _maybe_start_profiler():
+    cfg = profile_config()
+    if not cfg["rate"] and not cfg["routes"]:
+        return
+    route = request.url_rule.rule if request.url_rule is not None else None
+    if random.random() < cfg["routes"].get(route, cfg["rate"]):
+        if not PROFILE_ACTIVE.acquire(blocking=False):
+            return  # another request is being profiled: skip this sample
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # another profiling tool (debugger, coverage) is active
+            PROFILE_ACTIVE.release()
+            return
+        _REQ.profile = (prof, time.perf_counter())
+
+@app.teardown_request
+def _stop_profiler(exc):
+    started = getattr(_REQ, "profile", None)
+    if started is None:
+        return
+    _REQ.profile = None
+    prof, t0 = started
+    prof.disable()
+    PROFILE_ACTIVE.release()
+    ms = int((time.perf_counter() - t0) * 1000)
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route.replace("/laesemaskine/api", "")).strip("_") or "root"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{ms:05d}ms-{request.method}-{slug}-{uuid.uuid4().hex[:6]}"
+    try:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        prof.dump_stats(str(PROFILE_DIR / f"{name}.prof"))
+        (PROFILE_DIR / f"{name}.collapsed").write_text("\n".join(collapsed_stacks(prof)) + "\n", encoding="utf-8")
+        _rotate_profiles(int(profile_config().get("keep") or 50))
+    except OSError:
+        app.logger.exception("could not write profile %s", name)
+
 @app.route("/laesemaskine/api/health")
 def health():
     return jsonify({"ok": True, "version": "0.1.0"})
@@ -249,19 +2384,48 @@ def register():
     if role not in ("elev","admin"):
         return jsonify({"error":"invalid_role"}), 400
 
+    created = None
+    if SHARD_DIR is not None:
+        # multi-tenant: schools and their first admin come from `shards.py add`, everyone
+        # else from the school's /admin/users or import_roster.py. Only with LM_OPEN_SIGNUP
+        # does an admin registering create a new school and a student join one by name.
+        if not OPEN_SIGNUP:
+            return jsonify({"error":"signup_closed"}), 403
+        tenant_name = (data.get("tenant") or "").strip()
+        if not tenant_name:
+            return jsonify({"error":"missing_tenant"}), 400
+        if catalog_taken([username]):
+            return jsonify({"error":"username_taken"}), 409
+        g.lm_tenant = tenant_by_name(tenant_name)
+        if role == "admin":
+            if g.lm_tenant is not None:
+                return jsonify({"error":"tenant_exists"}), 409
+            try:
+                created = g.lm_tenant = create_tenant(tenant_name)
+            except sqlite3.IntegrityError:  # created concurrently by someone else
+                return jsonify({"error":"tenant_exists"}), 409
+        elif g.lm_tenant is None:
+            return jsonify({"error":"unknown_tenant"}), 404
+
     conn = get_db()
     try:
         pw_hash = generate_password_hash(password)
         try:
-            conn.execute(
+            uid = conn.execute(
                 "INSERT INTO lm_users (username, password_hash, role, display_name) VALUES (?,?,?,?)",
                 (username, pw_hash, role, display_name),
-            )
+            ).lastrowid
+            catalog_add(users=[(uid, username)])
             conn.commit()
-        except sqlite3.IntegrityError:
+        except sqlite3.Error as e:
+            conn.rollback()
+            if created is not None:
+                conn.close()
+                drop_tenant(created["id"])  # no school without the admin who registered it
+            if not isinstance(e, sqlite3.IntegrityError):
+                raise
             return jsonify({"error":"username_taken"}), 409
 
-        uid = conn.execute("SELECT id FROM lm_users WHERE username=?", (username,)).fetchone()["id"]
         session["user_id"] = uid
         return jsonify({"ok": True, "user": {"id": uid, "username": username, "role": role, "display_name": display_name}})
     finally:
@@ -274,6 +2438,10 @@ def login():
     password = (data.get("password") or "").strip()
     if not username or not password:
         return jsonify({"error":"missing_username_or_password"}), 400
+    if SHARD_DIR is not None:
+        g.lm_tenant = tenant_by_username(username)
+        if g.lm_tenant is None:
+            return jsonify({"error":"invalid_credentials"}), 401
 
     conn = get_db()
     try:
@@ -281,13 +2449,16 @@ def login():
         if not user or not check_password_hash(user["password_hash"], password):
             return jsonify({"error":"invalid_credentials"}), 401
         session["user_id"] = user["id"]
+        invalidate_auth_cache(user["id"])
         return jsonify({"ok": True, "user": {"id": user["id"], "username": user["username"], "role": user["role"], "display_name": user["display_name"], "group_id": user["group_id"]}})
     finally:
         conn.close()
 
 @app.route("/laesemaskine/api/auth/logout", methods=["POST"])
 def logout():
-    session.pop("user_id", None)
+    uid = session.pop("user_id", None)
+    if uid:
+        invalidate_auth_cache(uid)
     return jsonify({"ok": True})
 
 @app.route("/laesemaskine/api/me")
@@ -312,10 +2483,79 @@ def me():
                 "group_id": user["group_id"],
             },
             "mastery": [dict(r) for r in mastery],
+            "lexicon": {k: lexicon()["manifest"][k] for k in ("version", "digest")},
         })
     finally:
         conn.close()
 
+@app.route("/laesemaskine/api/lexicon/manifest")
+def lexicon_manifest():
+    """Shard list for the current words.json version (revalidated with ETag)."""
+    manifest = lexicon()["manifest"]
+    resp = jsonify({"ok": True, **manifest})
+    resp.set_etag(manifest["digest"], weak=True)  # weak: same ETag for the gzipped and plain body
+    resp.vary.add("Accept-Encoding")  # also on 304s, which _gzip_response skips
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+@app.route("/laesemaskine/api/lexicon/<int:level>.<shard_hash>.json")
+def lexicon_shard(level: int, shard_hash: str):
+    """One niveau of the lexicon; immutable, so browsers and proxies may cache it forever."""
+    shard = lexicon()["shards"].get(level)
+    if shard is None or shard[0] != shard_hash:
+        return jsonify({"error": "unknown_shard"}), 404  # words.json changed: reload the manifest
+    resp = Response(shard[1], mimetype="application/json")
+    resp.set_etag(shard_hash, weak=True)
+    resp.vary.add("Accept-Encoding")
+    resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return resp.make_conditional(request)
+
+@app.route("/laesemaskine/api/admin/lexicon/search")
+def admin_lexicon_search():
+    """Search the word list: ?q=&match=contains|prefix&niveau=&stavemoenster=&ordblind_type=&interessekategori=
+
+    Paginated in words.json order: pass next_cursor as ?after= for the next page.
+    """
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+    finally:
+        conn.close()
+
+    q = (request.args.get("q") or "").strip()
+    match = (request.args.get("match") or "contains").strip()
+    if match not in ("contains", "prefix"):
+        return jsonify({"error": "invalid_match"}), 400
+    filters: Dict[str, Any] = {}
+    try:
+        if request.args.get("niveau"):
+            filters["niveau"] = int(request.args["niveau"])
+    except ValueError:
+        return jsonify({"error": "invalid_niveau"}), 400
+    for col in ("stavemoenster", "ordblind_type", "interessekategori"):
+        v = (request.args.get(col) or "").strip()
+        if v:
+            filters[col] = v
+    try:
+        limit = max(1, min(500, int(request.args.get("limit", "50"))))
+    except ValueError:
+        limit = 50
+    try:
+        after = int(request.args.get("after")) if request.args.get("after") else None
+    except ValueError:
+        return jsonify({"error": "invalid_cursor"}), 400
+
+    lex = lexicon_search_db()
+    try:
+        items = search_lexicon(lex, q, match, filters, after, limit)
+    finally:
+        lex.close()
+    next_cursor = items[-1]["id"] if len(items) == limit else None
+    return jsonify({"ok": True, "q": q, "match": match, "filters": filters,
+                    "items": rows_payload(items), "next_cursor": next_cursor})
+
 @app.route("/laesemaskine/api/words")
 def get_words():
     """Return N words filtered by target level and optional bands."""
@@ -325,44 +2565,28 @@ def get_words():
         if resp:
             return resp
 
-        payload = words_cache()
-        words = payload.get("words", [])
-
         try:
             target_level = int(request.args.get("level", "1"))
         except ValueError:
             target_level = 1
-        count = int(request.args.get("count", "20"))
-        band = int(request.args.get("band", "0"))  # 0 = exact, 1 = +/-1, 2 = +/-2 etc.
-
-        def in_band(w):
-            lvl = w.get("niveau")
-            if lvl is None:
-                return False
-            if band <= 0:
-                return lvl == target_level
-            return abs(lvl - target_level) <= band
-
-        pool = [w for w in words if in_band(w)]
-        if len(pool) < count:
-            # fallback: any words with level
-            pool = [w for w in words if w.get("niveau") is not None]
-
-        import random
-        random.shuffle(pool)
-        selected = pool[:count]
-        # trim raw to keep payload small
-        slim = []
-        for w in selected:
-            slim.append({
-                "id": w["id"],
-                "ord": w["ord"],
-                "niveau": w.get("niveau"),
-                "fase": w.get("fase"),
-                "stavemoenster": w.get("stavemoenster"),
-                "ordblind_risiko": w.get("ordblind_risiko"),
-                "interessekategori": w.get("interessekategori"),
-            })
+        try:
+            count = max(0, min(500, int(request.args.get("count", "20"))))
+        except ValueError:
+            count = 20
+        try:
+            band = max(0, min(LEVEL_MAX, int(request.args.get("band", "0"))))  # 0 = exact, 1 = +/-1, 2 = +/-2 etc.
+        except ValueError:
+            band = 0
+        # calibrated=1: pick by empirical difficulty (calibrate_words.py) instead of niveau
+        index = calibrated_index(conn) if request.args.get("calibrated") in ("1", "true") else None
+
+        # reviews=N: at most N due review words (default: LM_REVIEW_SHARE of count)
+        try:
+            n_reviews = max(0, int(request.args.get("reviews", int(count * REVIEW_SHARE))))
+        except ValueError:
+            n_reviews = 0
+
+        slim = mix_reviews(conn, user["id"], target_level, count, band, n_reviews, calibrated=index)
         return jsonify({"ok": True, "level": target_level, "count": len(slim), "words": slim})
     finally:
         conn.close()
@@ -379,13 +2603,38 @@ def session_start():
         if feedback_mode not in ("per_word","after_test"):
             feedback_mode = "per_word"
 
+        # start_level enables the server-side adaptive level for this session;
+        # count > 0 also returns the first words so no /words call is needed.
+        start_level = data.get("start_level")
+        try:
+            start_level = clamp_level(start_level) if start_level is not None else None
+        except (TypeError, ValueError):
+            start_level = None
+        try:
+            count = max(0, min(50, int(data.get("count") or 0)))
+        except (TypeError, ValueError):
+            count = 0
+
         cur = conn.execute(
-            "INSERT INTO lm_sessions (user_id, feedback_mode) VALUES (?,?)",
-            (user["id"], feedback_mode),
+            "INSERT INTO lm_sessions (user_id, feedback_mode, adaptive_level, adaptive_window) VALUES (?,?,?,?)",
+            (user["id"], feedback_mode, start_level, "" if start_level is not None else None),
         )
         conn.commit()
         sid = cur.lastrowid
-        return jsonify({"ok": True, "session_id": sid})
+        out = {"ok": True, "session_id": sid}
+        if start_level is not None:
+            out["level"] = start_level
+            if count:
+                out["words"] = mix_reviews(conn, user["id"], start_level, count, start_band(start_level),
+                                           int(count * REVIEW_SHARE))
+        # reviews=N: clients that pick words from the lexicon shards only need the due review words
+        try:
+            n_reviews = max(0, min(50, int(data.get("reviews") or 0)))
+        except (TypeError, ValueError):
+            n_reviews = 0
+        if n_reviews and not count:
+            out["reviews"] = review_words(conn, user["id"], n_reviews)
+        return jsonify(out)
     finally:
         conn.close()
 
@@ -401,10 +2650,20 @@ def session_answer(sid: int):
         sess = conn.execute("SELECT * FROM lm_sessions WHERE id=? AND user_id=?", (sid, user["id"])).fetchone()
         if not sess:
             return jsonify({"error":"session_not_found"}), 404
+        if sess["ended_at"] is not None:
+            # category counters are bumped once, at finish: later answers would never reach them
+            return jsonify({"error":"session_finished"}), 409
 
         data = request.get_json(force=True, silent=True) or {}
-        word_id = int(data.get("word_id"))
-        expected = (data.get("expected") or "").strip()
+        try:
+            word_id = int(data.get("word_id"))
+        except (TypeError, ValueError):
+            return jsonify({"error": "invalid_word_id"}), 400
+        # words are picked on the client: the expected text comes from words.json, not the request
+        meta = word_meta_by_id(word_id)
+        if meta is None:
+            return jsonify({"error": "unknown_word"}), 400
+        expected = (meta.get("ord") or "").strip()
         recognized = (data.get("recognized") or "").strip()
         response_time_ms = data.get("response_time_ms")
         start_ms = data.get("start_ms")
@@ -436,21 +2695,84 @@ def session_answer(sid: int):
         recognized_n = normalize_text(recognized)
         correct = 1 if (expected_n and expected_n == recognized_n) else 0
 
+        diagnostics = diagnose_v1(expected, recognized)
         cur = conn.execute(
-            "INSERT INTO lm_session_words (session_id, word_id, expected, recognized, correct, response_time_ms, start_ms, end_ms, visible_ms, error_type) VALUES (?,?,?,?,?,?,?,?,?,?)",
-            (sid, word_id, expected, recognized, correct, response_time_ms, start_ms, end_ms, visible_ms, diagnose_v1(expected, recognized).get('error_type')),
+            "INSERT INTO lm_session_words (session_id, word_id, expected, recognized, correct, response_time_ms, start_ms, end_ms, visible_ms, error_type, "
+            "user_id, niveau, interessekategori, stavemoenster, ordblind_type) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+            (sid, word_id, expected, recognized, correct, response_time_ms, start_ms, end_ms, visible_ms, diagnostics.get('error_type'),
+             user["id"]) + word_categories(word_id),
         )
         session_word_id = cur.lastrowid
-# Update totals
-        conn.execute(
-            "UPDATE lm_sessions SET total_words = total_words + 1, correct_total = correct_total + ? WHERE id=?",
-            (correct, sid),
-        )
+        review_change = review_record(conn, user["id"], word_id, bool(correct))
+        # Update totals + server-side adaptive level
+        adaptive = {}
+        if sess["adaptive_level"] is not None:
+            old_level = int(sess["adaptive_level"])
+            new_level, window = adaptive_step(old_level, sess["adaptive_window"] or "", bool(correct))
+            cur = conn.execute(
+                "UPDATE lm_sessions SET total_words = total_words + 1, correct_total = correct_total + ?, "
+                "adaptive_level=?, adaptive_window=? WHERE id=? AND ended_at IS NULL",
+                (correct, new_level, window, sid),
+            )
+            adaptive = {"level": new_level, "level_changed": new_level != old_level}
+            # client tells how many words it still needs; refill at the new level
+            try:
+                remaining = max(0, min(50, int(data.get("remaining") or 0)))
+            except (TypeError, ValueError):
+                remaining = 0
+            if new_level != old_level and remaining:
+                seen = {int(r["word_id"]) for r in conn.execute(
+                    "SELECT word_id FROM lm_session_words WHERE session_id=?", (sid,)
+                )}
+                adaptive["next_words"] = pick_words(new_level, remaining, 1, exclude=seen)
+        else:
+            cur = conn.execute(
+                "UPDATE lm_sessions SET total_words = total_words + 1, correct_total = correct_total + ? "
+                "WHERE id=? AND ended_at IS NULL",
+                (correct, sid),
+            )
+        if cur.rowcount == 0:  # finished by a concurrent /finish since the check above
+            conn.rollback()
+            return jsonify({"error":"session_finished"}), 409
         conn.commit()
-        return jsonify({"ok": True, "session_word_id": session_word_id, "correct": bool(correct), "diagnostics": diagnose_v1(expected, recognized), "error_type": diagnose_v1(expected, recognized).get("error_type"), "normalized": {"expected": expected_n, "recognized": recognized_n}})
+        review_cache_apply(user["id"], review_change)  # only once the database has it
+        return jsonify({"ok": True, "session_word_id": session_word_id, "correct": bool(correct), "diagnostics": diagnostics, "error_type": diagnostics.get("error_type"), "normalized": {"expected": expected_n, "recognized": recognized_n}, **adaptive})
     finally:
         conn.close()
 
+def session_totals(conn: sqlite3.Connection, sess) -> Tuple[int, int, Dict[int, Dict[str, float]]]:
+    """(total, correct, per-level stats) of a session, from its lm_sessions row and answers."""
+    sid = int(sess["id"])
+    total = int(sess["total_words"])
+    correct = int(sess["correct_total"])
+    # If finish called before any answers, recompute live
+    if total == 0:
+        totals = conn.execute(
+            "SELECT COUNT(*) AS total, SUM(correct) AS correct FROM lm_session_words WHERE session_id=?",
+            (sid,),
+        ).fetchone()
+        total = int(totals["total"] or 0)
+        correct = int(totals["correct"] or 0)
+    return total, correct, session_level_stats(conn, "sw.session_id=?", (sid,)).get(sid, {})
+
+def finished_session_summary(conn: sqlite3.Connection, sess) -> Dict[str, Any]:
+    """The result session_finish returned for an already finished session, recomputed
+    read-only (answers are refused after finish, so the inputs have not changed)."""
+    total, correct, per_level = session_totals(conn, sess)
+    estimated_level = sess["estimated_level"]
+    session_score, acc_all, speed_all = session_scores(per_level, total, correct)
+    return {
+        "id": int(sess["id"]),
+        "estimated_level": estimated_level,
+        "correct_total": correct,
+        "total_words": total,
+        # only the MVP value for the estimated level; the scratch dict is discarded
+        "mastery_1_10": apply_session_mastery({}, estimated_level, total, correct, {}),
+        "session_score": session_score,
+        "accuracy": acc_all,
+        "speed": speed_all,
+    }
+
 @app.route("/laesemaskine/api/sessions/<int:sid>/finish", methods=["POST"])
 def session_finish(sid: int):
     conn = get_db()
@@ -463,97 +2785,52 @@ def session_finish(sid: int):
         if not sess:
             return jsonify({"error":"session_not_found"}), 404
 
+        if sess["ended_at"] is not None:
+            # finished before (retry, double click): report it again, change nothing
+            return jsonify({"ok": True, "session": finished_session_summary(conn, sess)})
+
         data = request.get_json(force=True, silent=True) or {}
         estimated_level = data.get("estimated_level")
         try:
             estimated_level = int(estimated_level) if estimated_level is not None else None
         except ValueError:
             estimated_level = None
+        # sessions started with start_level: the server's level is authoritative
+        if sess["adaptive_level"] is not None:
+            estimated_level = int(sess["adaptive_level"])
 
-        conn.execute(
-            "UPDATE lm_sessions SET ended_at=datetime('now'), estimated_level=? WHERE id=?",
+        cur = conn.execute(
+            "UPDATE lm_sessions SET ended_at=datetime('now'), estimated_level=? WHERE id=? AND ended_at IS NULL",
             (estimated_level, sid),
         )
+        if cur.rowcount == 0:  # a concurrent finish got there first
+            conn.rollback()
+            sess = conn.execute("SELECT * FROM lm_sessions WHERE id=?", (sid,)).fetchone()
+            return jsonify({"ok": True, "session": finished_session_summary(conn, sess)})
 
         # Update mastery for the estimated level: simple MVP formula
-        total = int(sess["total_words"])
-        correct = int(sess["correct_total"])
-        # If finish called before any answers, recompute live
-        if total == 0:
-            totals = conn.execute(
-                "SELECT COUNT(*) AS total, SUM(correct) AS correct FROM lm_session_words WHERE session_id=?",
-                (sid,),
-            ).fetchone()
-            total = int(totals["total"] or 0)
-            correct = int(totals["correct"] or 0)
-        mastery = None
-        if estimated_level is not None and total > 0:
-            mastery = max(1, min(10, int(round((correct / total) * 10))))
-            conn.execute(
-                "INSERT INTO lm_mastery (user_id, level, mastery_1_10) VALUES (?,?,?) "
-                "ON CONFLICT(user_id, level) DO UPDATE SET mastery_1_10=excluded.mastery_1_10, updated_at=datetime('now')",
-                (user["id"], estimated_level, mastery),
-            )
-
-
         # --- v0.2.1.2.2: per-level mastery + speed-aware score ---
-        try:
-            rows = conn.execute(
-                "SELECT word_id, correct, response_time_ms, visible_ms FROM lm_session_words WHERE session_id=?",
-                (sid,),
-            ).fetchall()
-            per_level = {}
-            for r in rows:
-                wm = word_meta_by_id(int(r["word_id"])) or {}
-                lvl = int(wm.get("niveau") or (estimated_level or 1))
-                st = per_level.get(lvl) or {"total":0,"correct":0,"speedSum":0.0,"speedCount":0}
-                st["total"] += 1
-                if int(r["correct"] or 0)==1:
-                    st["correct"] += 1
-                    vms = r["visible_ms"]
-                    rt = r["response_time_ms"]
-                    if vms and rt is not None:
-                        try:
-                            vms = float(vms); rt=float(rt)
-                            speedNorm = max(0.0, min(1.0, 1.0 - (rt / vms)))
-                            st["speedSum"] += speedNorm
-                            st["speedCount"] += 1
-                        except Exception:
-                            pass
-                per_level[lvl]=st
-
-            # compute session metrics
-            acc_all = (correct / total) if total else 0.0
-            speed_all_list = []
-            for lvl, st in per_level.items():
-                if st["speedCount"]>0:
-                    speed_all_list.append(st["speedSum"]/st["speedCount"])
-            speed_all = (sum(speed_all_list)/len(speed_all_list)) if speed_all_list else 0.5
-            session_score = round(((0.7*acc_all + 0.3*speed_all) * 100), 1)
-
-            # update mastery per level with smoothing
-            for lvl, st in per_level.items():
-                if st["total"] <= 0:
-                    continue
-                acc = st["correct"]/st["total"]
-                sp = (st["speedSum"]/st["speedCount"]) if st["speedCount"]>0 else 0.5
-                prof = 0.7*acc + 0.3*sp
-                m_new = max(1, min(10, int(round(prof*10))))
-                old_row = conn.execute("SELECT mastery_1_10 FROM lm_mastery WHERE user_id=? AND level=?", (user["id"], lvl)).fetchone()
-                if old_row:
-                    old = int(old_row["mastery_1_10"] or 5)
-                    m_final = max(1, min(10, int(round(0.7*old + 0.3*m_new))))
-                else:
-                    m_final = m_new
-                conn.execute(
-                    "INSERT INTO lm_mastery (user_id, level, mastery_1_10) VALUES (?,?,?) "
-                    "ON CONFLICT(user_id, level) DO UPDATE SET mastery_1_10=excluded.mastery_1_10, updated_at=datetime('now')",
-                    (user["id"], lvl, m_final),
-                )
-        except Exception:
-            session_score = None
-            acc_all = None
-            speed_all = None
+        total, correct, per_level = session_totals(conn, sess)
+        levels = set(per_level) | ({estimated_level} if estimated_level is not None else set())
+        current: Dict[int, int] = {}
+        for lvl in levels:
+            old_row = conn.execute("SELECT mastery_1_10 FROM lm_mastery WHERE user_id=? AND level=?", (user["id"], lvl)).fetchone()
+            if old_row:
+                current[lvl] = int(old_row["mastery_1_10"] or 5)
+        mastery = apply_session_mastery(current, estimated_level, total, correct, per_level)
+        conn.executemany(
+            "INSERT INTO lm_mastery (user_id, level, mastery_1_10) VALUES (?,?,?) "
+            "ON CONFLICT(user_id, level) DO UPDATE SET mastery_1_10=excluded.mastery_1_10, updated_at=datetime('now')",
+            [(user["id"], lvl, m) for lvl, m in current.items() if lvl in levels],
+        )
+        session_score, acc_all, speed_all = session_scores(per_level, total, correct)
+
+        # category counters + progress rollups
+        bump_category_counters(conn, user["id"], conn.execute(
+            "SELECT word_id, correct, created_at FROM lm_session_words WHERE session_id=?", (sid,)
+        ).fetchall())
+        ended_at = conn.execute("SELECT ended_at FROM lm_sessions WHERE id=?", (sid,)).fetchone()["ended_at"]
+        bump_progress_rollups(conn, user["id"], ended_at, estimated_level, total, correct, session_score, speed_all)
         conn.commit()
         return jsonify({
             "ok": True,
@@ -623,12 +2900,8 @@ def upload_session_audio(sid: int):
         mime = (request.form.get("mime") or f.mimetype or "").strip() or None
 
         ext = os.path.splitext(f.filename)[1].lower()
-        if ext not in (".webm",".wav",".ogg",".mp3",".m4a"):
-            ext = ".webm"
-        fname = f"session_{sid}_{uuid.uuid4().hex}{ext}"
-        save_path = UPLOAD_DIR / fname
-        f.save(save_path)
-        audio_rel = f"uploads/{fname}"
+        audio_rel = store_audio(conn, f, ext)
+        audio_unref(conn, sess["session_audio_path"])
 
         conn.execute(
             "UPDATE lm_sessions SET session_audio_path=?, session_audio_mime=?, session_audio_uploaded_at=datetime('now') WHERE id=?",
@@ -657,11 +2930,11 @@ def session_detail(sid: int):
         if user["role"] != "admin" and sess["user_id"] != user["id"]:
             return jsonify({"error":"forbidden"}), 403
 
-        items = conn.execute(
+        items = conn.execute(hot_query(
+            "session_words",
             "SELECT id AS session_word_id, word_id, expected, recognized, correct, response_time_ms, visible_ms, created_at, start_ms, end_ms, error_type "
             "FROM lm_session_words WHERE session_id=? ORDER BY id ASC",
-            (sid,),
-        ).fetchall()
+        ), (sid,)).fetchall()
 
         enriched = []
         for it in items:
@@ -697,7 +2970,7 @@ def session_detail(sid: int):
                 "total_words": sess["total_words"],
                 "feedback_mode": sess["feedback_mode"],
             },
-            "items": enriched,
+            "items": rows_payload(enriched),
         })
     finally:
         conn.close()
@@ -710,12 +2983,35 @@ def my_sessions():
         user, resp = require_login(conn)
         if resp:
             return resp
-        rows = conn.execute(
+        rows = conn.execute(hot_query(
+            "my_sessions",
             "SELECT id, started_at, ended_at, estimated_level, correct_total, total_words "
             "FROM lm_sessions WHERE user_id=? AND ended_at IS NOT NULL ORDER BY ended_at DESC LIMIT 25",
-            (user["id"],),
-        ).fetchall()
-        return jsonify({"ok": True, "sessions": [dict(r) for r in rows]})
+        ), (user["id"],)).fetchall()
+        return jsonify({"ok": True, "sessions": rows_payload([dict(r) for r in rows])})
+    finally:
+        conn.close()
+
+@app.route("/laesemaskine/api/me/progress")
+def my_progress():
+    """Level, accuracy and speed over time for the current user (downsampled rollups)."""
+    conn = get_db()
+    try:
+        user, resp = require_login(conn)
+        if resp:
+            return resp
+        return progress_response(conn, user["id"])
+    finally:
+        conn.close()
+
+@app.route("/laesemaskine/api/admin/student/<int:uid>/progress")
+def admin_student_progress(uid: int):
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+        return progress_response(conn, uid)
     finally:
         conn.close()
 
@@ -727,35 +3023,14 @@ def admin_student_difficulty(uid: int):
         admin, resp = require_admin(conn)
         if resp:
             return resp
+        conn, as_of = analytics_db(conn)
 
-        # fetch all session words for student
-        rows = conn.execute(
-            "SELECT word_id, correct FROM lm_session_words sw "
-            "JOIN lm_sessions s ON s.id=sw.session_id "
-            "WHERE s.user_id=? AND s.ended_at IS NOT NULL",
-            (uid,),
-        ).fetchall()
-
-        # aggregate in python using word meta
-        by_cat = {}
-        by_pattern = {}
-        by_obtype = {}
-
-        def add(d, key, correct):
-            if not key:
-                key = "Ukendt"
-            v = d.get(key, {"total":0, "wrong":0})
-            v["total"] += 1
-            if not correct:
-                v["wrong"] += 1
-            d[key] = v
-
-        for r in rows:
-            meta = word_meta_by_id(int(r["word_id"])) or {}
-            correct = bool(r["correct"])
-            add(by_cat, meta.get("interessekategori"), correct)
-            add(by_pattern, meta.get("stavemoenster"), correct)
-            add(by_obtype, meta.get("ordblind_type"), correct)
+        by_dim: Dict[str, Dict[str, Dict[str, int]]] = {d: {} for d in COUNTER_DIMENSIONS}
+        for r in conn.execute(hot_query(
+            "student_difficulty", "SELECT dimension, key, total, wrong FROM lm_category_counters WHERE user_id=?"
+        ), (uid,)):
+            if r["dimension"] in by_dim:
+                by_dim[r["dimension"]][r["key"]] = {"total": r["total"], "wrong": r["wrong"]}
 
         def finalize(d):
             out = []
@@ -770,9 +3045,10 @@ def admin_student_difficulty(uid: int):
         return jsonify({
             "ok": True,
             "user_id": uid,
-            "by_interessekategori": finalize(by_cat),
-            "by_stavemoenster": finalize(by_pattern),
-            "by_ordblind_type": finalize(by_obtype),
+            "as_of": as_of,
+            "by_interessekategori": finalize(by_dim["interessekategori"]),
+            "by_stavemoenster": finalize(by_dim["stavemoenster"]),
+            "by_ordblind_type": finalize(by_dim["ordblind_type"]),
         })
     finally:
         conn.close()
@@ -828,16 +3104,12 @@ def create_dispute():
             f = request.files.get("audio")
             if f and f.filename:
                 ext = os.path.splitext(f.filename)[1].lower()
-                if ext not in (".webm", ".wav", ".ogg", ".mp3", ".m4a"):
-                    ext = ".webm"
-                fname = f"dispute_{session_word_id}_{uuid.uuid4().hex}{ext}"
-                save_path = UPLOAD_DIR / fname
-                f.save(save_path)
-                audio_rel = f"uploads/{fname}"
+                audio_rel = store_audio(conn, f, ext)
 
         # Fallback: link to session audio if available
         if not audio_rel and sw["session_audio_path"]:
             audio_rel = sw["session_audio_path"]
+            audio_ref(conn, audio_rel)
 
         cur = conn.execute(
             "INSERT INTO lm_disputes (session_word_id, session_id, student_user_id, expected, recognized, note, audio_path, error_type) "
@@ -858,16 +3130,36 @@ def admin_list_disputes():
         admin, resp = require_admin(conn)
         if resp:
             return resp
-        rows = conn.execute(
+        rows = conn.execute(hot_query(
+            "admin_disputes",
             "SELECT d.id, d.status, d.created_at, d.note, d.audio_path, "
             "u.username AS student, u.display_name AS student_name, d.expected, d.recognized, d.session_word_id, d.session_id "
             "FROM lm_disputes d JOIN lm_users u ON u.id=d.student_user_id "
             "ORDER BY d.created_at DESC LIMIT 200"
-        ).fetchall()
-        return jsonify({"ok": True, "disputes": [dict(r) for r in rows]})
+        )).fetchall()
+        return jsonify({"ok": True, "disputes": rows_payload([dict(r) for r in rows])})
     finally:
         conn.close()
 
+def enqueue_ai(conn: sqlite3.Connection, did: int) -> Optional[int]:
+    """Queue an approved dispute's audio for AI training (once per dispute)."""
+    row = conn.execute(
+        "SELECT id, audio_path, expected, recognized, error_type FROM lm_disputes WHERE id=?", (did,)
+    ).fetchone()
+    if not row or not row["audio_path"]:
+        return None
+    existing = conn.execute(
+        "SELECT id FROM lm_ai_queue WHERE dispute_id=? AND status='queued'", (did,)
+    ).fetchone()
+    if existing:
+        return int(existing["id"])
+    cur = conn.execute(
+        "INSERT INTO lm_ai_queue (dispute_id, audio_path, expected, recognized, error_type) VALUES (?,?,?,?,?)",
+        (did, row["audio_path"], row["expected"], row["recognized"], row["error_type"]),
+    )
+    audio_ref(conn, row["audio_path"])
+    return cur.lastrowid
+
 @app.route("/laesemaskine/api/admin/disputes/<int:did>", methods=["PATCH"])
 def admin_review_dispute(did: int):
     conn = get_db()
@@ -883,13 +3175,9 @@ def admin_review_dispute(did: int):
             "UPDATE lm_disputes SET status=?, reviewed_by=?, reviewed_at=datetime('now') WHERE id=?",
             (status, admin["id"], did),
         )
-        row2 = conn.execute("SELECT id, audio_path, expected, recognized, error_type FROM lm_disputes WHERE id=?", (did,)).fetchone()
         # Only enqueue if explicitly approved here (optional; main flow uses /send_to_ai)
-        if status == 'approved' and row2 and row2["audio_path"]:
-            conn.execute(
-                "INSERT INTO lm_ai_queue (dispute_id, audio_path, expected, recognized, error_type) VALUES (?,?,?,?,?)",
-                (did, row2["audio_path"], row2["expected"], row2["recognized"], row2["error_type"]),
-            )
+        if status == 'approved':
+            enqueue_ai(conn, did)
         conn.commit()
         return jsonify({"ok": True})
     finally:
@@ -907,23 +3195,10 @@ def admin_delete_dispute_audio(did: int):
         row = conn.execute("SELECT audio_path FROM lm_disputes WHERE id=?", (did,)).fetchone()
         if not row:
             return jsonify({"error":"not_found"}), 404
-        audio_path = row["audio_path"]
-        if audio_path:
-            try:
-                fname = audio_path.split("/", 1)[1] if "/" in audio_path else audio_path
-                fpath = UPLOAD_DIR / fname
-                if fpath.exists():
-                    fpath.unlink()
-            except Exception:
-                pass
+        # Other disputes (or the session itself) may share this file; the
+        # sweeper deletes it once the last reference is gone.
+        audio_unref(conn, row["audio_path"])
         conn.execute("UPDATE lm_disputes SET audio_path=NULL WHERE id=?", (did,))
-        row2 = conn.execute("SELECT id, audio_path, expected, recognized, error_type FROM lm_disputes WHERE id=?", (did,)).fetchone()
-        # Only enqueue if explicitly approved here (optional; main flow uses /send_to_ai)
-        if status == 'approved' and row2 and row2["audio_path"]:
-            conn.execute(
-                "INSERT INTO lm_ai_queue (dispute_id, audio_path, expected, recognized, error_type) VALUES (?,?,?,?,?)",
-                (did, row2["audio_path"], row2["expected"], row2["recognized"], row2["error_type"]),
-            )
         conn.commit()
         return jsonify({"ok": True})
     finally:
@@ -932,8 +3207,8 @@ def admin_delete_dispute_audio(did: int):
 
 @app.route("/laesemaskine/api/admin/disputes/<int:did>/send_to_ai", methods=["POST"])
 def admin_send_dispute_to_ai(did: int):
-    # MVP stub: mark as approved and "queued" for AI training.
-    # Real implementation would enqueue a job with audio + expected word.
+    # Mark as approved and queue audio + expected word for AI training.
+    # export_ai_queue.py packs queued rows into training shards.
     conn = get_db()
     try:
         admin, resp = require_admin(conn)
@@ -948,22 +3223,16 @@ def admin_send_dispute_to_ai(did: int):
             "UPDATE lm_disputes SET status='approved', error_type=COALESCE(?, error_type), reviewed_by=?, reviewed_at=datetime('now') WHERE id=?",
             (sel_error_type, admin["id"], did),
         )
-        row2 = conn.execute("SELECT id, audio_path, expected, recognized, error_type FROM lm_disputes WHERE id=?", (did,)).fetchone()
-        # Only enqueue if explicitly approved here (optional; main flow uses /send_to_ai)
-        if status == 'approved' and row2 and row2["audio_path"]:
-            conn.execute(
-                "INSERT INTO lm_ai_queue (dispute_id, audio_path, expected, recognized, error_type) VALUES (?,?,?,?,?)",
-                (did, row2["audio_path"], row2["expected"], row2["recognized"], row2["error_type"]),
-            )
+        queue_id = enqueue_ai(conn, did)
         conn.commit()
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "queue_id": queue_id})
     finally:
         conn.close()
 
 @app.route("/laesemaskine/uploads/<path:filename>")
 def serve_upload(filename: str):
     # simple static serving for admin review (lock down in real deployment)
-    return send_from_directory(str(UPLOAD_DIR), filename)
+    return send_from_directory(str(upload_dir()), filename)
 
 
 @app.route("/laesemaskine/api/admin/student/<int:uid>/drilldown")
@@ -974,6 +3243,7 @@ def admin_student_drilldown(uid: int):
         admin, resp = require_admin(conn)
         if resp:
             return resp
+        conn, as_of = analytics_db(conn)
 
         group = (request.args.get("group") or "").strip()
         key = (request.args.get("key") or "").strip()
@@ -982,22 +3252,34 @@ def admin_student_drilldown(uid: int):
         if not key:
             return jsonify({"error": "missing_key"}), 400
 
-        rows = conn.execute(
-            "SELECT sw.word_id, sw.expected, sw.recognized, sw.correct, sw.response_time_ms, sw.created_at, sw.session_id "
+        try:
+            limit = max(1, min(500, int(request.args.get("limit", "300"))))
+        except ValueError:
+            limit = 300
+        try:
+            before = int(request.args.get("before")) if request.args.get("before") else None
+        except ValueError:
+            return jsonify({"error": "invalid_cursor"}), 400
+
+        # group is whitelisted above; (user_id, <group>, id) is indexed
+        sql = (
+            "SELECT sw.id, sw.word_id, sw.expected, sw.recognized, sw.correct, sw.response_time_ms, sw.created_at, sw.session_id, sw.niveau "
             "FROM lm_session_words sw "
             "JOIN lm_sessions s ON s.id=sw.session_id "
-            "WHERE s.user_id=? AND s.ended_at IS NOT NULL "
-            "ORDER BY sw.created_at DESC LIMIT 300",
-            (uid,),
-        ).fetchall()
+            f"WHERE sw.user_id=? AND sw.{group}=? AND s.ended_at IS NOT NULL"
+        )
+        params: list = [uid, key]
+        if before is not None:
+            sql += " AND sw.id < ?"
+            params.append(before)
+        sql += " ORDER BY sw.id DESC LIMIT ?"
+        params.append(limit)
+        rows = conn.execute(hot_query("student_drilldown", sql), params).fetchall()
 
         out = []
         for r in rows:
-            meta = word_meta_by_id(int(r["word_id"])) or {}
-            val = meta.get(group) or "Ukendt"
-            if val != key:
-                continue
             out.append({
+                "session_word_id": r["id"],
                 "word_id": r["word_id"],
                 "expected": r["expected"],
                 "recognized": r["recognized"],
@@ -1005,11 +3287,13 @@ def admin_student_drilldown(uid: int):
                 "response_time_ms": r["response_time_ms"],
                 "timestamp": r["created_at"],
                 "session_id": r["session_id"],
-                "niveau": meta.get("niveau"),
+                "niveau": r["niveau"],
             })
+        next_cursor = out[-1]["session_word_id"] if len(out) == limit else None
 
-        # newest first
-        return jsonify({"ok": True, "group": group, "key": key, "items": out})
+        # newest first; pass next_cursor as ?before= for the next page
+        return jsonify({"ok": True, "group": group, "key": key, "items": rows_payload(out), "next_cursor": next_cursor,
+                        "as_of": as_of})
     finally:
         conn.close()
 
@@ -1028,6 +3312,7 @@ def admin_groups():
             if not name:
                 return jsonify({"error":"missing_name"}), 400
             cur = conn.execute("INSERT INTO lm_groups (name) VALUES (?)", (name,))
+            catalog_add(group_ids=[cur.lastrowid])
             conn.commit()
             return jsonify({"ok": True, "group": {"id": cur.lastrowid, "name": name}})
         groups = conn.execute("SELECT * FROM lm_groups ORDER BY created_at DESC").fetchall()
@@ -1073,8 +3358,11 @@ def admin_users():
             password = (data.get("password") or "").strip()
             group_id = data.get("group_id")
             display_name = (data.get("display_name") or "").strip() or None
+            role = (data.get("role") or "elev").strip()  # "admin": another teacher at this school
             if not username or not password:
                 return jsonify({"error":"missing_username_or_password"}), 400
+            if role not in ("elev", "admin"):
+                return jsonify({"error":"invalid_role"}), 400
             if group_id is not None:
                 try:
                     group_id = int(group_id)
@@ -1082,12 +3370,14 @@ def admin_users():
                     group_id = None
             pw_hash = generate_password_hash(password)
             try:
-                conn.execute(
+                uid = conn.execute(
                     "INSERT INTO lm_users (username, password_hash, role, group_id, display_name) VALUES (?,?,?,?,?)",
-                    (username, pw_hash, "elev", group_id, display_name),
-                )
+                    (username, pw_hash, role, group_id, display_name),
+                ).lastrowid
+                catalog_add(users=[(uid, username)])
                 conn.commit()
             except sqlite3.IntegrityError:
+                conn.rollback()
                 return jsonify({"error":"username_taken"}), 409
             return jsonify({"ok": True})
         # list users
@@ -1095,7 +3385,38 @@ def admin_users():
             "SELECT u.id, u.username, u.role, u.group_id, u.display_name, g.name AS group_name, u.created_at "
             "FROM lm_users u LEFT JOIN lm_groups g ON g.id=u.group_id ORDER BY u.created_at DESC"
         ).fetchall()
-        return jsonify({"ok": True, "users": [dict(u) for u in users]})
+        return jsonify({"ok": True, "users": rows_payload([dict(u) for u in users])})
+    finally:
+        conn.close()
+
+@app.route("/laesemaskine/api/admin/users/import", methods=["POST"])
+def admin_users_import():
+    """Create many student accounts from a CSV or JSON roster.
+
+    Accepts:
+      - JSON: {"users": [{username, password, display_name, group | group_id}, ...]}
+      - text/csv body, or multipart/form-data with a `file` field (CSV with header)
+    Groups given by name are created if missing.
+    """
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+        text = None
+        if request.content_type and request.content_type.startswith("multipart/form-data"):
+            f = request.files.get("file")
+            if not f:
+                return jsonify({"error": "missing_file"}), 400
+            text = f.read().decode("utf-8", errors="replace")
+        elif request.content_type and request.content_type.startswith("text/csv"):
+            text = request.get_data(as_text=True)
+        rows = parse_roster(request.get_json(force=True, silent=True) if text is None else None, text)
+        if not rows:
+            return jsonify({"error": "empty_roster"}), 400
+        if len(rows) > ROSTER_MAX_ROWS:
+            return jsonify({"error": "too_many_rows", "max": ROSTER_MAX_ROWS}), 400
+        return jsonify({"ok": True, **import_roster(conn, rows)})
     finally:
         conn.close()
 
@@ -1106,18 +3427,333 @@ def admin_overview():
         admin, resp = require_admin(conn)
         if resp:
             return resp
+        conn, as_of = analytics_db(conn)
 
         # per user current estimated level (last session)
-        rows = conn.execute(
+        # every student is listed, so scanning lm_users (u) is expected
+        rows = conn.execute(hot_query(
+            "admin_overview",
             "SELECT u.id, u.username, u.display_name, g.name AS group_name, "
             "(SELECT estimated_level FROM lm_sessions s WHERE s.user_id=u.id AND s.ended_at IS NOT NULL ORDER BY s.ended_at DESC LIMIT 1) AS last_level, "
             "(SELECT mastery_1_10 FROM lm_mastery m WHERE m.user_id=u.id AND m.level = (SELECT estimated_level FROM lm_sessions s2 WHERE s2.user_id=u.id AND s2.ended_at IS NOT NULL ORDER BY s2.ended_at DESC LIMIT 1) LIMIT 1) AS last_mastery "
             "FROM lm_users u LEFT JOIN lm_groups g ON g.id=u.group_id "
-            "WHERE u.role='elev' ORDER BY u.created_at DESC"
-        ).fetchall()
-        return jsonify({"ok": True, "students": [dict(r) for r in rows]})
+            "WHERE u.role='elev' ORDER BY u.created_at DESC",
+            allow_scan=("u",),
+        )).fetchall()
+        return jsonify({"ok": True, "as_of": as_of, "students": rows_payload([dict(r) for r in rows])})
+    finally:
+        conn.close()
+
+@app.route("/laesemaskine/api/admin/profiling", methods=["GET", "PUT"])
+def admin_profiling():
+    """Show or change the sampling profiler settings; lists the stored profiles.
+
+    PUT {"rate": 0.05, "routes": {"/laesemaskine/api/admin/overview": 1.0}, "keep": 50}
+    (fields left out keep their current value; {"reset": true} goes back to the env defaults).
+    """
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+    finally:
+        conn.close()
+    if request.method == "PUT":
+        data = request.get_json(force=True, silent=True) or {}
+        path = PROFILE_DIR / "profiling.json"
+        if data.get("reset"):
+            path.unlink(missing_ok=True)
+        else:
+            cfg = dict(profile_config())
+            try:
+                if "rate" in data:
+                    cfg["rate"] = max(0.0, min(1.0, float(data["rate"])))
+                if "routes" in data:
+                    cfg["routes"] = {str(k): max(0.0, min(1.0, float(v))) for k, v in (data["routes"] or {}).items()}
+                if "keep" in data:
+                    cfg["keep"] = max(1, int(data["keep"]))
+            except (TypeError, ValueError, AttributeError):
+                return jsonify({"error": "invalid_config"}), 400
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+            tmp.write_text(json.dumps(cfg), encoding="utf-8")
+            os.replace(tmp, path)
+        PROFILE_STATE["checked"] = 0.0  # apply in this worker right away
+    dumps = sorted(PROFILE_DIR.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True) if PROFILE_DIR.exists() else []
+    return jsonify({
+        "ok": True,
+        "config": profile_config(),
+        "profiles": [{"name": p.stem, "bytes": p.stat().st_size} for p in dumps],
+    })
+
+@app.route("/laesemaskine/api/admin/profiling/<name>.<ext>")
+def admin_profiling_download(name: str, ext: str):
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+    finally:
+        conn.close()
+    if ext not in ("prof", "collapsed") or not re.fullmatch(r"[A-Za-z0-9_.-]+", name):
+        return jsonify({"error": "not_found"}), 404
+    return send_from_directory(str(PROFILE_DIR), f"{name}.{ext}", as_attachment=True)
+
+# --- Group analytics (error_type x niveau, stavemoenster x niveau, speed) ---
+SPEED_BUCKET_MS = 250
+SPEED_BUCKETS = 40  # last bucket collects everything >= 10 s
+GROUP_ANALYTICS_CACHE: Dict[int, Tuple[Tuple[Any, ...], Dict[str, Any]]] = {}
+GROUP_ANALYTICS_LOCK = threading.Lock()
+
+def _group_answer_stamp(conn: sqlite3.Connection, gid: int) -> Tuple[Any, ...]:
+    """Changes whenever a group member answers or membership changes (index lookups only)."""
+    r = conn.execute(hot_query(
+        "group_answer_stamp",
+        "SELECT COUNT(*) AS n, COALESCE(SUM(u.id), 0) AS ids, "
+        "MAX((SELECT MAX(sw.id) FROM lm_session_words sw WHERE sw.user_id=u.id)) AS last_sw, "
+        "SUM((SELECT COUNT(*) FROM lm_sessions s WHERE s.user_id=u.id AND s.ended_at IS NOT NULL)) AS finished "
+        "FROM lm_users u WHERE u.group_id=? AND u.role='elev'",
+    ), (gid,)).fetchone()
+    return (r["n"], r["ids"], r["last_sw"], r["finished"])
+
+def _matrix(rows, row_key: str, levels: list) -> Dict[str, Any]:
+    col = {lvl: i for i, lvl in enumerate(levels)}
+    keys = sorted({r[row_key] for r in rows}, key=lambda k: (k is None, str(k)))
+    idx = {k: i for i, k in enumerate(keys)}
+    counts = [[0] * len(levels) for _ in keys]
+    wrong = [[0] * len(levels) for _ in keys]
+    for r in rows:
+        counts[idx[r[row_key]]][col[r["niveau"]]] = r["n"]
+        wrong[idx[r[row_key]]][col[r["niveau"]]] = r["wrong"]
+    return {"rows": [k if k is not None else "Ukendt" for k in keys], "levels": levels, "total": counts, "wrong": wrong}
+
+def _hist_quantile(hist: list, q: float) -> Optional[int]:
+    n = sum(hist)
+    if n == 0:
+        return None
+    target = q * n
+    acc = 0
+    for i, c in enumerate(hist):
+        acc += c
+        if acc >= target:
+            return (i + 1) * SPEED_BUCKET_MS  # upper edge of the bucket
+    return len(hist) * SPEED_BUCKET_MS
+
+def compute_group_analytics(conn: sqlite3.Connection, gid: int) -> Dict[str, Any]:
+    """Aggregate every answer of a group's students with GROUP BY queries (no per-row Python).
+
+    Like the per-student difficulty view, only answers in finished sessions count.
+    """
+    members = (
+        "sw.user_id IN (SELECT id FROM lm_users WHERE group_id=? AND role='elev') AND sw.niveau IS NOT NULL "
+        "AND s.ended_at IS NOT NULL"
+    )
+    err_rows = conn.execute(hot_query(
+        "group_errors",
+        "SELECT sw.niveau, CASE WHEN sw.correct=1 THEN 'correct' ELSE COALESCE(sw.error_type, 'no_speech') END AS error_type, "
+        "COUNT(*) AS n, SUM(1-sw.correct) AS wrong "
+        f"FROM lm_session_words sw JOIN lm_sessions s ON s.id=sw.session_id WHERE {members} GROUP BY 1, 2",
+    ), (gid,)).fetchall()
+    pat_rows = conn.execute(hot_query(
+        "group_patterns",
+        "SELECT sw.niveau, sw.stavemoenster, COUNT(*) AS n, SUM(1-sw.correct) AS wrong "
+        f"FROM lm_session_words sw JOIN lm_sessions s ON s.id=sw.session_id WHERE {members} GROUP BY 1, 2",
+    ), (gid,)).fetchall()
+    speed_rows = conn.execute(hot_query(
+        "group_speed",
+        f"SELECT sw.niveau, MIN(sw.response_time_ms / {SPEED_BUCKET_MS}, {SPEED_BUCKETS - 1}) AS bucket, COUNT(*) AS n "
+        f"FROM lm_session_words sw JOIN lm_sessions s ON s.id=sw.session_id WHERE {members} "
+        "AND sw.correct=1 AND sw.response_time_ms IS NOT NULL AND sw.response_time_ms >= 0 GROUP BY 1, 2",
+    ), (gid,)).fetchall()
+
+    levels = sorted({r["niveau"] for r in err_rows})
+    col = {lvl: i for i, lvl in enumerate(levels)}
+    hist = [[0] * SPEED_BUCKETS for _ in levels]
+    for r in speed_rows:
+        if r["niveau"] in col:
+            hist[col[r["niveau"]]][int(r["bucket"])] = r["n"]
+    overall = [sum(h[b] for h in hist) for b in range(SPEED_BUCKETS)]
+    return {
+        "error_type_by_level": _matrix(err_rows, "error_type", levels),
+        "stavemoenster_by_level": _matrix(pat_rows, "stavemoenster", levels),
+        "speed": {
+            "bucket_ms": SPEED_BUCKET_MS,
+            "levels": levels,
+            "histogram_by_level": hist,
+            "histogram": overall,
+            "p50_ms_by_level": [_hist_quantile(h, 0.5) for h in hist],
+            "p90_ms_by_level": [_hist_quantile(h, 0.9) for h in hist],
+            "p50_ms": _hist_quantile(overall, 0.5),
+            "p90_ms": _hist_quantile(overall, 0.9),
+        },
+    }
+
+@app.route("/laesemaskine/api/admin/groups/<int:gid>/analytics")
+def admin_group_analytics(gid: int):
+    """Heatmaps and speed distributions for a whole group, cached until a member answers."""
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
+        if not conn.execute("SELECT 1 FROM lm_groups WHERE id=?", (gid,)).fetchone():
+            return jsonify({"error": "group_not_found"}), 404
+        conn, as_of = analytics_db(conn)
+
+        stamp = _group_answer_stamp(conn, gid)
+        with GROUP_ANALYTICS_LOCK:
+            hit = GROUP_ANALYTICS_CACHE.get(gid)
+        if hit and hit[0] == stamp:
+            data = hit[1]
+        else:
+            data = compute_group_analytics(conn, gid)
+            with GROUP_ANALYTICS_LOCK:
+                if len(GROUP_ANALYTICS_CACHE) >= 256:
+                    GROUP_ANALYTICS_CACHE.pop(next(iter(GROUP_ANALYTICS_CACHE)))
+                GROUP_ANALYTICS_CACHE[gid] = (stamp, data)
+        return jsonify({"ok": True, "group_id": gid, "students": stamp[0], "cached": bool(hit and hit[0] == stamp),
+                        "as_of": as_of, **data})
+    finally:
+        conn.close()
+
+# --- Bulk export (sessions + words), streamed ---
+EXPORT_COLUMNS = [
+    "session_id", "user_id", "username", "group_id", "started_at", "ended_at", "estimated_level",
+    "session_word_id", "word_id", "expected", "recognized", "correct", "error_type",
+    "response_time_ms", "visible_ms", "answered_at",
+    "niveau", "fase", "stavemoenster", "ordblind_type", "ordblind_risiko", "interessekategori",
+]
+def iter_export_rows(group_id: Optional[int] = None, date_from: Optional[str] = None,
+                     date_to: Optional[str] = None, chunk: int = 2000) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per answer, student by student, in id order.
+
+    Each chunk is a separate short query (keyset on (user_id, id)), so the read
+    lock is released between chunks and students can keep writing answers
+    while a large export streams. Memory use is bounded by `chunk`.
+    """
+    conn = get_db()
+    try:
+        users_sql = "SELECT id, username, group_id FROM lm_users"
+        uparams: Tuple[Any, ...] = ()
+        if group_id is not None:
+            users_sql += " WHERE group_id=?"
+            uparams = (group_id,)
+        users = conn.execute(users_sql + " ORDER BY id", uparams).fetchall()
+
+        where = ""
+        dparams: list = []
+        if date_from:
+            where += " AND s.started_at >= ?"
+            dparams.append(date_from)
+        if date_to:
+            where += " AND s.started_at < date(?, '+1 day')"
+            dparams.append(date_to)
+
+        for u in users:
+            last_id = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT sw.id, sw.session_id, sw.word_id, sw.expected, sw.recognized, sw.correct, sw.error_type, "
+                    "sw.response_time_ms, sw.visible_ms, sw.created_at, "
+                    "s.started_at, s.ended_at, s.estimated_level "
+                    "FROM lm_session_words sw JOIN lm_sessions s ON s.id=sw.session_id "
+                    f"WHERE sw.user_id=? AND sw.id > ?{where} ORDER BY sw.id LIMIT ?",
+                    [u["id"], last_id] + dparams + [chunk],
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]["id"]
+                for r in rows:
+                    meta = word_meta_by_id(int(r["word_id"])) or {}
+                    yield {
+                        "session_id": r["session_id"],
+                        "user_id": u["id"],
+                        "username": u["username"],
+                        "group_id": u["group_id"],
+                        "started_at": r["started_at"],
+                        "ended_at": r["ended_at"],
+                        "estimated_level": r["estimated_level"],
+                        "session_word_id": r["id"],
+                        "word_id": r["word_id"],
+                        "expected": r["expected"],
+                        "recognized": r["recognized"],
+                        "correct": int(r["correct"]),
+                        "error_type": r["error_type"],
+                        "response_time_ms": r["response_time_ms"],
+                        "visible_ms": r["visible_ms"],
+                        "answered_at": r["created_at"],
+                        "niveau": meta.get("niveau"),
+                        "fase": meta.get("fase"),
+                        "stavemoenster": meta.get("stavemoenster"),
+                        "ordblind_type": meta.get("ordblind_type"),
+                        "ordblind_risiko": meta.get("ordblind_risiko"),
+                        "interessekategori": meta.get("interessekategori"),
+                    }
+                if len(rows) < chunk:
+                    break
+    finally:
+        conn.close()
+
+def encode_export(rows: Iterator[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    """Turn export rows into CSV (with header) or JSONL text, one row at a time."""
+    if fmt == "jsonl":
+        for r in rows:
+            yield json.dumps(r, ensure_ascii=False) + "\n"
+        return
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(EXPORT_COLUMNS)
+    for r in rows:
+        w.writerow([r[c] for c in EXPORT_COLUMNS])
+        if buf.tell() > 65536:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def parse_export_args(args: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    fmt = (args.get("format") or "csv").strip().lower()
+    if fmt not in ("csv", "jsonl"):
+        return None, "invalid_format"
+    group_id = args.get("group_id")
+    if group_id not in (None, ""):
+        try:
+            group_id = int(group_id)
+        except (TypeError, ValueError):
+            return None, "invalid_group_id"
+    else:
+        group_id = None
+    date_from = (args.get("from") or "").strip() or None
+    date_to = (args.get("to") or "").strip() or None
+    for d in (date_from, date_to):
+        if d and not DATE_RE.match(d):
+            return None, "invalid_date"
+    return {"format": fmt, "group_id": group_id, "date_from": date_from, "date_to": date_to}, None
+
+@app.route("/laesemaskine/api/admin/export")
+def admin_export():
+    """Stream all sessions + words (optionally one group / date range) as CSV or JSONL.
+
+    Query: ?group_id=&from=YYYY-MM-DD&to=YYYY-MM-DD&format=csv|jsonl
+    """
+    conn = get_db()
+    try:
+        admin, resp = require_admin(conn)
+        if resp:
+            return resp
     finally:
         conn.close()
+    opts, err = parse_export_args(request.args)
+    if err:
+        return jsonify({"error": err}), 400
+    fmt = opts.pop("format")
+    body = encode_export(iter_export_rows(**opts), fmt)
+    name = "laesemaskine_export" + (f"_group{opts['group_id']}" if opts["group_id"] is not None else "") + f".{fmt}"
+    return Response(
+        stream_with_context(body),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{name}"'},
+    )
 
 # Static frontend routes
 @app.route("/laesemaskine/")
@@ -1130,7 +3766,13 @@ def serve_static(filename: str):
     return send_from_directory(app.static_folder, filename)
 
 if __name__ == "__main__":
-    init_db()
+    if SHARD_DIR is not None:
+        init_shards()
+    else:
+        init_db()
+    lexicon_search_db().close()  # build the search index now if words.json changed
+    start_audio_sweeper()
+    start_snapshot_builder()
     port = int(os.environ.get("PORT", "5000"))
     app.run(host="0.0.0.0", port=port, debug=True)
 
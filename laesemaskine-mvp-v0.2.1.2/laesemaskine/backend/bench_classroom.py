@@ -0,0 +1,334 @@
+"""Classroom load test: N classrooms taking the reading test at the same time.
+
+Usage:
+  python bench_classroom.py --classrooms 4 --students 25 --out bench.json
+  python bench_classroom.py --mode socket --classrooms 8      # through a real HTTP server
+  python bench_classroom.py --compare old.json --out new.json # print p95 change per endpoint
+  python bench_classroom.py --lexicon                         # pick words from lexicon shards, like the browser
+  python bench_classroom.py --sharded                         # one tenant shard per classroom (LM_SHARD_DIR mode)
+  python bench_classroom.py --watch 0.5                       # teachers refresh the dashboards during the test
+
+Runs against a fresh SQLite database in a temporary directory (nothing is sent
+over the network; socket mode listens on 127.0.0.1 only). Each classroom runs
+in its own thread: the teacher registers and imports the class roster, every
+student logs in and takes --sessions tests (/words, /sessions/start, 20 x
+/answer, /finish) and the teacher then opens the admin dashboards.
+
+Latency is measured per endpoint on the client side. The JSON result holds
+throughput and p50/p95/p99 per endpoint plus the git commit, so runs can be
+compared between commits.
+"""
+
+from __future__ import annotations
+import argparse
+import http.cookiejar
+import json
+import logging
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import app as lm
+
+API = "/laesemaskine/api"
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--classrooms", type=int, default=4, help="Concurrent classrooms (threads)")
+    p.add_argument("--students", type=int, default=25, help="Students per classroom")
+    p.add_argument("--sessions", type=int, default=1, help="Tests per student")
+    p.add_argument("--words", type=int, default=20, help="Words per test")
+    p.add_argument("--accuracy", type=float, default=0.75, help="Share of words read correctly")
+    p.add_argument("--mode", choices=("client", "socket"), default="client",
+                   help="Flask test client (in-process) or HTTP against a local server")
+    p.add_argument("--seed", type=int, default=1, help="Random seed")
+    p.add_argument("--out", default=None, help="Write results as JSON here")
+    p.add_argument("--compare", default=None, help="Earlier result JSON to compare against")
+    p.add_argument("--lexicon", action="store_true",
+                   help="Pick words locally from cached lexicon shards instead of calling /words")
+    p.add_argument("--sharded", action="store_true",
+                   help="Multi-tenant mode: each classroom is its own school with its own SQLite shard")
+    p.add_argument("--watch", type=float, default=0.0,
+                   help="Seconds between dashboard refreshes by each teacher while the class is testing (0 = off)")
+    return p.parse_args()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, label: str, ms: float, ok: bool) -> None:
+        with self.lock:
+            self.samples.setdefault(label, []).append(ms)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+class TestClient:
+    """In-process client (one cookie jar per user)."""
+
+    def __init__(self, rec: Recorder, base: Optional[str] = None):
+        self.rec = rec
+        self.c = lm.app.test_client()
+        self.shards: Dict[int, list] = {}
+
+    def call(self, label: str, method: str, path: str, body: Any = None) -> Tuple[int, Any]:
+        t0 = time.perf_counter()
+        r = self.c.open(API + path, method=method, json=body)
+        data = r.get_json(silent=True)
+        self.rec.add(label, (time.perf_counter() - t0) * 1000, r.status_code < 400)
+        return r.status_code, data
+
+
+class SocketClient:
+    """HTTP client against a local server (one cookie jar per user)."""
+
+    def __init__(self, rec: Recorder, base: Optional[str] = None):
+        self.rec = rec
+        self.base = base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.shards: Dict[int, list] = {}
+
+    def call(self, label: str, method: str, path: str, body: Any = None) -> Tuple[int, Any]:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.base + API + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        t0 = time.perf_counter()
+        try:
+            with self.opener.open(req) as r:
+                status, raw = r.status, r.read()
+        except urllib.error.HTTPError as e:
+            status, raw = e.code, e.read()
+        self.rec.add(label, (time.perf_counter() - t0) * 1000, status < 400)
+        try:
+            return status, json.loads(raw)
+        except ValueError:
+            return status, None
+
+
+def local_words(client, rng: random.Random, level: int, count: int, exclude=()) -> list:
+    """Words from the lexicon shards (fetched once per client, as the browser caches them)."""
+    if not client.shards:
+        _, m = client.call("GET /lexicon/manifest", "GET", "/lexicon/manifest")
+        for lvl, s in (m or {}).get("levels", {}).items():
+            _, r = client.call("GET /lexicon/<shard>", "GET", s["url"][len(API):])
+            client.shards[int(lvl)] = (r or {}).get("words") or []
+    pool = [w for lvl in range(level - 1, level + 2) for w in client.shards.get(lvl, ()) if w["id"] not in exclude]
+    if len(pool) < count:
+        pool = [w for ws in client.shards.values() for w in ws if w["id"] not in exclude]
+    return rng.sample(pool, min(count, len(pool)))
+
+
+def take_test(client, rng: random.Random, level: int, n_words: int, accuracy: float, lexicon: bool = False) -> None:
+    if lexicon:
+        _, r = client.call("POST /sessions/start", "POST", "/sessions/start",
+                           {"feedback_mode": "per_word", "start_level": level, "reviews": n_words // 4})
+        reviews = list((r or {}).get("reviews") or [])[:n_words]
+        words = reviews + local_words(client, rng, level, n_words - len(reviews), {w["id"] for w in reviews})
+    else:
+        _, r = client.call("GET /words", "GET", f"/words?level={level}&count={n_words}&band=1")
+        words = list((r or {}).get("words") or [])
+        _, r = client.call("POST /sessions/start", "POST", "/sessions/start",
+                           {"feedback_mode": "per_word", "start_level": level})
+    sid = (r or {}).get("session_id")
+    if not sid or not words:
+        return
+    for i in range(min(n_words, len(words))):
+        w = words[i]
+        ok = rng.random() < accuracy
+        recognized = w["ord"] if ok else rng.choice((w["ord"][:-1], w["ord"] + "e", ""))
+        _, r = client.call("POST /sessions/<id>/answer", "POST", f"/sessions/{sid}/answer", {
+            "word_id": w["id"], "expected": w["ord"], "recognized": recognized,
+            "response_time_ms": rng.randint(400, 4000), "visible_ms": 5000,
+            "remaining": 0 if lexicon else n_words - i - 1,
+        })
+        if r and r.get("next_words"):
+            words[i + 1:] = r["next_words"]
+        if lexicon and r and r.get("level_changed") and i + 1 < len(words):
+            words[i + 1:] = local_words(client, rng, r["level"], len(words) - i - 1, {x["id"] for x in words[:i + 1]})
+        level = (r or {}).get("level", level)
+    client.call("POST /sessions/<id>/finish", "POST", f"/sessions/{sid}/finish", {"estimated_level": level})
+
+
+def watch_dashboards(k: int, gid: int, every: float, rec: Recorder, client_cls, base: Optional[str],
+                     done: threading.Event) -> None:
+    # the teacher keeps the overview and group heatmaps open while the class is testing
+    teacher = client_cls(rec, base)
+    teacher.call("POST /auth/login", "POST", "/auth/login", {"username": f"laerer{k}", "password": "bench"})
+    while not done.wait(every):
+        teacher.call("GET /admin/overview (during test)", "GET", "/admin/overview")
+        teacher.call("GET /admin/groups/<id>/analytics (during test)", "GET", f"/admin/groups/{gid}/analytics")
+
+
+def run_classroom(k: int, args, rec: Recorder, client_cls, base: Optional[str]) -> None:
+    rng = random.Random(args.seed * 1000 + k)
+    teacher = client_cls(rec, base)
+    teacher.call("POST /auth/register", "POST", "/auth/register",
+                 {"username": f"laerer{k}", "password": "bench", "role": "admin", "tenant": f"Skole {k}"})
+    group = f"Klasse {k}"
+    roster = [{"username": f"k{k}s{i}", "password": "bench", "group": group} for i in range(args.students)]
+    teacher.call("POST /admin/users/import", "POST", "/admin/users/import", {"users": roster})
+    _, r = teacher.call("GET /admin/groups", "GET", "/admin/groups")
+    gid = next((g["id"] for g in (r or {}).get("groups", []) if g["name"] == group), None)
+
+    students = []
+    for row in roster:
+        c = client_cls(rec, base)
+        c.call("POST /auth/login", "POST", "/auth/login", {"username": row["username"], "password": "bench"})
+        students.append((c, rng.randint(2, 12)))
+    done = threading.Event()
+    watcher = None
+    if args.watch > 0 and gid is not None:
+        watcher = threading.Thread(target=watch_dashboards, args=(k, gid, args.watch, rec, client_cls, base, done))
+        watcher.start()
+    try:
+        for _ in range(args.sessions):
+            for c, level in students:
+                take_test(c, rng, level, args.words, args.accuracy, args.lexicon)
+    finally:
+        done.set()
+        if watcher is not None:
+            watcher.join()
+
+    _, r = teacher.call("GET /admin/overview", "GET", "/admin/overview")
+    uids = [s["id"] for s in (r or {}).get("students", []) if s.get("username", "").startswith(f"k{k}s")]
+    if gid is not None:
+        teacher.call("GET /admin/groups/<id>/analytics", "GET", f"/admin/groups/{gid}/analytics")
+    for uid in uids[:5]:
+        _, r = teacher.call("GET /admin/student/<id>/difficulty", "GET", f"/admin/student/{uid}/difficulty")
+        top = ((r or {}).get("by_stavemoenster") or [None])[0]
+        if top:
+            # drill into the student's weakest spelling pattern, as the admin page does
+            q = urllib.parse.urlencode({"group": "stavemoenster", "key": top["key"], "limit": 500})
+            teacher.call("GET /admin/student/<id>/drilldown", "GET", f"/admin/student/{uid}/drilldown?{q}")
+        teacher.call("GET /admin/student/<id>/progress", "GET", f"/admin/student/{uid}/progress")
+    teacher.call("GET /admin/disputes", "GET", "/admin/disputes")
+
+
+def percentile(sorted_ms: List[float], q: float) -> float:
+    # nearest rank
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, int(round(q * len(sorted_ms) + 0.5)) - 1))]
+
+
+def summarize(rec: Recorder, seconds: float) -> Dict[str, Any]:
+    endpoints = {}
+    for label, ms in sorted(rec.samples.items()):
+        ms = sorted(ms)
+        endpoints[label] = {
+            "count": len(ms),
+            "errors": rec.errors.get(label, 0),
+            "rps": round(len(ms) / seconds, 1) if seconds else 0.0,
+            "mean_ms": round(sum(ms) / len(ms), 2),
+            "p50_ms": round(percentile(ms, 0.50), 2),
+            "p95_ms": round(percentile(ms, 0.95), 2),
+            "p99_ms": round(percentile(ms, 0.99), 2),
+            "max_ms": round(ms[-1], 2),
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "seconds": round(seconds, 3),
+        "rps": round(total / seconds, 1) if seconds else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=lm.BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    print(f"\n{'endpoint':38} {'p95 before':>11} {'p95 now':>9} {'change':>8}")
+    for label, e in new["endpoints"].items():
+        o = old.get("endpoints", {}).get(label)
+        if not o:
+            continue
+        delta = (e["p95_ms"] - o["p95_ms"]) / o["p95_ms"] * 100 if o["p95_ms"] else 0.0
+        print(f"{label:38} {o['p95_ms']:>9.1f}ms {e['p95_ms']:>7.1f}ms {delta:>+7.0f}%")
+
+
+def main():
+    args = parse_args()
+    tmp = Path(tempfile.mkdtemp(prefix="lm-bench-"))
+    lm.DB_DIR = tmp
+    lm.DB_PATH = tmp / "laesemaskine.db"
+    lm.UPLOAD_DIR = tmp / "uploads"
+    if args.sharded:
+        lm.SHARD_DIR = tmp / "shards"
+        lm.OPEN_SIGNUP = True  # every teacher registers their own school
+        lm.init_shards()
+    else:
+        lm.init_db()
+
+    server = None
+    base = None
+    client_cls = TestClient
+    if args.mode == "socket":
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log per request
+        server = make_server("127.0.0.1", 0, lm.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        client_cls = SocketClient
+
+    rec = Recorder()
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.classrooms)) as pool:
+            for f in [pool.submit(run_classroom, k, args, rec, client_cls, base) for k in range(args.classrooms)]:
+                f.result()
+    finally:
+        if server is not None:
+            server.shutdown()
+    result = summarize(rec, time.perf_counter() - t0)
+    result["meta"] = {
+        "commit": git_commit(),
+        "mode": args.mode,
+        "classrooms": args.classrooms,
+        "students": args.students,
+        "sessions": args.sessions,
+        "words": args.words,
+        "lexicon": args.lexicon,
+        "sharded": args.sharded,
+        "watch": args.watch,
+        "analytics_snapshot_s": lm.ANALYTICS_SNAPSHOT_S,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    print(f"{result['requests']} requests in {result['seconds']} s ({result['rps']} req/s), {result['errors']} error(s)")
+    print(f"{'endpoint':38} {'n':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for label, e in result["endpoints"].items():
+        print(f"{label:38} {e['count']:>6} {e['errors']:>4} {e['p50_ms']:>6.1f}ms {e['p95_ms']:>6.1f}ms {e['p99_ms']:>6.1f}ms")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), result)
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Estimate each word's empirical difficulty and typical response time.
+
+Usage:
+  python calibrate_words.py               # fold in answers since the last run
+  python calibrate_words.py --full        # start over from all answers
+  python calibrate_words.py --report 20   # also list the words furthest from their niveau
+
+Results go to lm_word_calibration (keyed by words.json word id) and are used by
+`/api/words?calibrated=1`. Runs are incremental: only lm_session_words rows
+after lm_calibration_state.last_answer_id are read, in id-ordered chunks, and
+each chunk is committed on its own. A new words.json version starts over.
+"""
+
+from __future__ import annotations
+import argparse
+from pathlib import Path
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--full", action="store_true", help="Recalibrate from all answers")
+    p.add_argument("--chunk", type=int, default=5000, help="Answers read per query/transaction")
+    p.add_argument("--report", type=int, default=0, help="Print the N words furthest from their niveau")
+    return p.parse_args()
+
+
+def report(conn, n: int) -> None:
+    rows = conn.execute(
+        "SELECT word_id, difficulty, attempts, correct, typical_ms FROM lm_word_calibration WHERE attempts >= ?",
+        (lm.CALIBRATION_MIN_ATTEMPTS,),
+    ).fetchall()
+    out = []
+    for r in rows:
+        meta = lm.word_meta_by_id(int(r["word_id"])) or {}
+        if meta.get("niveau") is None:
+            continue
+        out.append((r["difficulty"] - meta["niveau"], meta, r))
+    out.sort(key=lambda e: -abs(e[0]))
+    for delta, meta, r in out[:n]:
+        ms = f"{r['typical_ms']} ms" if r["typical_ms"] is not None else "-"
+        print(f"{meta.get('ord')!s:20} niveau {meta['niveau']:>2} -> {r['difficulty']:5.1f} ({delta:+.1f})"
+              f"  {r['correct']}/{r['attempts']} rigtige  {ms}")
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    lm.init_db()
+    conn = lm.get_db()
+    try:
+        stats = lm.calibrate_words(conn, full=args.full, chunk=max(1, args.chunk))
+        n = conn.execute(
+            "SELECT COUNT(*) AS n FROM lm_word_calibration WHERE attempts >= ?", (lm.CALIBRATION_MIN_ATTEMPTS,)
+        ).fetchone()["n"]
+        print(f"Folded in {stats['answers']} answer(s); {n} word(s) have >= {lm.CALIBRATION_MIN_ATTEMPTS} attempts")
+        if args.report:
+            report(conn, args.report)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
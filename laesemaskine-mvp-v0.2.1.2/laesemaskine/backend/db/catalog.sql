@@ -0,0 +1,28 @@
+-- Læsemaskine tenant catalog (SQLite), used only when LM_SHARD_DIR is set.
+-- Each tenant (school) has its own shard: <LM_SHARD_DIR>/<shard>/laesemaskine.db
+-- with schema.sql, and ids in that shard start at tenant id * 10^10.
+
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE IF NOT EXISTS lm_tenants (
+  id INTEGER PRIMARY KEY,
+  name TEXT NOT NULL UNIQUE,
+  shard TEXT NOT NULL UNIQUE,  -- directory name under LM_SHARD_DIR
+  created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Usernames are unique across all tenants; login looks the tenant up here.
+CREATE TABLE IF NOT EXISTS lm_catalog_users (
+  user_id INTEGER PRIMARY KEY,
+  username TEXT NOT NULL UNIQUE,
+  tenant_id INTEGER NOT NULL,
+  FOREIGN KEY(tenant_id) REFERENCES lm_tenants(id)
+);
+CREATE INDEX IF NOT EXISTS idx_lm_catalog_users_tenant ON lm_catalog_users(tenant_id);
+
+CREATE TABLE IF NOT EXISTS lm_catalog_groups (
+  group_id INTEGER PRIMARY KEY,
+  tenant_id INTEGER NOT NULL,
+  FOREIGN KEY(tenant_id) REFERENCES lm_tenants(id)
+);
+CREATE INDEX IF NOT EXISTS idx_lm_catalog_groups_tenant ON lm_catalog_groups(tenant_id);
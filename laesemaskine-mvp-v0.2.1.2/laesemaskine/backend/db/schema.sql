@@ -20,6 +20,7 @@ CREATE TABLE IF NOT EXISTS lm_users (
   created_at TEXT NOT NULL DEFAULT (datetime('now')),
   FOREIGN KEY(group_id) REFERENCES lm_groups(id) ON DELETE SET NULL
 );
+CREATE INDEX IF NOT EXISTS idx_lm_users_group ON lm_users(group_id, role);
 
 CREATE TABLE IF NOT EXISTS lm_mastery (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,8 +57,11 @@ CREATE TABLE IF NOT EXISTS lm_sessions (
   error_type TEXT NULL,
   session_audio_mime TEXT NULL,
   session_audio_uploaded_at TEXT NULL,
+  adaptive_level INTEGER NULL,   -- server-side adaptive level (NULL = client-driven session)
+  adaptive_window TEXT NULL,     -- last 5 outcomes as '1'/'0', newest last
   FOREIGN KEY(user_id) REFERENCES lm_users(id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS idx_lm_sessions_user_ended ON lm_sessions(user_id, ended_at);
 
 CREATE TABLE IF NOT EXISTS lm_session_words (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -72,8 +76,59 @@ CREATE TABLE IF NOT EXISTS lm_session_words (
   end_ms INTEGER NULL,
   error_type TEXT NULL,
   created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  -- denormalised from lm_sessions / words.json at insert time (indexed drilldown)
+  user_id INTEGER NULL,
+  niveau INTEGER NULL,
+  interessekategori TEXT NULL,
+  stavemoenster TEXT NULL,
+  ordblind_type TEXT NULL,
   FOREIGN KEY(session_id) REFERENCES lm_sessions(id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS idx_lm_session_words_session ON lm_session_words(session_id);
+
+-- Spaced repetition: missed words per student and when to show them again
+CREATE TABLE IF NOT EXISTS lm_review_queue (
+  user_id INTEGER NOT NULL,
+  word_id INTEGER NOT NULL,
+  due_at TEXT NOT NULL,
+  interval_days REAL NOT NULL DEFAULT 0,
+  ease REAL NOT NULL DEFAULT 2.5,
+  reps INTEGER NOT NULL DEFAULT 0,
+  lapses INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT NOT NULL DEFAULT (datetime('now')),
+  PRIMARY KEY(user_id, word_id),
+  FOREIGN KEY(user_id) REFERENCES lm_users(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_lm_review_queue_due ON lm_review_queue(user_id, due_at);
+
+-- Empirical word difficulty (calibrate_words.py), keyed by words.json word id.
+-- difficulty is on the niveau scale; typical_ms is the geometric mean response time.
+CREATE TABLE IF NOT EXISTS lm_word_calibration (
+  word_id INTEGER PRIMARY KEY,
+  difficulty REAL NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0,
+  timed INTEGER NOT NULL DEFAULT 0,
+  log_ms_sum REAL NOT NULL DEFAULT 0,
+  typical_ms INTEGER NULL,
+  updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Student ability used while calibrating (same scale)
+CREATE TABLE IF NOT EXISTS lm_calibration_abilities (
+  user_id INTEGER PRIMARY KEY,
+  ability REAL NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  FOREIGN KEY(user_id) REFERENCES lm_users(id) ON DELETE CASCADE
+);
+
+-- Incremental calibration: last lm_session_words.id folded in, per words.json version
+CREATE TABLE IF NOT EXISTS lm_calibration_state (
+  id INTEGER PRIMARY KEY CHECK(id = 1),
+  words_version TEXT NOT NULL,
+  last_answer_id INTEGER NOT NULL DEFAULT 0,
+  updated_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
 
 -- Optional: audit log (minimal)
 CREATE TABLE IF NOT EXISTS lm_audit (
@@ -110,3 +165,61 @@ CREATE TABLE IF NOT EXISTS lm_disputes (
   FOREIGN KEY(student_user_id) REFERENCES lm_users(id) ON DELETE CASCADE,
   FOREIGN KEY(reviewed_by) REFERENCES lm_users(id) ON DELETE SET NULL
 );
+CREATE INDEX IF NOT EXISTS idx_lm_disputes_created ON lm_disputes(created_at);
+
+-- Content-addressed audio files (backend/uploads/<sha256><ext>) with reference counts.
+-- refcount = number of lm_sessions / lm_disputes / queued lm_ai_queue rows pointing at the file.
+CREATE TABLE IF NOT EXISTS lm_audio_blobs (
+  audio_path TEXT PRIMARY KEY,  -- relative path under backend/uploads
+  sha256 TEXT NULL UNIQUE,      -- NULL for files uploaded before content addressing
+  size_bytes INTEGER NULL,
+  refcount INTEGER NOT NULL DEFAULT 0,
+  created_at TEXT NOT NULL DEFAULT (datetime('now')),
+  last_ref_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_lm_audio_blobs_refcount ON lm_audio_blobs(refcount);
+
+-- AI training exports (written by backend/export_ai_queue.py)
+CREATE INDEX IF NOT EXISTS idx_lm_ai_queue_status ON lm_ai_queue(status, id);
+CREATE TABLE IF NOT EXISTS lm_ai_exports (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  shard TEXT NOT NULL UNIQUE,   -- file name stem under the export directory
+  first_queue_id INTEGER NOT NULL,
+  last_queue_id INTEGER NOT NULL,
+  items INTEGER NOT NULL,
+  bytes INTEGER NOT NULL,
+  created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Per-student answer counters by word category (kept current at session finish)
+-- dimension: interessekategori | stavemoenster | ordblind_type
+CREATE TABLE IF NOT EXISTS lm_category_counters (
+  user_id INTEGER NOT NULL,
+  dimension TEXT NOT NULL,
+  key TEXT NOT NULL,
+  total INTEGER NOT NULL DEFAULT 0,
+  wrong INTEGER NOT NULL DEFAULT 0,
+  last_seen_at TEXT NULL,
+  PRIMARY KEY(user_id, dimension, key),
+  FOREIGN KEY(user_id) REFERENCES lm_users(id) ON DELETE CASCADE
+);
+
+-- Per-student progress rollups, kept current at session finish
+-- period: 'day' | 'week' (period_start = the Monday)
+CREATE TABLE IF NOT EXISTS lm_progress_rollup (
+  user_id INTEGER NOT NULL,
+  period TEXT NOT NULL CHECK(period IN ('day','week')),
+  period_start TEXT NOT NULL,
+  sessions INTEGER NOT NULL DEFAULT 0,
+  words INTEGER NOT NULL DEFAULT 0,
+  correct INTEGER NOT NULL DEFAULT 0,
+  level_sum INTEGER NOT NULL DEFAULT 0,
+  level_n INTEGER NOT NULL DEFAULT 0,
+  last_level INTEGER NULL,
+  score_sum REAL NOT NULL DEFAULT 0,
+  score_n INTEGER NOT NULL DEFAULT 0,
+  speed_sum REAL NOT NULL DEFAULT 0,
+  speed_n INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY(user_id, period, period_start),
+  FOREIGN KEY(user_id) REFERENCES lm_users(id) ON DELETE CASCADE
+);
@@ -0,0 +1,198 @@
+"""Export queued AI-training rows (lm_ai_queue) to sharded datasets.
+
+Usage:
+  python export_ai_queue.py --out ../exports/ai
+  python export_ai_queue.py --out ../exports/ai --shard-mb 256 --chunk 500
+
+Each shard is a tar archive `shard-000001.tar` holding the audio files plus a
+`manifest.jsonl` (one JSON line per queue row: expected word, recognized text,
+error_type, audio member). The same manifest is written next to the archive as
+`shard-000001.jsonl`.
+
+Rows are read in id order, in chunks, and only rows still `queued` are touched,
+so a second run only exports what was added since the last one. A shard is
+recorded in lm_ai_exports and its rows marked `exported` in one transaction
+before the archive gets its final name; an interrupted run is completed or
+rolled back on the next start.
+"""
+
+from __future__ import annotations
+import argparse
+import io
+import json
+import tarfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--out", required=True, help="Export directory")
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--shard-mb", type=float, default=256.0, help="Max audio bytes per shard (MB)")
+    p.add_argument("--chunk", type=int, default=500, help="Queue rows read per query")
+    return p.parse_args()
+
+
+class ShardWriter:
+    def __init__(self, out_dir: Path, name: str):
+        self.name = name
+        self.tar_path = out_dir / f"{name}.tar"
+        self.manifest_path = out_dir / f"{name}.jsonl"
+        self.tar_tmp = out_dir / f"{name}.tar.partial"
+        self.manifest_tmp = out_dir / f"{name}.jsonl.partial"
+        self.tar = tarfile.open(self.tar_tmp, "w")
+        self.members = set()
+        self.lines: List[str] = []
+        self.ids: List[int] = []
+        self.audio_paths: List[str] = []
+        self.bytes = 0
+
+    def add(self, row: Any, src: Path) -> bool:
+        """Add a row and its audio; False if the file was swept away meanwhile."""
+        # content-addressed uploads: rows sharing a recording share one member
+        member = f"audio/{src.name}"
+        if member not in self.members:
+            try:
+                size = src.stat().st_size
+                self.tar.add(str(src), arcname=member)  # opens the file before writing the header
+            except FileNotFoundError:
+                return False
+            self.members.add(member)
+            self.bytes += size
+        self.lines.append(json.dumps({
+            "queue_id": row["id"],
+            "dispute_id": row["dispute_id"],
+            "audio": member,
+            "expected": row["expected"],
+            "recognized": row["recognized"],
+            "error_type": row["error_type"],
+            "queued_at": row["created_at"],
+        }, ensure_ascii=False))
+        self.ids.append(int(row["id"]))
+        self.audio_paths.append(row["audio_path"])
+        return True
+
+    def close(self) -> None:
+        data = ("\n".join(self.lines) + "\n").encode("utf-8")
+        info = tarfile.TarInfo("manifest.jsonl")
+        info.size = len(data)
+        self.tar.addfile(info, io.BytesIO(data))
+        self.tar.close()
+        self.manifest_tmp.write_bytes(data)
+
+    def publish(self) -> None:
+        self.tar_tmp.replace(self.tar_path)
+        self.manifest_tmp.replace(self.manifest_path)
+
+
+def recover(conn, out_dir: Path) -> None:
+    """Finish shards committed in the DB; drop partial files that never were."""
+    committed = {r["shard"] for r in conn.execute("SELECT shard FROM lm_ai_exports").fetchall()}
+    for tmp in sorted(out_dir.glob("*.partial")):
+        stem = tmp.name.split(".", 1)[0]
+        final = tmp.with_name(tmp.name[: -len(".partial")])
+        if stem in committed:
+            tmp.replace(final)
+        else:
+            tmp.unlink()
+
+
+def commit_shard(conn, shard: ShardWriter) -> None:
+    shard.close()
+    try:
+        conn.execute(
+            "INSERT INTO lm_ai_exports (shard, first_queue_id, last_queue_id, items, bytes) VALUES (?,?,?,?,?)",
+            (shard.name, shard.ids[0], shard.ids[-1], len(shard.ids), shard.bytes),
+        )
+        for i, p in zip(shard.ids, shard.audio_paths):
+            cur = conn.execute(
+                "UPDATE lm_ai_queue SET status='exported', exported_at=datetime('now') WHERE id=? AND status='queued'",
+                (i,),
+            )
+            # the shard now holds the audio; release the queue's reference, unless the
+            # sweeper or drop_missing already did when it marked the row deleted
+            if cur.rowcount:
+                lm.audio_unref(conn, p)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    shard.publish()
+
+
+def drop_missing(conn, rows: List[Any]) -> None:
+    """Queue rows whose audio is gone (retention sweep) cannot be exported."""
+    if not rows:
+        return
+    for r in rows:
+        cur = conn.execute("UPDATE lm_ai_queue SET status='deleted' WHERE id=? AND status='queued'", (r["id"],))
+        if cur.rowcount:
+            lm.audio_unref(conn, r["audio_path"])
+    conn.commit()
+
+
+def export(conn, out_dir: Path, shard_bytes: int, chunk: int) -> Dict[str, int]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    recover(conn, out_dir)
+    n_shards = conn.execute("SELECT COUNT(*) AS n FROM lm_ai_exports").fetchone()["n"]
+
+    stats = {"shards": 0, "exported": 0, "missing_audio": 0}
+    shard: Optional[ShardWriter] = None
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, dispute_id, audio_path, expected, recognized, error_type, created_at "
+            "FROM lm_ai_queue WHERE status='queued' AND id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk),
+        ).fetchall()
+        if not rows:
+            break
+        missing = []
+        for r in rows:
+            last_id = int(r["id"])
+            src = lm._upload_file(r["audio_path"])
+            try:
+                size = src.stat().st_size
+            except FileNotFoundError:
+                missing.append(r)
+                continue
+            if shard is not None and shard.ids and shard.bytes + size > shard_bytes:
+                commit_shard(conn, shard)
+                stats["shards"] += 1
+                stats["exported"] += len(shard.ids)
+                shard = None
+            if shard is None:
+                n_shards += 1
+                shard = ShardWriter(out_dir, f"shard-{n_shards:06d}")
+            if not shard.add(r, src):
+                missing.append(r)  # swept between the SELECT and the copy
+        drop_missing(conn, missing)
+        stats["missing_audio"] += len(missing)
+
+    if shard is not None and shard.ids:
+        commit_shard(conn, shard)
+        stats["shards"] += 1
+        stats["exported"] += len(shard.ids)
+    return stats
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    lm.init_db()
+    conn = lm.get_db()
+    try:
+        stats = export(conn, Path(args.out).resolve(), int(args.shard_mb * 1024 * 1024), max(1, args.chunk))
+    finally:
+        conn.close()
+    print(f"Exported {stats['exported']} rows in {stats['shards']} shard(s) to {Path(args.out).resolve()}"
+          f" ({stats['missing_audio']} skipped: audio already deleted)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Export sessions + per-word answers (with word metadata) as CSV or JSONL.
+
+Usage:
+  python export_sessions.py --group 3 --format csv --out klasse3.csv
+  python export_sessions.py --from 2026-08-01 --to 2027-06-30 --format jsonl > skoleaar.jsonl
+
+Same rows as GET /laesemaskine/api/admin/export. Rows are streamed, so memory
+use stays flat for any export size.
+"""
+
+from __future__ import annotations
+import argparse
+import sys
+from pathlib import Path
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--group", default=None, help="Only this group id")
+    p.add_argument("--from", dest="date_from", default=None, help="First session date (YYYY-MM-DD)")
+    p.add_argument("--to", dest="date_to", default=None, help="Last session date (YYYY-MM-DD, inclusive)")
+    p.add_argument("--format", default="csv", choices=["csv", "jsonl"])
+    p.add_argument("--out", default="-", help="Output file (default: stdout)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    opts, err = lm.parse_export_args({
+        "format": args.format, "group_id": args.group, "from": args.date_from, "to": args.date_to,
+    })
+    if err:
+        sys.exit(f"error: {err}")
+    fmt = opts.pop("format")
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8", newline="")
+    try:
+        for part in lm.encode_export(lm.iter_export_rows(**opts), fmt):
+            out.write(part)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""Fill a database with synthetic history for scale testing.
+
+Usage:
+  python generate_history.py --db /tmp/stor.db --groups 20 --students 25 --sessions 200
+  python generate_history.py --db /tmp/stor.db --groups 100 --students 25 --sessions 200 --years 3
+      # ~ 100*25*200*20 = 10M lm_session_words rows
+
+Creates groups, students (password "elev"), finished sessions spread over the
+last --years, answers, disputes pointing at a few tiny audio stub files (in
+uploads/ next to the database) and then rebuilds the derived tables
+(category counters, progress rollups, mastery). Never run it against the
+production database: it refuses a database that already has sessions unless
+--append is given.
+
+Answers follow the student's level over time. Wrong readings are variants of
+the expected word (missing/extra ending, one-letter change, vowel change,
+dropped cluster consonant, another word, no answer) and their error_type is
+what diagnose_v1 says about them. Rows are inserted with executemany in large
+transactions with the lm_session_words indexes dropped during the load.
+"""
+
+from __future__ import annotations
+import argparse
+import hashlib
+import math
+import random
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from werkzeug.security import generate_password_hash
+
+import app as lm
+
+STUB_AUDIO = 8  # distinct stub recordings shared by all disputes
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", required=True, help="SQLite DB path to fill")
+    p.add_argument("--groups", type=int, default=10, help="Number of groups")
+    p.add_argument("--students", type=int, default=25, help="Students per group")
+    p.add_argument("--sessions", type=int, default=50, help="Finished sessions per student")
+    p.add_argument("--words", type=int, default=20, help="Answers per session")
+    p.add_argument("--years", type=float, default=2.0, help="History spread over this many years")
+    p.add_argument("--dispute-rate", type=float, default=0.02, help="Share of wrong answers disputed")
+    p.add_argument("--batch", type=int, default=100000, help="Rows per executemany")
+    p.add_argument("--commit-rows", type=int, default=2000000, help="Answer rows per transaction")
+    p.add_argument("--seed", type=int, default=1, help="Random seed")
+    p.add_argument("--append", action="store_true", help="Allow a database that already has sessions")
+    p.add_argument("--no-derived", action="store_true", help="Skip rebuilding counters/rollups/mastery")
+    return p.parse_args()
+
+
+def wrong_variants(word: str, other: str) -> List[Tuple[str, Optional[str]]]:
+    """(recognized, error_type) misreadings of `word`, one per diagnose_v1 category found."""
+    w = word.lower()
+    cands = [""]  # no answer
+    for end in lm.ENDING_LIST:
+        if w.endswith(end) and len(w) > len(end) + 1:
+            cands.append(w[: -len(end)])
+            break
+    cands.append(w + "e")
+    cands.append(w + "er")
+    if len(w) > 2:
+        i = len(w) // 2
+        cands.append(w[:i] + ("t" if w[i] != "t" else "d") + w[i + 1:])
+    vowels = [i for i, ch in enumerate(w) if ch in lm.VOWELS]
+    if len(vowels) >= 2:
+        # two vowels changed: one change alone counts as near_match
+        v = list(w)
+        for i in vowels[:2]:
+            v[i] = "a" if v[i] != "a" else "e"
+        cands.append("".join(v))
+    if len(w) > 3 and w[0] not in lm.VOWELS and w[1] not in lm.VOWELS:
+        cands.append(w[1:])
+    cands.append(other.lower())
+
+    by_type: Dict[Optional[str], str] = {}
+    for rec in cands:
+        if rec == w:
+            continue
+        et = lm.diagnose_v1(word, rec).get("error_type")
+        by_type.setdefault(et, rec)
+    return [(rec, et) for et, rec in by_type.items()]
+
+
+def next_id(conn, table: str) -> int:
+    """First free AUTOINCREMENT id; on a tenant shard sqlite_sequence starts at tenant * SHARD_ID_SPAN."""
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", (table,)).fetchone()
+    top = conn.execute(f"SELECT MAX(id) AS m FROM {table}").fetchone()["m"]
+    return max(seq["seq"] if seq else 0, top or 0) + 1
+
+
+def write_stub_audio() -> List[str]:
+    """A few tiny content-addressed files standing in for recordings."""
+    lm.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(STUB_AUDIO):
+        data = b"LM-STUB-AUDIO" + bytes([i]) * 256
+        rel = f"uploads/{hashlib.sha256(data).hexdigest()}.webm"
+        f = lm._upload_file(rel)
+        if not f.exists():
+            f.write_bytes(data)
+        paths.append(rel)
+    return paths
+
+
+class Loader:
+    """Buffers rows per table and flushes them with executemany."""
+
+    SQL = {
+        "sessions": "INSERT INTO lm_sessions (id, user_id, started_at, ended_at, estimated_level, correct_total, "
+                    "total_words, feedback_mode) VALUES (?,?,?,?,?,?,?,?)",
+        "words": "INSERT INTO lm_session_words (id, session_id, word_id, expected, recognized, correct, "
+                 "response_time_ms, visible_ms, start_ms, end_ms, error_type, created_at, "
+                 "user_id, niveau, interessekategori, stavemoenster, ordblind_type) "
+                 "VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        "disputes": "INSERT INTO lm_disputes (session_word_id, session_id, student_user_id, expected, recognized, "
+                    "audio_path, error_type, status, reviewed_at, created_at) VALUES (?,?,?,?,?,?,?,?,?,?)",
+    }
+
+    def __init__(self, conn, batch: int, commit_rows: int):
+        self.conn = conn
+        self.batch = batch
+        self.commit_rows = commit_rows
+        self.rows: Dict[str, list] = {k: [] for k in self.SQL}
+        self.uncommitted = 0
+        self.counts = {k: 0 for k in self.SQL}
+
+    def add(self, table: str, row: tuple) -> None:
+        buf = self.rows[table]
+        buf.append(row)
+        if len(buf) >= self.batch:
+            self.flush()
+
+    def flush(self, commit: bool = False) -> None:
+        # sessions first: answers and disputes point at them
+        for table in ("sessions", "words", "disputes"):
+            buf = self.rows[table]
+            if buf:
+                self.conn.executemany(self.SQL[table], buf)
+                self.counts[table] += len(buf)
+                if table == "words":
+                    self.uncommitted += len(buf)
+                buf.clear()
+        if commit or self.uncommitted >= self.commit_rows:
+            self.conn.commit()
+            self.uncommitted = 0
+
+
+def generate(conn, args) -> Dict[str, int]:
+    rng = random.Random(args.seed)
+    by_level = lm.words_by_level()
+    levels = sorted(by_level)
+    all_words = [w for lvl in levels for w in by_level[lvl]]
+    variants: Dict[int, List[Tuple[str, Optional[str]]]] = {}
+    categories = {w["id"]: lm.word_categories(w["id"]) for w in all_words}
+    audio = write_stub_audio()
+    audio_refs = {p: 0 for p in audio}
+
+    pw_hash = generate_password_hash("elev")
+    now = time.time()
+    span = args.years * 365 * 86400
+    next_session = next_id(conn, "lm_sessions")
+    next_answer = next_id(conn, "lm_session_words")
+    run = f"{args.seed}{int(now) % 100000}"
+
+    loader = Loader(conn, max(1, args.batch), max(1, args.commit_rows))
+    t0 = time.perf_counter()
+    for g in range(args.groups):
+        gid = conn.execute("INSERT INTO lm_groups (name) VALUES (?)", (f"Syntetisk {run}-{g + 1}",)).lastrowid
+        users = [(f"syn{run}g{g + 1}s{i + 1}", pw_hash, "elev", gid, f"Elev {g + 1}.{i + 1}",
+                  lm._utc_stamp(now - span - rng.random() * 86400 * 30)) for i in range(args.students)]
+        conn.executemany(
+            "INSERT INTO lm_users (username, password_hash, role, group_id, display_name, created_at) "
+            "VALUES (?,?,?,?,?,?)", users,
+        )
+        members = conn.execute("SELECT id, username FROM lm_users WHERE group_id=? ORDER BY id", (gid,)).fetchall()
+        uids = [r["id"] for r in members]
+        # multi-tenant: usernames and the group go into the catalog so the students can log in
+        lm.catalog_add(users=[(r["id"], r["username"]) for r in members], group_ids=[gid])
+        for uid in uids:
+            # ability on the niveau scale, growing over the school years
+            ability = rng.uniform(levels[0], min(levels[-1], levels[0] + 8))
+            growth = rng.uniform(0.5, 6.0) / max(1, args.sessions)
+            starts = sorted(now - rng.random() * span for _ in range(args.sessions))
+            for started in starts:
+                ability = min(levels[-1], ability + growth)
+                level = lm.clamp_level(round(ability + rng.gauss(0, 1)))
+                sid = next_session
+                next_session += 1
+                t = started
+                correct_total = 0
+                answers, disputes = [], []
+                for k in range(args.words):
+                    lvl = level + rng.choice((-1, 0, 0, 1))
+                    pool = by_level.get(lvl) or by_level.get(level) or all_words
+                    w = pool[rng.randrange(len(pool))]
+                    p = 1.0 / (1.0 + math.exp((w["niveau"] - ability - 1.0) / 2.0))
+                    ok = rng.random() < p
+                    if ok:
+                        recognized, error_type = w["ord"], None
+                    else:
+                        if w["id"] not in variants:
+                            variants[w["id"]] = wrong_variants(w["ord"], all_words[rng.randrange(len(all_words))]["ord"])
+                        recognized, error_type = rng.choice(variants[w["id"]])
+                    ms = int(rng.lognormvariate(math.log(700 + 90 * len(w["ord"])), 0.35) * (1.0 if ok else 1.4))
+                    start_ms = int((t - started) * 1000)
+                    t += ms / 1000 + rng.uniform(0.5, 3.0)
+                    answer_id = next_answer
+                    next_answer += 1
+                    correct_total += ok
+                    answers.append((
+                        answer_id, sid, w["id"], w["ord"], recognized, int(ok), ms, ms + 400,
+                        start_ms, start_ms + ms, error_type, lm._utc_stamp(t), uid,
+                    ) + categories[w["id"]])
+                    if not ok and rng.random() < args.dispute_rate:
+                        path = audio[rng.randrange(len(audio))]
+                        audio_refs[path] += 1
+                        status = rng.choice(("pending", "approved", "rejected"))
+                        disputes.append((
+                            answer_id, sid, uid, w["ord"], recognized, path, error_type, status,
+                            lm._utc_stamp(t + 86400) if status != "pending" else None, lm._utc_stamp(t + 60),
+                        ))
+                # session row before its answers (foreign keys are on)
+                loader.add("sessions", (sid, uid, lm._utc_stamp(started), lm._utc_stamp(t), level, correct_total,
+                                        args.words, rng.choice(("per_word", "after_test"))))
+                for row in answers:
+                    loader.add("words", row)
+                for row in disputes:
+                    loader.add("disputes", row)
+        print(f"  group {g + 1}/{args.groups}: {loader.counts['words'] + len(loader.rows['words'])} answers "
+              f"({time.perf_counter() - t0:.0f} s)")
+    loader.flush(commit=True)
+    conn.executemany(
+        "INSERT INTO lm_audio_blobs (audio_path, sha256, refcount) VALUES (?,?,?) "
+        "ON CONFLICT(audio_path) DO UPDATE SET refcount=refcount+excluded.refcount",
+        [(p, Path(p).stem, n) for p, n in audio_refs.items() if n],
+    )
+    conn.commit()
+    return {"groups": args.groups, "students": args.groups * args.students, **loader.counts}
+
+
+def main():
+    args = parse_args()
+    lm.DB_PATH = Path(args.db).resolve()
+    lm.DB_DIR = lm.DB_PATH.parent
+    lm.UPLOAD_DIR = lm.DB_DIR / "uploads"
+    lm.init_db()
+    conn = lm.get_db()
+    try:
+        if not args.append and conn.execute("SELECT 1 FROM lm_sessions LIMIT 1").fetchone():
+            raise SystemExit(f"{lm.DB_PATH} already has sessions; use --append to add to it")
+        # bulk load: no fsync per commit, indexes rebuilt once at the end
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("PRAGMA journal_mode=MEMORY")
+        indexes = [r["sql"] for r in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name='lm_session_words' AND sql IS NOT NULL"
+        )]
+        for sql in indexes:
+            name = sql.split(" ON ")[0].split()[-1]
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        t0 = time.perf_counter()
+        try:
+            stats = generate(conn, args)
+        finally:
+            print("Recreating indexes ...")
+            for sql in indexes:
+                conn.execute(sql)
+            conn.commit()
+        print(f"Inserted {stats['words']} answers, {stats['sessions']} sessions, {stats['disputes']} disputes "
+              f"for {stats['students']} students in {time.perf_counter() - t0:.0f} s")
+
+        # planner statistics for the rebuild queries below (sampled; a full ANALYZE takes minutes here)
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("ANALYZE")
+        if not args.no_derived:
+            print("Rebuilding counters, progress rollups and mastery ...")
+            lm.rebuild_category_counters(conn)
+            lm.rebuild_progress_rollups(conn)
+            uids = [r["id"] for r in conn.execute("SELECT DISTINCT user_id AS id FROM lm_sessions")]
+            for uid in uids:
+                conn.execute("DELETE FROM lm_mastery WHERE user_id=?", (uid,))
+                conn.executemany(
+                    "INSERT INTO lm_mastery (user_id, level, mastery_1_10) VALUES (?,?,?)",
+                    [(uid, lvl, m) for lvl, m in sorted(lm.replay_user_mastery(conn, uid).items())],
+                )
+            conn.commit()
+        print(f"Done in {time.perf_counter() - t0:.0f} s: {lm.DB_PATH}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
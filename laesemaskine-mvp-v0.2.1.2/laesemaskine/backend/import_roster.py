@@ -0,0 +1,59 @@
+"""Import a class roster (many student accounts at once).
+
+Usage:
+  python import_roster.py --file klasse.csv
+  python import_roster.py --file klasse.json --workers 8
+
+CSV needs a header line with: username, password and optionally display_name
+and group (group name, created if missing) or group_id. JSON may be a list of
+such objects or {"users": [...]}. Same rules as
+POST /laesemaskine/api/admin/users/import; rows with errors are reported and
+skipped, all other rows are created in one transaction.
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--file", required=True, help="Roster file (.csv or .json)")
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--workers", type=int, default=None, help="Password hashing processes (default: CPU count)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    if args.workers:
+        lm.HASH_WORKERS = args.workers
+    path = Path(args.file)
+    raw = path.read_text(encoding="utf-8")
+    if path.suffix.lower() == ".json":
+        rows = lm.parse_roster(json.loads(raw), None)
+    else:
+        rows = lm.parse_roster(None, raw)
+
+    lm.init_db()
+    conn = lm.get_db()
+    try:
+        result = lm.import_roster(conn, rows)
+    finally:
+        conn.close()
+    for g in result["created_groups"]:
+        print(f"created group {g['id']}: {g['name']}")
+    for e in result["errors"]:
+        print(f"row {e['row']} ({e['username'] or '-'}): {e['error']}", file=sys.stderr)
+    print(f"Created {result['created']} student(s); {len(result['errors'])} row(s) skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Rebuild per-student derived tables (lm_category_counters, lm_progress_rollup)
+from raw history.
+
+Usage:
+  python rebuild_counters.py            # all students
+  python rebuild_counters.py --user 42  # one student
+  python rebuild_counters.py --resync-words  # after words.json categories changed
+
+Both are normally kept current by session_finish; run this after changing
+words.json categories or the scoring model, or to check that the counters
+match lm_session_words.
+"""
+
+from __future__ import annotations
+import argparse
+from pathlib import Path
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--user", type=int, default=None, help="Only rebuild this user id")
+    p.add_argument("--resync-words", action="store_true",
+                   help="Re-copy word categories from words.json onto lm_session_words first")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    lm.init_db()
+    conn = lm.get_db()
+    try:
+        if args.resync_words:
+            n = lm.backfill_session_word_meta(conn, only_missing=False)
+            print(f"Resynced word categories on {n} answer row(s)")
+        stats = lm.rebuild_category_counters(conn, args.user)
+        n_sessions = lm.rebuild_progress_rollups(conn, args.user)
+    finally:
+        conn.close()
+    print(f"Rebuilt counters for {stats['users']} user(s); {stats['changed']} counter row(s) differed")
+    print(f"Rebuilt progress rollups from {n_sessions} session(s)")
+
+
+if __name__ == "__main__":
+    main()
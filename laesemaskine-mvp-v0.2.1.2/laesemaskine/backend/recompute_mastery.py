@@ -0,0 +1,136 @@
+"""Recompute lm_mastery for every student by replaying all finished sessions.
+
+Usage:
+  python recompute_mastery.py --dry-run       # show what would change (opens the DB read-only)
+  python recompute_mastery.py --workers 8     # recompute and write
+
+lm_mastery is normally updated incrementally at session finish and depends on
+the order sessions arrive in. After changing the mastery model in app.py
+(apply_session_mastery), run this to bring every student up to date without
+waiting for new tests.
+
+Students are split across a process pool; each worker aggregates its students'
+answers per session and level with one GROUP BY query and replays them in
+ended_at order. Results are written back in a single transaction.
+"""
+
+from __future__ import annotations
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--db", default=None, help="SQLite DB path (default: backend/db/laesemaskine.db)")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    p.add_argument("--batch", type=int, default=200, help="Students per worker task")
+    p.add_argument("--dry-run", action="store_true", help="Only print the differences")
+    return p.parse_args()
+
+
+READ_ONLY = False  # --dry-run: never write, not even migrations
+
+
+def open_db():
+    if not READ_ONLY:
+        return lm.get_db()
+    conn = sqlite3.connect(f"{lm.DB_PATH.as_uri()}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _init_worker(db_path: str, read_only: bool) -> None:
+    global READ_ONLY
+    lm.DB_PATH = Path(db_path)
+    READ_ONLY = read_only
+
+
+def _replay_batch(uids: List[int]) -> List[Tuple[int, Dict[int, int]]]:
+    conn = open_db()
+    try:
+        return [(uid, lm.replay_user_mastery(conn, uid)) for uid in uids]
+    finally:
+        conn.close()
+
+
+def diff_mastery(conn, results: List[Tuple[int, Dict[int, int]]]) -> List[Tuple[int, int, object, object]]:
+    """(user_id, level, old, new) for every level whose value changes; None = missing."""
+    changes = []
+    for uid, new in results:
+        old = {
+            int(r["level"]): int(r["mastery_1_10"])
+            for r in conn.execute("SELECT level, mastery_1_10 FROM lm_mastery WHERE user_id=?", (uid,))
+        }
+        for lvl in sorted(set(old) | set(new)):
+            if old.get(lvl) != new.get(lvl):
+                changes.append((uid, lvl, old.get(lvl), new.get(lvl)))
+    return changes
+
+
+def write_mastery(conn, results: List[Tuple[int, Dict[int, int]]]) -> None:
+    try:
+        conn.executemany(
+            "DELETE FROM lm_mastery WHERE user_id=?", [(uid,) for uid, _ in results]
+        )
+        conn.executemany(
+            "INSERT INTO lm_mastery (user_id, level, mastery_1_10) VALUES (?,?,?)",
+            [(uid, lvl, m) for uid, mastery in results for lvl, m in sorted(mastery.items())],
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    global READ_ONLY
+    args = parse_args()
+    if args.db:
+        lm.DB_PATH = Path(args.db).resolve()
+        lm.DB_DIR = lm.DB_PATH.parent
+    READ_ONLY = args.dry_run
+    if not READ_ONLY:
+        lm.init_db()
+
+    try:
+        conn = open_db()
+        conn.execute("SELECT level, mastery_1_10 FROM lm_mastery LIMIT 0")
+        conn.execute("SELECT user_id, ended_at FROM lm_sessions LIMIT 0")
+    except sqlite3.Error as e:
+        raise SystemExit(f"{lm.DB_PATH}: {e} (schema missing or out of date: run once without --dry-run "
+                         "or start app.py to migrate)")
+    try:
+        uids = [int(r["id"]) for r in conn.execute(
+            "SELECT DISTINCT user_id AS id FROM lm_sessions WHERE ended_at IS NOT NULL "
+            "UNION SELECT DISTINCT user_id FROM lm_mastery ORDER BY id"
+        )]
+        batches = [uids[i:i + args.batch] for i in range(0, len(uids), max(1, args.batch))]
+        results: List[Tuple[int, Dict[int, int]]] = []
+        if args.workers > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                     initargs=(str(lm.DB_PATH), READ_ONLY)) as pool:
+                for part in pool.map(_replay_batch, batches):
+                    results.extend(part)
+        else:
+            for b in batches:
+                results.extend(_replay_batch(b))
+
+        changes = diff_mastery(conn, results)
+        for uid, lvl, old, new in changes:
+            print(f"user {uid} level {lvl}: {old if old is not None else '-'} -> {new if new is not None else '-'}")
+        print(f"{len(uids)} student(s), {len(changes)} mastery value(s) differ")
+        if not args.dry_run and changes:
+            write_mastery(conn, results)
+            print("Written.")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
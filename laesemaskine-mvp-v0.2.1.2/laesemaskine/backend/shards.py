@@ -0,0 +1,210 @@
+"""Manage tenant shards in multi-tenant mode (LM_SHARD_DIR).
+
+Usage:
+  python shards.py --dir /srv/lm list                      # tenants, users, groups, shard size
+  python shards.py --dir /srv/lm add "Skolen ved Søen" --admin leder   # new tenant + shard + first admin
+  python shards.py --dir /srv/lm adopt "Gammel skole" db/laesemaskine.db   # existing single DB as tenant 0
+  python shards.py --dir /srv/lm migrate --workers 8       # create catalog, migrate every shard
+  python shards.py --dir /srv/lm sync-catalog              # rebuild usernames/groups from the shards
+  python shards.py --dir /srv/lm run --jobs 4 -- rebuild_counters.py --resync-words
+
+`run` starts the given maintenance script once per shard, in parallel, with
+`--db <shard>` appended; every output line is prefixed with the shard name.
+--dir defaults to $LM_SHARD_DIR.
+"""
+
+from __future__ import annotations
+import argparse
+import getpass
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import app as lm
+
+
+def parse_args():
+    p = argparse.ArgumentParser()
+    p.add_argument("--dir", default=os.environ.get("LM_SHARD_DIR"), help="Shard directory (default: $LM_SHARD_DIR)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="List tenants")
+    a = sub.add_parser("add", help="Create a tenant and its shard")
+    a.add_argument("name")
+    a.add_argument("--admin", default=None, help="Username of the school's first admin")
+    a.add_argument("--password", default=None, help="Its password (default: prompt)")
+    a = sub.add_parser("adopt", help="Copy an existing single-tenant DB in as tenant 0")
+    a.add_argument("name")
+    a.add_argument("db", help="Existing laesemaskine.db")
+    a.add_argument("--uploads", default=None, help="Its uploads directory (default: backend/uploads)")
+    a = sub.add_parser("migrate", help="Create the catalog and migrate all shards")
+    a.add_argument("--workers", type=int, default=None, help="Shards migrated at the same time")
+    a = sub.add_parser("sync-catalog", help="Rebuild catalog users/groups from the shards")
+    a.add_argument("--workers", type=int, default=None, help="Shards read at the same time")
+    a = sub.add_parser("run", help="Run a maintenance script against every shard")
+    a.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Scripts running at the same time")
+    a.add_argument("script", nargs=argparse.REMAINDER, help="-- script.py [args...]")
+    return p.parse_args()
+
+
+def cmd_list() -> None:
+    conn = lm.catalog_db()
+    try:
+        users = {int(r["tenant_id"]): int(r["n"]) for r in conn.execute(
+            "SELECT tenant_id, COUNT(*) AS n FROM lm_catalog_users GROUP BY tenant_id")}
+        groups = {int(r["tenant_id"]): int(r["n"]) for r in conn.execute(
+            "SELECT tenant_id, COUNT(*) AS n FROM lm_catalog_groups GROUP BY tenant_id")}
+    finally:
+        conn.close()
+    print(f"{'id':>4} {'shard':32} {'users':>7} {'groups':>7} {'MB':>8}  name")
+    for t in lm.all_tenants():
+        path = lm.shard_db_path(t["shard"])
+        mb = path.stat().st_size / 1e6 if path.exists() else 0.0
+        print(f"{t['id']:>4} {t['shard']:32} {users.get(t['id'], 0):>7} {groups.get(t['id'], 0):>7} {mb:>8.1f}  {t['name']}")
+
+
+def cmd_adopt(name: str, db: str, uploads: str) -> None:
+    if lm.tenant_by_id(0) is not None:
+        sys.exit("Tenant 0 already exists")
+    shard = lm.shard_name(0, name)
+    conn = lm.catalog_db()
+    try:
+        conn.execute("INSERT INTO lm_tenants (id, name, shard) VALUES (0,?,?)", (name, shard))
+        conn.commit()
+    finally:
+        conn.close()
+    dest = lm.shard_db_path(shard)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    src = sqlite3.connect(db)
+    out = sqlite3.connect(dest)
+    try:
+        src.backup(out)  # consistent copy even while the old app is still running
+    finally:
+        out.close()
+        src.close()
+    if Path(uploads).is_dir():
+        shutil.copytree(uploads, dest.parent / "uploads", dirs_exist_ok=True)
+    lm.init_db(dest)
+    sync_catalog()
+    print(f"Adopted {db} as tenant 0 ({shard})")
+
+
+def _shard_entries(t: Dict[str, Any]) -> Tuple[int, List[Tuple[int, str]], List[int]]:
+    conn = sqlite3.connect(lm.shard_db_path(t["shard"]))
+    try:
+        users = [(int(r[0]), r[1]) for r in conn.execute("SELECT id, username FROM lm_users")]
+        groups = [int(r[0]) for r in conn.execute("SELECT id FROM lm_groups")]
+    finally:
+        conn.close()
+    return t["id"], users, groups
+
+
+def sync_catalog(workers: int = None) -> None:
+    tenants = lm.all_tenants()
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(tenants) or 1)) as pool:
+        parts = list(pool.map(_shard_entries, tenants))
+    conn = lm.catalog_db()
+    try:
+        conn.execute("DELETE FROM lm_catalog_users")
+        conn.execute("DELETE FROM lm_catalog_groups")
+        clashes = 0
+        for tid, users, groups in parts:
+            for uid, username in users:
+                if uid // lm.SHARD_ID_SPAN != tid:
+                    print(f"warning: user {uid} ({username}) in shard of tenant {tid} is outside its id range")
+                try:
+                    conn.execute("INSERT INTO lm_catalog_users (user_id, username, tenant_id) VALUES (?,?,?)",
+                                 (uid, username, tid))
+                except sqlite3.IntegrityError:
+                    clashes += 1
+                    print(f"warning: username {username!r} (tenant {tid}) is already used by another tenant")
+            conn.executemany("INSERT OR IGNORE INTO lm_catalog_groups (group_id, tenant_id) VALUES (?,?)",
+                             [(gid, tid) for gid in groups])
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Catalog: {sum(len(u) for _, u, _ in parts) - clashes} user(s), "
+          f"{sum(len(gr) for _, _, gr in parts)} group(s) in {len(parts)} shard(s)")
+
+
+def _run_one(t: Dict[str, Any], script: List[str]) -> int:
+    cmd = [sys.executable] + script + ["--db", str(lm.shard_db_path(t["shard"]))]
+    env = {**os.environ, "LM_SHARD_DIR": str(lm.SHARD_DIR)}
+    proc = subprocess.run(cmd, cwd=lm.BASE_DIR, env=env, capture_output=True, text=True)
+    for line in (proc.stdout + proc.stderr).splitlines():
+        print(f"[{t['shard']}] {line}", flush=True)
+    return proc.returncode
+
+
+def cmd_run(script: List[str], jobs: int) -> None:
+    if script and script[0] == "--":
+        script = script[1:]
+    if not script:
+        sys.exit("Nothing to run (usage: shards.py run -- script.py [args])")
+    tenants = lm.all_tenants()
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        codes = list(pool.map(lambda t: _run_one(t, script), tenants))
+    failed = [t["shard"] for t, c in zip(tenants, codes) if c != 0]
+    print(f"{len(tenants) - len(failed)}/{len(tenants)} shard(s) OK" + (f"; failed: {', '.join(failed)}" if failed else ""))
+    if failed:
+        sys.exit(1)
+
+
+def cmd_add(name: str, admin: Optional[str], password: Optional[str]) -> None:
+    """Create a tenant; with `admin`, also its first admin user (both or neither)."""
+    if admin and lm.catalog_taken([admin]):
+        sys.exit(f"Username {admin!r} is taken")
+    if admin and not password:
+        password = getpass.getpass(f"Password for {admin}: ")
+        if not password:
+            sys.exit("Empty password")
+    try:
+        t = lm.create_tenant(name)
+    except sqlite3.IntegrityError:
+        sys.exit(f"Tenant {name!r} exists")
+    print(f"Created tenant {t['id']} ({t['shard']})")
+    if not admin:
+        return
+    conn = sqlite3.connect(lm.shard_db_path(t["shard"]))
+    try:
+        uid = conn.execute(
+            "INSERT INTO lm_users (username, password_hash, role) VALUES (?,?,'admin')",
+            (admin, lm.generate_password_hash(password)),
+        ).lastrowid
+        lm.catalog_add(users=[(uid, admin)])
+        conn.commit()
+    except sqlite3.Error:
+        conn.close()
+        lm.drop_tenant(t["id"])
+        raise
+    finally:
+        conn.close()
+    print(f"Created admin {admin} ({uid})")
+
+
+def main():
+    args = parse_args()
+    if not args.dir:
+        sys.exit("Set --dir or LM_SHARD_DIR")
+    lm.SHARD_DIR = Path(args.dir).resolve()
+    n = lm.init_shards(getattr(args, "workers", None))  # catalog + migrations before anything else
+    if args.cmd == "list":
+        cmd_list()
+    elif args.cmd == "add":
+        cmd_add(args.name, args.admin, args.password)
+    elif args.cmd == "adopt":
+        cmd_adopt(args.name, args.db, args.uploads or str(lm.UPLOAD_DIR))
+    elif args.cmd == "migrate":
+        print(f"Migrated {n} shard(s)")
+    elif args.cmd == "sync-catalog":
+        sync_catalog(args.workers)
+    elif args.cmd == "run":
+        cmd_run(args.script, args.jobs)
+
+
+if __name__ == "__main__":
+    main()
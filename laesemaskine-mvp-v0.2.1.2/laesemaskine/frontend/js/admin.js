@@ -109,8 +109,14 @@ document.addEventListener("DOMContentLoaded", async () => {
               if (bodyEl) bodyEl.textContent = "Indlæser…";
 
               try {
-                const data = await api(`/admin/student/${uid}/drilldown?group=${encodeURIComponent(group)}&key=${encodeURIComponent(key)}`);
-                const items = data.items || [];
+                // fetch all pages (cursor = oldest session_word_id seen)
+                let items = [];
+                let cursor = null;
+                do {
+                  const data = await api(`/admin/student/${uid}/drilldown?group=${encodeURIComponent(group)}&key=${encodeURIComponent(key)}&limit=500` + (cursor ? `&before=${cursor}` : ""));
+                  items = items.concat(data.items || []);
+                  cursor = data.next_cursor;
+                } while (cursor && items.length < 5000);
                 if (!items.length) {
                   if (bodyEl) bodyEl.textContent = "Ingen ord fundet for denne kategori.";
                   return;
@@ -28,7 +28,8 @@ document.addEventListener("DOMContentLoaded", () => {
         body: JSON.stringify({
           username: qs("#regUser").value,
           password: qs("#regPass").value,
-          role: qs("#regRole").value
+          role: qs("#regRole").value,
+          tenant: qs("#regTenant") ? qs("#regTenant").value : undefined
         })
       });
       showToast(regToast, "Oprettet ✔", "good");
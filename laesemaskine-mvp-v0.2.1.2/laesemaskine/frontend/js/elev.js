@@ -34,15 +34,35 @@ document.addEventListener("DOMContentLoaded", async () => {
     try {
       const feedback_mode = qs("#feedbackMode").value;
       const startLevel = parseInt(qs("#startLevel").value || "1", 10);
+      // words come from the cached lexicon shards; the server only adds due review words
+      let local = false;
+      try {
+        await lexiconSync(me.lexicon);
+        const band = lexiconBand(startLevel);
+        await lexiconEnsure([startLevel - band - 1, startLevel - band, startLevel, startLevel + band, startLevel + band + 1]);
+        local = true;
+      } catch (e) { /* no cache/storage: let the server pick the words */ }
+      // start_level: the server tracks the adaptive level (and returns 20 words when not local)
       const s = await api("/sessions/start", {
         method: "POST",
-        body: JSON.stringify({ feedback_mode })
+        body: JSON.stringify(local
+          ? { feedback_mode, start_level: startLevel, reviews: 5 }
+          : { feedback_mode, start_level: startLevel, count: 20 })
       });
+      let words = s.words || null;
+      if (local) {
+        const reviews = (s.reviews || []).slice(0, 20);
+        const level = s.level || startLevel;
+        const picked = await lexiconPick(level, 20 - reviews.length, lexiconBand(level), new Set(reviews.map(w => w.id)));
+        words = shuffleInPlace(reviews.concat(picked));
+      }
       // Save session context for training page
       const ctx = {
         session_id: s.session_id,
         feedback_mode,
-        startLevel,
+        startLevel: s.level || startLevel,
+        words,
+        local,
       };
       sessionStorage.setItem("lm_session_ctx", JSON.stringify(ctx));
       window.location.href = "/laesemaskine/traening.html";
@@ -0,0 +1,77 @@
+// Local word selection from cached lexicon shards
+// - /api/lexicon/manifest lists one shard per niveau (content hash in the URL)
+// - shards are kept in localStorage and only refetched when their hash changes
+// - /me returns the manifest digest, so a warm cache needs no request at all
+// Picking mirrors pick_words() in backend/app.py; the server still checks answers.
+
+const LM_LEXICON_KEY = "lm_lexicon";
+
+function lexiconLoad() {
+  try { return JSON.parse(localStorage.getItem(LM_LEXICON_KEY) || "null"); } catch (e) { return null; }
+}
+
+function lexiconSave(lex) {
+  try { localStorage.setItem(LM_LEXICON_KEY, JSON.stringify(lex)); } catch (e) { /* quota: keep in memory only */ }
+}
+
+let lmLexicon = lexiconLoad();
+
+async function lexiconSync(info) {
+  // info = me.lexicon ({version, digest}); fetch the manifest only when it changed
+  if (lmLexicon && info && lmLexicon.digest === info.digest) return lmLexicon;
+  const m = await api("/lexicon/manifest");
+  const old = (lmLexicon && lmLexicon.shards) || {};
+  const shards = {};
+  Object.keys(m.levels).forEach(lvl => {
+    if (old[lvl] && old[lvl].hash === m.levels[lvl].hash) shards[lvl] = old[lvl];
+  });
+  lmLexicon = { version: m.version, digest: m.digest, levels: m.levels, shards };
+  lexiconSave(lmLexicon);
+  return lmLexicon;
+}
+
+async function lexiconEnsure(levels) {
+  if (!lmLexicon) throw new Error("lexicon_not_loaded");
+  const missing = levels.map(String).filter(lvl => lmLexicon.levels[lvl] && !lmLexicon.shards[lvl]);
+  if (!missing.length) return;
+  const got = await Promise.all(missing.map(async lvl => {
+    const res = await fetch(lmLexicon.levels[lvl].url, { credentials: "include" });
+    if (!res.ok) {
+      lmLexicon.digest = null; // words.json changed under us: resync on next start
+      lexiconSave(lmLexicon);
+      throw new Error("lexicon_shard_" + res.status);
+    }
+    return [lvl, await res.json()];
+  }));
+  got.forEach(([lvl, shard]) => { lmLexicon.shards[lvl] = { hash: lmLexicon.levels[lvl].hash, words: shard.words }; });
+  lexiconSave(lmLexicon);
+}
+
+function shuffleInPlace(arr) {
+  for (let i = arr.length - 1; i > 0; i--) {
+    const j = Math.floor(Math.random() * (i + 1));
+    [arr[i], arr[j]] = [arr[j], arr[i]];
+  }
+  return arr;
+}
+
+function lexiconBand(level) {
+  // band = +/-1 for variety after level 2 (start_band in app.py)
+  return level <= 2 ? 0 : 1;
+}
+
+async function lexiconPick(level, count, band = 0, exclude = new Set()) {
+  // Random words at level (+/- band); too few -> any level, like the server
+  const levels = [];
+  for (let l = level - Math.max(0, band); l <= level + Math.max(0, band); l++) levels.push(l);
+  await lexiconEnsure(levels);
+  const fromLevels = lvls => lvls.flatMap(l => ((lmLexicon.shards[String(l)] || {}).words || []))
+    .filter(w => !exclude.has(w.id));
+  let pool = fromLevels(levels);
+  if (pool.length < count) {
+    const all = Object.keys(lmLexicon.levels);
+    await lexiconEnsure(all);
+    pool = fromLevels(all);
+  }
+  return shuffleInPlace(pool).slice(0, count);
+}
@@ -315,7 +315,7 @@ async function nextWord() {
   // Load initial word set
   showToast(toast, "Henter ord…");
   try {
-    words = await loadWordsForLevel(level);
+    words = (ctx.words && ctx.words.length >= 20) ? ctx.words.slice() : await loadWordsForLevel(level);
     if (words.length < 20) throw new Error("For få ord i ordlisten.");
     showToast(toast, "Klar ✅", "good");
     // Start session recording v2 (one continuous recording)
@@ -337,6 +337,7 @@ async function nextWord() {
 
   async function submitAnswer(w, recognized, ms, skipped=false, timing=null) {
     const startedLevel = adaptive.level;
+    let nextWords = null; // refill sent by the server when the level changed
     try {
       const r = await api(`/sessions/${ctx.session_id}/answer`, {
         method: "POST",
@@ -346,7 +347,8 @@ async function nextWord() {
           recognized: recognized,
           response_time_ms: ms,
           start_ms: (timing && typeof timing.start_ms==="number") ? Math.round(timing.start_ms) : Math.round(currentWordStartMs || 0),
-          end_ms: (timing && typeof timing.end_ms==="number") ? Math.round(timing.end_ms) : Math.round(sessionStartPerf ? (performance.now() - sessionStartPerf) : 0)
+          end_ms: (timing && typeof timing.end_ms==="number") ? Math.round(timing.end_ms) : Math.round(sessionStartPerf ? (performance.now() - sessionStartPerf) : 0),
+          remaining: ctx.local ? 0 : Math.max(0, 20 - (idx + 1))
         })
       });
       if (r.correct) correctTotal++;
@@ -361,7 +363,13 @@ async function nextWord() {
         st.speedSum += speedNorm; st.speedCount += 1;
       }
 
-      adaptive.record(r.correct);
+      if (typeof r.level === "number") {
+        // server-side adaptive level is authoritative
+        adaptive.level = r.level;
+        nextWords = r.next_words || null;
+      } else {
+        adaptive.record(r.correct);
+      }
       if (feedbackMode === "per_word") {
         if (r.correct) {
           showToast(toast, "Yes! ✔", "good");
@@ -401,18 +409,36 @@ async function nextWord() {
 
     // If level shifted a lot, refresh pool for new level but keep remaining count
     if (adaptive.level !== startedLevel && idx < 20) {
-      try {
-        const remaining = 20 - idx;
-        const fresh = await api(`/words?level=${adaptive.level}&count=${remaining}&band=1`);
-        // replace remaining segment
-        words.splice(idx, remaining, ...fresh.words.slice(0, remaining));
-      } catch (e) {
-        // ignore
+      const remaining = 20 - idx;
+      if (nextWords && nextWords.length) {
+        words.splice(idx, remaining, ...nextWords.slice(0, remaining));
+      } else if (ctx.local && await refillLocal(remaining)) {
+        // picked from the cached lexicon
+      } else {
+        try {
+          const fresh = await api(`/words?level=${adaptive.level}&count=${remaining}&band=1`);
+          // replace remaining segment
+          words.splice(idx, remaining, ...fresh.words.slice(0, remaining));
+        } catch (e) {
+          // ignore
+        }
       }
     }
     await nextWord();
   }
 
+  async function refillLocal(remaining) {
+    try {
+      const seen = new Set(words.slice(0, idx).map(w => w.id));
+      const fresh = await lexiconPick(adaptive.level, remaining, 1, seen);
+      if (fresh.length < remaining) return false;
+      words.splice(idx, remaining, ...fresh);
+      return true;
+    } catch (e) {
+      return false;
+    }
+  }
+
   function normalizeDanish(s) {
     // Compatibility: avoid Unicode property escapes (\p{..}) and replaceAll
     s = (s || "").toLowerCase().trim();